@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Packed, memory-mapped frame store.
+
+A store directory holds shard files (shard_%05d.bin) that contain the frames
+of one or more videos back to back, one offset table per shard
+(shard_%05d.idx.npy, int64, entries + 1) and an index.json that maps every
+video to its shard and to the first entry of each of its frame streams
+(img, flow_x, flow_y, ...). Frames of one stream are stored in frame-index
+order, so any frame range is a single contiguous byte range of the shard
+and is read with one slice of the memory map.
+
+Two encodings are supported:
+    jpeg: the original encoded bytes, decoded with cv2.imdecode
+    raw:  the decoded uint8 pixels, no decoding at read time
+
+Both give exactly the arrays cv2.imread returns on the original files.
+Stores are written with datasets/pack_frames.py.
+"""
+
+import os
+import re
+import json
+import numpy as np
+import cv2
+
+
+INDEX_NAME = 'index.json'
+SHARD_PATTERN = 'shard_%05d.bin'
+OFFSET_PATTERN = 'shard_%05d.idx.npy'
+
+_frame_name_re = re.compile(r'^(.*?)_?(\d+)(\.[A-Za-z0-9]+)?$')
+
+
+def split_frame_name(frame_name):
+    """Returns (stream, frame index) of a frame file name, e.g.
+    'img_00001.jpg' -> ('img', 1) and 'flow_x_00012' -> ('flow_x', 12).
+    Returns None for names that are not frame files.
+    """
+    match = _frame_name_re.match(frame_name)
+    if match is None or match.group(1) == '':
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def stream_of_pattern(name_pattern, *args):
+    """Stream name of a dataset name pattern such as 'img_%05d.jpg' or
+    'flow_%s_%05d.jpg' with args ('x',).
+    """
+    return split_frame_name(name_pattern % (args + (1,)))[0]
+
+
+def sampled_frame_indices(offsets, new_length, duration, temporal_stride=1):
+    """Frame indices (1-based) read by the ReadSegment* functions for the
+    given segment offsets, in the same order and with the same wrap-around.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 1)
+    indices = (offsets + np.arange(1, new_length + 1, temporal_stride)).reshape(-1) % (duration + 1)
+    indices[indices == 0] = duration + 1
+    return indices
+
+
+class ClipStore(object):
+    """Read-only access to a packed frame store.
+
+    Memory maps are opened lazily, so a store can be created in the main
+    process and handed to DataLoader workers; each worker opens its own maps.
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        index_path = os.path.join(store_path, INDEX_NAME)
+        if not os.path.exists(index_path):
+            raise RuntimeError("No packed frame store found at %s" % (store_path))
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+        self.encoding = index['encoding']
+        self.videos = index['videos']
+        self.num_shards = index['num_shards']
+        self._shards = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def __contains__(self, key):
+        return key in self.videos
+
+    def _shard(self, shard_id):
+        if shard_id not in self._shards:
+            data = np.memmap(os.path.join(self.store_path, SHARD_PATTERN % shard_id),
+                             dtype=np.uint8, mode='r')
+            offsets = np.load(os.path.join(self.store_path, OFFSET_PATTERN % shard_id))
+            self._shards[shard_id] = (data, offsets)
+        return self._shards[shard_id]
+
+    def frame_count(self, key, stream):
+        return self.videos[key]['streams'][stream]['count']
+
+    def read(self, key, stream, frame_indices, flag=cv2.IMREAD_COLOR):
+        """Returns the frames with the given indices of one stream of a video
+        as a list of arrays, identical to cv2.imread(frame_path, flag).
+        """
+        if key not in self.videos:
+            raise KeyError("Video %s is not in the packed store %s" % (key, self.store_path))
+        video = self.videos[key]
+        if stream not in video['streams']:
+            raise KeyError("Video %s has no %s frames in the packed store" % (key, stream))
+        info = video['streams'][stream]
+        data, offsets = self._shard(video['shard'])
+
+        frame_indices = np.asarray(frame_indices, dtype=np.int64)
+        if len(frame_indices) == 0:
+            return []
+        positions = frame_indices - info['first']
+        if positions.min() < 0 or positions.max() >= info['count']:
+            raise IndexError("Frame index out of range for %s/%s" % (key, stream))
+        entries = positions + info['entry']
+
+        if self.encoding == 'raw':
+            shape = tuple(info['shape'])
+            if (flag == cv2.IMREAD_GRAYSCALE) != (len(shape) == 2):
+                raise ValueError("Stream %s of %s was packed with shape %s, "
+                                 "which does not match the requested read flag"
+                                 % (stream, key, shape))
+
+        # Split the requested entries into runs of consecutive entries, each
+        # run is read with a single slice of the memory map.
+        breaks = np.nonzero(np.diff(entries) != 1)[0] + 1
+        frames = []
+        for run in np.split(entries, breaks):
+            start = offsets[run[0]]
+            block = data[start:offsets[run[-1] + 1]]
+            if self.encoding == 'raw':
+                frames.extend(np.asarray(block).reshape((len(run),) + shape))
+            else:
+                for entry in run:
+                    encoded = block[offsets[entry] - start:offsets[entry + 1] - start]
+                    frames.append(cv2.imdecode(np.asarray(encoded), flag))
+        return frames
+
+
+def ReadSegmentRGBPacked(store, key, offsets, new_height, new_width, new_length, is_color, name_pattern, duration, temporal_stride=1):
+    if is_color:
+        cv_read_flag = cv2.IMREAD_COLOR         # > 0
+    else:
+        cv_read_flag = cv2.IMREAD_GRAYSCALE     # = 0
+    interpolation = cv2.INTER_LINEAR
+
+    frame_indices = sampled_frame_indices(offsets, new_length, duration, temporal_stride)
+    frames = store.read(key, stream_of_pattern(name_pattern), frame_indices, cv_read_flag)
+    sampled_list = []
+    for cv_img_origin in frames:
+        if new_width > 0 and new_height > 0:
+            cv_img = cv2.resize(cv_img_origin, (new_width, new_height), interpolation)
+        else:
+            cv_img = cv_img_origin
+        cv_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
+        sampled_list.append(cv_img)
+    clip_input = np.concatenate(sampled_list, axis=2)
+    return clip_input
+
+
+def ReadSegmentFlowPacked(store, key, offsets, new_height, new_width, new_length, is_color, name_pattern, duration, temporal_stride=1):
+    if is_color:
+        cv_read_flag = cv2.IMREAD_COLOR         # > 0
+    else:
+        cv_read_flag = cv2.IMREAD_GRAYSCALE     # = 0
+    interpolation = cv2.INTER_LINEAR
+
+    frame_indices = sampled_frame_indices(offsets, new_length, duration, temporal_stride)
+    frames_x = store.read(key, stream_of_pattern(name_pattern, "x"), frame_indices, cv_read_flag)
+    frames_y = store.read(key, stream_of_pattern(name_pattern, "y"), frame_indices, cv_read_flag)
+    sampled_list = []
+    for cv_img_origin_x, cv_img_origin_y in zip(frames_x, frames_y):
+        if new_width > 0 and new_height > 0:
+            cv_img_x = cv2.resize(cv_img_origin_x, (new_width, new_height), interpolation)
+            cv_img_y = cv2.resize(cv_img_origin_y, (new_width, new_height), interpolation)
+        else:
+            cv_img_x = cv_img_origin_x
+            cv_img_y = cv_img_origin_y
+        sampled_list.append(np.expand_dims(cv_img_x, 2))
+        sampled_list.append(np.expand_dims(cv_img_y, 2))
+    clip_input = np.concatenate(sampled_list, axis=2)
+    return clip_input
+
+
+def ReadSegmentBothPacked(store, key, offsets, new_height, new_width, new_length, name_pattern_rgb, name_pattern_flow, duration, temporal_stride=1):
+    interpolation = cv2.INTER_LINEAR
+
+    frame_indices = sampled_frame_indices(offsets, new_length, duration, temporal_stride)
+    frames_x = store.read(key, stream_of_pattern(name_pattern_flow, "x"), frame_indices, cv2.IMREAD_GRAYSCALE)
+    frames_y = store.read(key, stream_of_pattern(name_pattern_flow, "y"), frame_indices, cv2.IMREAD_GRAYSCALE)
+    frames = store.read(key, stream_of_pattern(name_pattern_rgb), frame_indices, cv2.IMREAD_COLOR)
+    sampled_list = []
+    for cv_img_origin, cv_img_origin_x, cv_img_origin_y in zip(frames, frames_x, frames_y):
+        if new_width > 0 and new_height > 0:
+            cv_img_x = cv2.resize(cv_img_origin_x, (new_width, new_height), interpolation)
+            cv_img_y = cv2.resize(cv_img_origin_y, (new_width, new_height), interpolation)
+            cv_img = cv2.resize(cv_img_origin, (new_width, new_height), interpolation)
+        else:
+            cv_img_x = cv_img_origin_x
+            cv_img_y = cv_img_origin_y
+            cv_img = cv_img_origin
+        cv_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
+        sampled_list.append(cv_img)
+        sampled_list.append(np.expand_dims(cv_img_x, 2))
+        sampled_list.append(np.expand_dims(cv_img_y, 2))
+    clip_input = np.concatenate(sampled_list, axis=2)
+    return clip_input
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU optical flow extraction into a packed frame store.
+
+build_of.py runs the dense_flow GPU binary on one video after the other and
+writes an img, a flow_x and a flow_y JPEG file per frame. This script
+computes the flow with OpenCV instead (farneback, dis or tvl1) on a pool of
+worker processes, one video per task, and writes every video straight into
+its own shard of a packed frame store (see datasets/clip_store.py) that the
+datasets read with --storage packed.
+
+The frames are resized to --new_width x --new_height as with dense_flow. A
+video gives the streams img (frames 1..N, BGR) and flow_x, flow_y (frames
+1..N-1, the flow from frame i to frame i+1). The flow is clipped to
+[-bound, bound] and quantized to uint8 like dense_flow does,
+round((flow + bound) * 255 / (2 * bound)), so 128 is no motion.
+
+Every video is written to shard_%05d.bin and shard_%05d.idx.npy and then
+marked done with shard_%05d.json, each file through a rename. An
+interrupted run is resumed by running it again: the videos with a marker
+are skipped, the others are extracted again. index.json is written from the
+markers at the end of every run. The shard of a video is its position in the
+sorted video list, so a resumed run needs the same list of videos. A video
+that cannot be read or extracted is reported at the end and left without a
+marker, so the other videos still make it into index.json and the next run
+tries it again.
+
+Each worker runs OpenCV on one thread, so the frames/s per core printed at
+the end is the flow frames of the run over the time the workers spent on
+them.
+
+usage: python extract_flow.py --src_dir ./ucf101_videos --out_dir ./ucf101_packed --algorithm dis --num_worker 16
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+import cv2
+
+from clip_store import INDEX_NAME, SHARD_PATTERN, OFFSET_PATTERN
+
+MARKER_PATTERN = 'shard_%05d.json'
+ALGORITHMS = ['farneback', 'dis', 'tvl1']
+
+
+def create_flow(algorithm):
+    """Returns a function computing the flow (H x W x 2, float32) between two
+    grayscale frames.
+    """
+    if algorithm == 'farneback':
+        return lambda prev, current: cv2.calcOpticalFlowFarneback(prev, current, None,
+                                                                  0.5, 3, 15, 3, 5, 1.2, 0)
+    if algorithm == 'dis':
+        dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_MEDIUM)
+        return lambda prev, current: dis.calc(prev, current, None)
+    if algorithm == 'tvl1':
+        if hasattr(cv2, 'optflow'):
+            tvl1 = cv2.optflow.DualTVL1OpticalFlow_create()
+        elif hasattr(cv2, 'DualTVL1OpticalFlow_create'):
+            tvl1 = cv2.DualTVL1OpticalFlow_create()
+        else:
+            raise RuntimeError("The tvl1 flow needs the OpenCV contrib modules (pip install opencv-contrib-python)")
+        return lambda prev, current: tvl1.calc(prev, current, None)
+    raise ValueError("No such flow algorithm %s" % (algorithm))
+
+
+def quantize_flow(flow, bound):
+    """uint8 flow_x, flow_y images of a flow field, as written by dense_flow."""
+    scaled = (np.clip(flow, -bound, bound) + bound) * (255.0 / (2 * bound))
+    quantized = np.rint(scaled).astype(np.uint8)
+    return np.ascontiguousarray(quantized[..., 0]), np.ascontiguousarray(quantized[..., 1])
+
+
+def encode_image(image, encoding):
+    """Bytes of a frame in the store: its pixels for raw, its JPEG file for
+    jpeg.
+    """
+    if encoding == 'raw':
+        return image.tobytes()
+    ok, encoded = cv2.imencode('.jpg', image)
+    if not ok:
+        raise RuntimeError("Could not encode a frame of shape %s" % (image.shape,))
+    return encoded.tobytes()
+
+
+def read_frames(video_path, new_size):
+    """Yields the frames of a video resized to new_size (width, height)."""
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise RuntimeError("Could not open video %s" % (video_path))
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield cv2.resize(frame, new_size, interpolation=cv2.INTER_LINEAR)
+    finally:
+        capture.release()
+
+
+class StreamWriter(object):
+    """Collects the frames of one stream of a video for its shard."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.payloads = []
+        self.shape = None
+
+    def append(self, image):
+        if self.encoding == 'raw':
+            if self.shape is not None and self.shape != list(image.shape):
+                raise RuntimeError("Frames of a stream differ in shape, use --encoding jpeg")
+            self.shape = list(image.shape)
+        self.payloads.append(encode_image(image, self.encoding))
+
+
+def atomic_write(path, write):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        write(f)
+    os.replace(temporary, path)
+
+
+def write_shard(out_dir, shard_id, video, streams, encoding):
+    """Writes the streams of a video into shard shard_id and marks it done."""
+    offsets = [0]
+    infos = {}
+    for name, stream in streams:
+        if len(stream.payloads) == 0:
+            continue
+        infos[name] = {'first': 1, 'count': len(stream.payloads), 'entry': len(offsets) - 1}
+        if stream.shape is not None:
+            infos[name]['shape'] = stream.shape
+        for payload in stream.payloads:
+            offsets.append(offsets[-1] + len(payload))
+
+    def write_data(f):
+        for _, stream in streams:
+            for payload in stream.payloads:
+                f.write(payload)
+
+    atomic_write(os.path.join(out_dir, SHARD_PATTERN % shard_id), write_data)
+    atomic_write(os.path.join(out_dir, OFFSET_PATTERN % shard_id),
+                 lambda f: np.save(f, np.array(offsets, dtype=np.int64)))
+    marker = {'video': video, 'shard': shard_id, 'encoding': encoding, 'streams': infos}
+    atomic_write(os.path.join(out_dir, MARKER_PATTERN % shard_id),
+                 lambda f: f.write(json.dumps(marker).encode()))
+
+
+def read_marker(out_dir, shard_id):
+    marker_path = os.path.join(out_dir, MARKER_PATTERN % shard_id)
+    if not os.path.exists(marker_path):
+        return None
+    with open(marker_path) as marker_file:
+        return json.load(marker_file)
+
+
+def init_worker():
+    # one OpenCV thread per worker process, the pool spreads the videos
+    cv2.setNumThreads(1)
+
+
+def run_optical_flow(task):
+    """Extracts one video. Returns (video, flow frames, seconds, error), with
+    0 frames for a video that was already done and the error message of a
+    video that could not be extracted, None otherwise.
+    """
+    video_path, shard_id, out_dir, algorithm, bound, new_size, encoding = task
+    video = os.path.splitext(os.path.basename(video_path))[0]
+    marker = read_marker(out_dir, shard_id)
+    if marker is not None and marker['video'] == video and marker['encoding'] == encoding:
+        return video, 0, 0.0, None
+
+    try:
+        frames, elapsed = extract_video(video_path, shard_id, out_dir, algorithm, bound, new_size, encoding)
+    except Exception as e:
+        print("%s failed: %s" % (video_path, e))
+        sys.stdout.flush()
+        return video, 0, 0.0, str(e)
+    return video, frames, elapsed, None
+
+
+def extract_video(video_path, shard_id, out_dir, algorithm, bound, new_size, encoding):
+    """Computes the flow of a video into its shard. Returns (flow frames,
+    seconds).
+    """
+    video = os.path.splitext(os.path.basename(video_path))[0]
+    start = time.time()
+    flow = create_flow(algorithm)
+    img, flow_x, flow_y = StreamWriter(encoding), StreamWriter(encoding), StreamWriter(encoding)
+    prev = None
+    for frame in read_frames(video_path, new_size):
+        img.append(frame)
+        current = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if prev is not None:
+            x, y = quantize_flow(flow(prev, current), bound)
+            flow_x.append(x)
+            flow_y.append(y)
+        prev = current
+    if len(flow_x.payloads) == 0:
+        print("%s has less than two frames, it has no flow" % (video_path))
+    write_shard(out_dir, shard_id, video, [('img', img), ('flow_x', flow_x), ('flow_y', flow_y)], encoding)
+    elapsed = time.time() - start
+    print('{} {} done, {:.1f} frames/s'.format(shard_id, video, len(flow_x.payloads) / max(elapsed, 1e-6)))
+    sys.stdout.flush()
+    return len(flow_x.payloads), elapsed
+
+
+def write_index(out_dir, num_videos, encoding):
+    """Writes index.json of the videos that are done, returns their number."""
+    videos = {}
+    for shard_id in range(num_videos):
+        marker = read_marker(out_dir, shard_id)
+        if marker is not None and marker['encoding'] == encoding:
+            videos[marker['video']] = {'shard': shard_id, 'streams': marker['streams']}
+    atomic_write(os.path.join(out_dir, INDEX_NAME),
+                 lambda f: f.write(json.dumps({'encoding': encoding, 'num_shards': num_videos,
+                                               'videos': videos}).encode()))
+    return len(videos)
+
+
+def extract(vid_list, out_dir, algorithm, bound, new_size, encoding, num_worker):
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    create_flow(algorithm)
+    tasks = [(video_path, shard_id, out_dir, algorithm, bound, new_size, encoding)
+             for shard_id, video_path in enumerate(vid_list)]
+
+    start = time.time()
+    frames, seconds, extracted = 0, 0.0, 0
+    failed = []
+    pool = Pool(num_worker, initializer=init_worker)
+    try:
+        for video, video_frames, video_seconds, error in pool.imap_unordered(run_optical_flow, tasks):
+            if error is not None:
+                failed.append((video, error))
+            elif video_seconds > 0:
+                frames += video_frames
+                seconds += video_seconds
+                extracted += 1
+    finally:
+        pool.close()
+        pool.join()
+    wall = time.time() - start
+
+    done = write_index(out_dir, len(vid_list), encoding)
+    print("%d videos extracted, %d of %d done in %s" % (extracted, done, len(vid_list), out_dir))
+    if failed:
+        print("%d videos failed, run again to retry them:" % (len(failed)))
+        for video, error in sorted(failed):
+            print("  %s: %s" % (video, error))
+    if seconds > 0:
+        print("%s flow: %d frames, %.1f frames/s per core, %.1f frames/s with %d workers"
+              % (algorithm, frames, frames / seconds, frames / wall, num_worker))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="extract optical flows on CPU into a packed store")
+    parser.add_argument("--src_dir", type=str, default='./ucf101_videos',
+                        help='path to the video data, one folder per class')
+    parser.add_argument("--out_dir", type=str, default='./ucf101_packed',
+                        help='path to write the packed store')
+    parser.add_argument("--algorithm", type=str, default='dis', choices=ALGORITHMS,
+                        help='OpenCV optical flow algorithm (default: dis)')
+    parser.add_argument("--bound", type=float, default=20,
+                        help='flow bound of the uint8 quantization, as dense_flow -b (default: 20)')
+    parser.add_argument("--new_width", type=int, default=340, help='resize image width')
+    parser.add_argument("--new_height", type=int, default=256, help='resize image height')
+    parser.add_argument("--num_worker", type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: number of cores)')
+    parser.add_argument("--encoding", type=str, default='jpeg', choices=['jpeg', 'raw'],
+                        help='jpeg encodes the frames, raw stores decoded pixels')
+    parser.add_argument("--ext", type=str, default='avi', choices=['flv', 'avi', 'mp4'],
+                        help='video file extensions')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.src_dir):
+        print("Video folder %s doesn't exist." % (args.src_dir))
+        sys.exit()
+    vid_list = sorted(glob.glob(args.src_dir + '/*/*.' + args.ext))
+    print("%d videos found" % (len(vid_list)))
+    extract(vid_list, args.out_dir, args.algorithm, args.bound,
+            (args.new_width, args.new_height), args.encoding, args.num_worker)
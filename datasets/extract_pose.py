@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless, batched pose extraction into per-video pose arrays.
+
+extract_pose_from_rgb.py hands the frames to OpenPose one at a time, polls
+a window with cv2.waitKey and writes a rendered pose1_%05d.jpg per frame.
+This script reads the img_%05d.jpg frames of every video folder of a
+*_frames tree, resizes them to 340x256 (the frame size the poseRaw readers
+normalize by), gives them to the pose estimator --batch_size frames at a
+time and saves the BODY_25 keypoints of the video as poses.npy,
+poses_index.npy and poses_people.npy in its folder (see
+datasets/pose_store.py). Nothing is rendered or displayed.
+
+The estimator is pluggable: --estimator openpose runs the OpenPose python
+API without rendering, --estimator stub runs a model free stand-in that
+tests the pipeline, and --estimator package.module:Class loads any class
+with the PoseEstimator interface. Videos that already have a pose array are
+skipped, so an interrupted run is resumed by running it again.
+
+usage: python extract_pose.py --frames_dir ./window_frames --estimator openpose --openpose_path /home/esat/openpose
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import importlib
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+from pose_store import has_pose_array, pack_poses, save_pose_array
+
+_img_name_re = re.compile(r'^img_(\d+)\.jpg$')
+
+
+class PoseEstimator(object):
+    """Interface of the pose estimators: estimate takes a list of BGR frames
+    and returns one people x 25 x 3 (x, y, confidence) array per frame.
+    """
+
+    def estimate(self, frames):
+        raise NotImplementedError
+
+
+class OpenPoseEstimator(PoseEstimator):
+    """OpenPose BODY_25 through its python API, without rendering or display."""
+
+    def __init__(self, openpose_path, model_folder=None):
+        sys.path.append(os.path.join(openpose_path, 'build', 'python'))
+        from openpose import pyopenpose as op
+        self.op = op
+        params = dict()
+        params["model_folder"] = model_folder or os.path.join(openpose_path, 'models')
+        params["display"] = 0
+        params["render_pose"] = 0
+        self.wrapper = op.WrapperPython()
+        self.wrapper.configure(params)
+        self.wrapper.start()
+
+    def estimate(self, frames):
+        datums = []
+        for frame in frames:
+            datum = self.op.Datum()
+            datum.cvInputData = frame
+            datums.append(datum)
+        # OpenPose >= 1.7 takes a VectorDatum, older versions a list
+        self.wrapper.emplaceAndPop(getattr(self.op, 'VectorDatum', list)(datums))
+        keypoints = []
+        for datum in datums:
+            if datum.poseKeypoints is None or np.ndim(datum.poseKeypoints) != 3:
+                keypoints.append(np.zeros((0, 25, 3), dtype=np.float32))
+            else:
+                keypoints.append(datum.poseKeypoints)
+        return keypoints
+
+
+class StubPoseEstimator(PoseEstimator):
+    """Stand-in without a model for testing the pipeline: one person per
+    frame, its keypoints on a line across the frame, shifted by the mean
+    intensity of the frame.
+    """
+
+    def estimate(self, frames):
+        keypoints = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            shift = float(frame.mean()) / 255
+            person = np.zeros((1, 25, 3), dtype=np.float32)
+            person[0, :, 0] = np.linspace(0.1, 0.9, 25) * width
+            person[0, :, 1] = (0.25 + 0.5 * shift) * height
+            person[0, :, 2] = 1
+            keypoints.append(person)
+        return keypoints
+
+
+ESTIMATORS = {'openpose': OpenPoseEstimator, 'stub': StubPoseEstimator}
+
+
+def create_estimator(name, **kwargs):
+    """The estimator of ESTIMATORS called name, or the class module:Class."""
+    if name in ESTIMATORS:
+        estimator_class = ESTIMATORS[name]
+    elif ':' in name:
+        module_name, class_name = name.split(':')
+        estimator_class = getattr(importlib.import_module(module_name), class_name)
+    else:
+        raise ValueError("No such pose estimator %s" % (name))
+    if estimator_class is OpenPoseEstimator:
+        return estimator_class(**kwargs)
+    return estimator_class()
+
+
+def frame_files(video_dir):
+    """Sorted (frame index, file name) of the rgb frames of a video folder."""
+    frames = []
+    for frame_name in os.listdir(video_dir):
+        match = _img_name_re.match(frame_name)
+        if match is not None:
+            frames.append((int(match.group(1)), frame_name))
+    frames.sort()
+    return frames
+
+
+def extract_video(video_dir, estimator, batch_size, max_people, size=(340, 256)):
+    """Estimates the poses of the frames of a video folder and saves them as
+    its pose array. Returns the number of frames.
+    """
+    frames = frame_files(video_dir)
+    keypoints = []
+    for start in range(0, len(frames), batch_size):
+        batch = []
+        for _, frame_name in frames[start:start + batch_size]:
+            frame_path = os.path.join(video_dir, frame_name)
+            frame = cv2.imread(frame_path)
+            if frame is None:
+                raise RuntimeError("Could not load file %s" % (frame_path))
+            batch.append(cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR))
+        keypoints.extend(estimator.estimate(batch))
+
+    poses, people = pack_poses(keypoints, max_people)
+    save_pose_array(video_dir, poses, [frame_index for frame_index, _ in frames], people)
+    return len(frames)
+
+
+def extract(frames_dir, estimator, batch_size, max_people, overwrite=False):
+    video_list = sorted(d for d in os.listdir(frames_dir) if os.path.isdir(os.path.join(frames_dir, d)))
+    start = time.time()
+    frame_count = 0
+    for video in tqdm(video_list):
+        video_dir = os.path.join(frames_dir, video)
+        if has_pose_array(video_dir) and not overwrite:
+            continue
+        frame_count += extract_video(video_dir, estimator, batch_size, max_people)
+    elapsed = time.time() - start
+    print("%d frames of %d videos in %.1f s, %.1f frames/s"
+          % (frame_count, len(video_list), elapsed, frame_count / max(elapsed, 1e-6)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="extract per-video pose arrays")
+    parser.add_argument("--frames_dir", type=str, default='./window_frames',
+                        help='path to the extracted frames, one folder per video')
+    parser.add_argument("--estimator", type=str, default='openpose',
+                        help='openpose, stub or package.module:Class (default: openpose)')
+    parser.add_argument("--openpose_path", type=str, default='/home/esat/openpose',
+                        help='path to the OpenPose build')
+    parser.add_argument("--model_folder", type=str, default=None,
+                        help='OpenPose model folder (default: <openpose_path>/models)')
+    parser.add_argument("--batch_size", type=int, default=16,
+                        help='frames given to the estimator at once (default: 16)')
+    parser.add_argument("--max_people", type=int, default=10,
+                        help='people kept per frame (default: 10)')
+    parser.add_argument("--overwrite", action='store_true',
+                        help='extract the videos that already have a pose array again')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.frames_dir):
+        print("Frame folder %s doesn't exist." % (args.frames_dir))
+        sys.exit()
+    estimator = create_estimator(args.estimator, openpose_path=args.openpose_path,
+                                 model_folder=args.model_folder)
+    extract(args.frames_dir, estimator, args.batch_size, args.max_people, args.overwrite)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clip sampling from precomputed features1 activations.
+
+precompute_features.py stores, for every clip of a split, one or more
+(offsets, crop) draws of features1 in a utils.feature_bank.FeatureBank with
+keys [index, offsets..., y1, x1, crop_h, crop_w, flip]. CachedFeatureSampling
+returns a random stored draw of a clip in place of its frames.
+"""
+
+import random
+import numpy as np
+import torch
+import torch.utils.data as data
+
+from utils.feature_bank import FeatureBank
+
+
+class CachedFeatureSampling(data.Dataset):
+    """Memory maps are opened lazily, like in ClipStore, so every DataLoader
+    worker opens its own map of the bank.
+    """
+
+    def __init__(self, dataset, bank_path):
+        """dataset: the dataset the bank was computed from, for clips and targets
+        bank_path: FeatureBank directory written by precompute_features.py
+        """
+        self.dataset = dataset
+        bank = FeatureBank(bank_path)
+        self.features_path = bank.features_path
+        self.rows = {}
+        for row, key in enumerate(bank.keys):
+            self.rows.setdefault(key[0], []).append(row)
+        missing = len(dataset) - len(self.rows)
+        if missing > 0 or len(bank) == 0:
+            raise RuntimeError("%d of %d clips have no precomputed features in %s"
+                               % (missing, len(dataset), bank_path))
+        self._features = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_features'] = None
+        return state
+
+    def __getitem__(self, index):
+        if self._features is None:
+            self._features = np.load(self.features_path, mmap_mode='r')
+        row = random.choice(self.rows[index])
+        features = torch.from_numpy(np.array(self._features[row]))
+        target = self.dataset.clips[index][2]
+        if self.dataset.target_transform is not None:
+            target = self.dataset.target_transform(target)
+        return features, target
+
+    def __len__(self):
+        return len(self.dataset)
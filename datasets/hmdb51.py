@@ -6,6 +6,11 @@ import random
 import numpy as np
 import cv2
 
+from .clip_store import ClipStore, ReadSegmentRGBPacked, ReadSegmentFlowPacked, ReadSegmentBothPacked, \
+    sampled_frame_indices
+from .pose_store import read_pose_frames, pose_clip_features, pose_clip_positions
+from .video_store import VideoStore, ReadSegmentRGBVideo
+
 
 def find_classes(dir):
     classes = [d for d in os.listdir(dir) if os.path.isdir(os.path.join(dir, d))]
@@ -31,89 +36,19 @@ def make_dataset(root, source):
                 clips.append(item)
     return clips
 
-part_info = [(1,8),   (1,2),   
-             (1,5),   (2,3),   (3,4),   (5,6),   
-             (6,7),   (8,9),   (9,10),  (10,11), 
-             (8,12),  (12,13), (13,14),  (1,0),  
-             (0,15),  (15,17), (0,16),  (16,18),   
-             (2,17),  (5,18),  (14,19), (19,20),
-             (14,21), (11,22), (22,23), (11,24)]
-
-first_part = [part1 for part1,part2 in part_info]
-second_part = [part2 for part1,part2 in part_info]
-
 def ReadSegmentPoseRaw(path, offsets, new_length, name_pattern, duration):
-    sampled_list = []
     max_person = 2
-    for offset_id in range(len(offsets)):
-        offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
-            loaded_frame_index = length_id + offset
-            moded_loaded_frame_index = loaded_frame_index % (duration + 1)
-            if moded_loaded_frame_index == 0:
-                moded_loaded_frame_index = (duration + 1)
-            frame_name = name_pattern % (moded_loaded_frame_index)
-            frame_path = path + "/" + frame_name
-            pose_info = np.load(frame_path)
-            if pose_info is None:
-               print("Could not load file %s" % (frame_path))
-               sys.exit()
-            #pose_info_people_count = pose_info.shape[0]
-            #pose_extracted = np.zeros([max_person, 25, 2])
-            # if pose_info_people_count > max_person:
-            #     pose_extracted = pose_info[:max_person, :, :]
-            # else:
-            #     pose_extracted[:max_person, :, :] = pose_info[:max_person, :, :]
-            pose_extracted = np.zeros([max_person, 26, 3])
-            pose_extracted[:,:25,:2] = pose_info[:max_person, :, :]
-            pose_extracted[pose_extracted == 0] = None
-            pose_extracted[:,:,0] = pose_extracted[:,:,0] / 340
-            pose_extracted[:,:,1] = pose_extracted[:,:,1] / 256
-            joint_information = pose_extracted[:,first_part, :] - pose_extracted[:,second_part, :]
-            angle_information = np.arctan2(-joint_information[:,:,1], joint_information[:,:,0])
-            angle_information[angle_information < 0] += 2 * np.pi
-            angle_information = angle_information / (2 * np.pi)
-            pose_extracted[:,:,2] = angle_information
-            pose_extracted = np.expand_dims(pose_extracted, 3)
-            sampled_list.append(pose_extracted)
-    clip_input = np.concatenate(sampled_list, axis=3)
-    return clip_input   
+    frame_indices = sampled_frame_indices(offsets, new_length, duration)
+    return pose_clip_features(read_pose_frames(path, frame_indices, max_person, name_pattern))
 
 
 def ReadSegmentPoseRaw2(path, offsets, new_length, name_pattern, duration):
-    sampled_list = []
     max_person = 2
-    for offset_id in range(len(offsets)):
-        offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
-            loaded_frame_index = length_id + offset
-            moded_loaded_frame_index = loaded_frame_index % (duration + 1)
-            if moded_loaded_frame_index == 0:
-                moded_loaded_frame_index = (duration + 1)
-            frame_name = name_pattern % (moded_loaded_frame_index)
-            frame_path = path + "/" + frame_name
-            pose_info = np.load(frame_path)
-            if pose_info is None:
-               print("Could not load file %s" % (frame_path))
-               sys.exit()
-            #pose_info_people_count = pose_info.shape[0]
-            #pose_extracted = np.zeros([max_person, 25, 2])
-            # if pose_info_people_count > max_person:
-            #     pose_extracted = pose_info[:max_person, :, :]
-            # else:
-            #     pose_extracted[:max_person, :, :] = pose_info[:max_person, :, :]
-            pose_extracted = np.zeros([max_person, 25, 2])
-            pose_extracted[:,:25,:2] = pose_info[:max_person, :, :]
-            pose_extracted[pose_extracted == 0] = None
-            pose_extracted[:,:,0] = pose_extracted[:,:,0] / 340
-            pose_extracted[:,:,1] = pose_extracted[:,:,1] / 256
-            pose_extracted = np.expand_dims(pose_extracted, 3)
-            sampled_list.append(pose_extracted)
-    clip_input = np.concatenate(sampled_list, axis=3)
-    return clip_input      
-             
-
-def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, name_pattern, duration):
+    frame_indices = sampled_frame_indices(offsets, new_length, duration)
+    return pose_clip_positions(read_pose_frames(path, frame_indices, max_person, name_pattern))
+
+
+def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, name_pattern, duration, temporal_stride=1):
     if is_color:
         cv_read_flag = cv2.IMREAD_COLOR         # > 0
     else:
@@ -123,7 +58,7 @@ def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, n
     sampled_list = []
     for offset_id in range(len(offsets)):
         offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
+        for length_id in range(1, new_length+1, temporal_stride):
             loaded_frame_index = length_id + offset
             moded_loaded_frame_index = loaded_frame_index % (duration + 1)
             if moded_loaded_frame_index == 0:
@@ -146,7 +81,7 @@ def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, n
     return clip_input
 
 
-def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color, name_pattern,duration):
+def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color, name_pattern,duration, temporal_stride=1):
     if is_color:
         cv_read_flag = cv2.IMREAD_COLOR         # > 0
     else:
@@ -156,7 +91,7 @@ def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color,
     sampled_list = []
     for offset_id in range(len(offsets)):
         offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
+        for length_id in range(1, new_length+1, temporal_stride):
             loaded_frame_index = length_id + offset
             moded_loaded_frame_index = loaded_frame_index % (duration + 1)
             if moded_loaded_frame_index == 0:
@@ -183,7 +118,7 @@ def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color,
     clip_input = np.concatenate(sampled_list, axis=2)
     return clip_input
 
-def ReadSegmentBoth(path, offsets, new_height, new_width, new_length, name_pattern_rgb, name_pattern_flow, duration):
+def ReadSegmentBoth(path, offsets, new_height, new_width, new_length, name_pattern_rgb, name_pattern_flow, duration, temporal_stride=1):
     cv_read_flag_rgb = cv2.IMREAD_COLOR         # > 0
     cv_read_flag_flow = cv2.IMREAD_GRAYSCALE     # = 0
     interpolation = cv2.INTER_LINEAR
@@ -191,7 +126,7 @@ def ReadSegmentBoth(path, offsets, new_height, new_width, new_length, name_patte
     sampled_list = []
     for offset_id in range(len(offsets)):
         offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
+        for length_id in range(1, new_length+1, temporal_stride):
             loaded_frame_index = length_id + offset
             moded_loaded_frame_index = loaded_frame_index % (duration + 1)
             if moded_loaded_frame_index == 0:
@@ -240,12 +175,15 @@ class hmdb51(data.Dataset):
                  is_color=True,
                  num_segments=1,
                  new_length=1,
+                 temporal_stride=1,
                  new_width=0,
                  new_height=0,
                  transform=None,
                  target_transform=None,
                  video_transform=None,
-                 ensemble_training = False):
+                 ensemble_training = False,
+                 storage="frames",
+                 storage_path=None):
 
         classes, class_to_idx = find_classes(root)
         clips = make_dataset(root, source)
@@ -282,6 +220,7 @@ class hmdb51(data.Dataset):
         self.is_color = is_color
         self.num_segments = num_segments
         self.new_length = new_length
+        self.temporal_stride = temporal_stride
         self.new_width = new_width
         self.new_height = new_height
 
@@ -289,9 +228,19 @@ class hmdb51(data.Dataset):
         self.target_transform = target_transform
         self.video_transform = video_transform
 
-    def __getitem__(self, index):
-        path, duration, target = self.clips[index]
-        duration = duration - 1
+        self.storage = storage
+        if self.storage == "packed":
+            # frames are read from a store written by datasets/pack_frames.py
+            self.store = ClipStore(storage_path)
+        elif self.storage == "video":
+            # rgb frames are decoded from the videos, see datasets/video_store.py
+            if self.modality != "rgb":
+                raise ValueError("Storage video only holds rgb frames, not %s" % (self.modality))
+            self.store = VideoStore(storage_path)
+        elif self.storage != "frames":
+            raise ValueError("No such storage %s" % (self.storage))
+
+    def sample_offsets(self, duration):
         average_duration = int(duration / self.num_segments)
         average_part_length = int(np.floor((duration-self.new_length) / self.num_segments))
         offsets = []
@@ -317,10 +266,22 @@ class hmdb51(data.Dataset):
                     offsets.append(0 + seg_id * increase)
             else:
                 print("Only phase train and val are supported.")
-        
-
-
-        if self.modality == "rgb":
+        return offsets
+
+    def read_clip(self, path, offsets, duration):
+        if self.storage == "video":
+            clip_input = ReadSegmentRGBVideo(self.store,
+                                             os.path.relpath(path, self.root),
+                                             offsets,
+                                             self.new_height,
+                                             self.new_width,
+                                             self.new_length,
+                                             duration,
+                                             self.temporal_stride
+                                             )
+        elif self.storage == "packed" and self.modality in ["rgb", "flow", "both", "pose"]:
+            clip_input = self._read_packed(path, offsets, duration)
+        elif self.modality == "rgb":
             clip_input = ReadSegmentRGB(path,
                                         offsets,
                                         self.new_height,
@@ -328,7 +289,8 @@ class hmdb51(data.Dataset):
                                         self.new_length,
                                         self.is_color,
                                         self.name_pattern,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
         elif self.modality == "flow":
             clip_input = ReadSegmentFlow(path,
@@ -338,7 +300,8 @@ class hmdb51(data.Dataset):
                                         self.new_length,
                                         self.is_color,
                                         self.name_pattern,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
             
         elif self.modality == "both":
@@ -349,7 +312,8 @@ class hmdb51(data.Dataset):
                                         self.new_length,
                                         self.name_pattern_rgb,
                                         self.name_pattern_flow,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
         elif self.modality == "pose":
             clip_input = ReadSegmentRGB(path,
@@ -359,7 +323,8 @@ class hmdb51(data.Dataset):
                                         self.new_length,
                                         self.is_color,
                                         self.name_pattern,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
         elif self.modality == "poseRaw":
             clip_input = ReadSegmentPoseRaw2(path,
@@ -377,6 +342,13 @@ class hmdb51(data.Dataset):
                                         )
         else:
             print("No such modality %s" % (self.modality))
+        return clip_input
+
+    def __getitem__(self, index):
+        path, duration, target = self.clips[index]
+        duration = duration - 1
+        offsets = self.sample_offsets(duration)
+        clip_input = self.read_clip(path, offsets, duration)
 
         if not self.ensemble_training:
             if self.transform is not None:
@@ -405,5 +377,44 @@ class hmdb51(data.Dataset):
                 
 
 
+    def _read_packed(self, path, offsets, duration):
+        key = os.path.relpath(path, self.root)
+        if self.modality == "rgb" or self.modality == "pose":
+            return ReadSegmentRGBPacked(self.store,
+                                        key,
+                                        offsets,
+                                        self.new_height,
+                                        self.new_width,
+                                        self.new_length,
+                                        self.is_color,
+                                        self.name_pattern,
+                                        duration,
+                                        self.temporal_stride
+                                        )
+        elif self.modality == "flow":
+            return ReadSegmentFlowPacked(self.store,
+                                         key,
+                                         offsets,
+                                         self.new_height,
+                                         self.new_width,
+                                         self.new_length,
+                                         self.is_color,
+                                         self.name_pattern,
+                                         duration,
+                                         self.temporal_stride
+                                         )
+        else:
+            return ReadSegmentBothPacked(self.store,
+                                         key,
+                                         offsets,
+                                         self.new_height,
+                                         self.new_width,
+                                         self.new_length,
+                                         self.name_pattern_rgb,
+                                         self.name_pattern_flow,
+                                         duration,
+                                         self.temporal_stride
+                                         )
+
     def __len__(self):
         return len(self.clips)
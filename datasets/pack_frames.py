@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Packs a *_frames tree (one folder per video with img_%05d.jpg,
+flow_x_%05d.jpg, flow_y_%05d.jpg ... files) into a packed frame store that
+the datasets read with --storage packed. See datasets/clip_store.py for the
+layout.
+
+usage: python pack_frames.py --src_dir ./ucf101_frames --out_dir ./ucf101_packed
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import cv2
+from tqdm import tqdm
+
+from clip_store import split_frame_name, INDEX_NAME, SHARD_PATTERN, OFFSET_PATTERN
+
+
+def collect_streams(video_dir):
+    """Returns {stream: sorted list of (frame index, file name)} for a video folder."""
+    streams = {}
+    for frame_name in os.listdir(video_dir):
+        split = split_frame_name(frame_name)
+        if split is None or frame_name.endswith('.npy'):
+            continue
+        stream, frame_index = split
+        streams.setdefault(stream, []).append((frame_index, frame_name))
+    for stream in streams:
+        streams[stream].sort()
+    return streams
+
+
+def encode_frame(frame_path, encoding):
+    if encoding == 'jpeg':
+        with open(frame_path, 'rb') as frame_file:
+            return frame_file.read(), None
+    image = cv2.imread(frame_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise RuntimeError("Could not load file %s" % (frame_path))
+    # Decode again with the flag the datasets use, so the stored pixels match
+    # cv2.imread(frame_path, flag) exactly.
+    if image.ndim == 2:
+        image = cv2.imread(frame_path, cv2.IMREAD_GRAYSCALE)
+    else:
+        image = cv2.imread(frame_path, cv2.IMREAD_COLOR)
+    return image.tobytes(), list(image.shape)
+
+
+def pack(src_dir, out_dir, videos_per_shard=1, encoding='jpeg'):
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    video_list = sorted(d for d in os.listdir(src_dir) if os.path.isdir(os.path.join(src_dir, d)))
+
+    videos = {}
+    shard_id = -1
+    shard_file = None
+    shard_offsets = []
+    for video_id, video in enumerate(tqdm(video_list)):
+        if video_id % videos_per_shard == 0:
+            if shard_file is not None:
+                shard_file.close()
+                np.save(os.path.join(out_dir, OFFSET_PATTERN % shard_id), np.array(shard_offsets, dtype=np.int64))
+            shard_id += 1
+            shard_file = open(os.path.join(out_dir, SHARD_PATTERN % shard_id), 'wb')
+            shard_offsets = [0]
+
+        video_dir = os.path.join(src_dir, video)
+        streams = {}
+        for stream, frames in sorted(collect_streams(video_dir).items()):
+            first = frames[0][0]
+            if [frame_index for frame_index, _ in frames] != list(range(first, first + len(frames))):
+                print("Frames of stream %s in %s are not numbered contiguously, skipping it" % (stream, video_dir))
+                continue
+            info = {'first': first, 'count': len(frames), 'entry': len(shard_offsets) - 1}
+            for _, frame_name in frames:
+                payload, shape = encode_frame(os.path.join(video_dir, frame_name), encoding)
+                if shape is not None:
+                    if 'shape' in info and info['shape'] != shape:
+                        raise RuntimeError("Frames of stream %s in %s differ in shape, use --encoding jpeg"
+                                           % (stream, video_dir))
+                    info['shape'] = shape
+                shard_file.write(payload)
+                shard_offsets.append(shard_offsets[-1] + len(payload))
+            streams[stream] = info
+        videos[video] = {'shard': shard_id, 'streams': streams}
+
+    if shard_file is not None:
+        shard_file.close()
+        np.save(os.path.join(out_dir, OFFSET_PATTERN % shard_id), np.array(shard_offsets, dtype=np.int64))
+
+    with open(os.path.join(out_dir, INDEX_NAME), 'w') as index_file:
+        json.dump({'encoding': encoding, 'num_shards': shard_id + 1, 'videos': videos}, index_file)
+    print("%d videos packed into %d shards in %s" % (len(videos), shard_id + 1, out_dir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="pack extracted frames into a memory-mapped store")
+    parser.add_argument("--src_dir", type=str, default='./ucf101_frames',
+                        help='path to the extracted frames, one folder per video')
+    parser.add_argument("--out_dir", type=str, default='./ucf101_packed',
+                        help='path to write the packed store')
+    parser.add_argument("--videos_per_shard", type=int, default=1,
+                        help='number of videos written into one shard file')
+    parser.add_argument("--encoding", type=str, default='jpeg', choices=['jpeg', 'raw'],
+                        help='jpeg keeps the encoded frames, raw stores decoded pixels')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.src_dir):
+        print("Frame folder %s doesn't exist." % (args.src_dir))
+        sys.exit()
+    pack(args.src_dir, args.out_dir, args.videos_per_shard, args.encoding)
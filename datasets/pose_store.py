@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-video pose arrays of the poseRaw modalities.
+
+The pose of a video is stored in its frame folder as two files written by
+datasets/extract_pose.py:
+    poses.npy        float16, T x people x 25 x 2, the OpenPose BODY_25
+                     (x, y) keypoints in pixels of the 340x256 frames, 0 for
+                     a missing keypoint or person
+    poses_index.npy  int32, T, the frame index (1-based) of every row
+    poses_people.npy int32, T, the number of people detected in every frame
+
+A frame with a single person fills every person slot with it when read, as
+numpy broadcasting did for the per-frame files, so both give the models the
+same input.
+
+ReadSegmentPoseRaw and ReadSegmentPoseRaw2 read the sampled frames of a clip
+with one fancy-indexed read of the memory-mapped array instead of one
+np.load of pose_%05d.npy per frame. Videos without a poses.npy are still
+read from the per-frame files.
+
+pose_clip_features and pose_clip_positions turn the keypoints of all the
+frames of a clip into the poseRaw inputs with a few array operations.
+"""
+
+import os
+import numpy as np
+
+POSE_ARRAY_NAME = 'poses.npy'
+POSE_INDEX_NAME = 'poses_index.npy'
+POSE_PEOPLE_NAME = 'poses_people.npy'
+
+# limbs (joint, joint) of the BODY_25 skeleton whose angles are features
+part_info = [(1,8),   (1,2),
+             (1,5),   (2,3),   (3,4),   (5,6),
+             (6,7),   (8,9),   (9,10),  (10,11),
+             (8,12),  (12,13), (13,14),  (1,0),
+             (0,15),  (15,17), (0,16),  (16,18),
+             (2,17),  (5,18),  (14,19), (19,20),
+             (14,21), (11,22), (22,23), (11,24)]
+
+first_part = [part1 for part1,part2 in part_info]
+second_part = [part2 for part1,part2 in part_info]
+
+
+def has_pose_array(video_dir):
+    return (os.path.exists(os.path.join(video_dir, POSE_ARRAY_NAME))
+            and os.path.exists(os.path.join(video_dir, POSE_PEOPLE_NAME)))
+
+
+def pack_poses(keypoints, max_people):
+    """The poses (T x people x 25 x 2) and people counts (T) of the pose
+    array of a video from its people x 25 x 2+ keypoints per frame, at most
+    max_people per frame.
+    """
+    people = np.array([min(len(frame_keypoints), max_people) for frame_keypoints in keypoints], dtype=np.int32)
+    poses = np.zeros((len(keypoints), max(people.max(initial=0), 1), 25, 2), dtype=np.float32)
+    for frame_id, frame_keypoints in enumerate(keypoints):
+        poses[frame_id, :people[frame_id]] = frame_keypoints[:people[frame_id], :, :2]
+    return poses, people
+
+
+def save_pose_array(video_dir, poses, frame_indices, people):
+    """Writes the pose array of a video, each file through a rename, the
+    array last, so has_pose_array is only true for complete videos.
+    """
+    for name, array in ((POSE_INDEX_NAME, np.asarray(frame_indices, dtype=np.int32)),
+                        (POSE_PEOPLE_NAME, np.asarray(people, dtype=np.int32)),
+                        (POSE_ARRAY_NAME, np.asarray(poses, dtype=np.float16))):
+        path = os.path.join(video_dir, name)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.save(f, array)
+        os.replace(temporary, path)
+
+
+def read_pose_array(video_dir, frame_indices, max_person):
+    """Keypoints of the given frames of a video, frames x max_person x 25 x 2
+    (float64). The single person of a frame fills every slot, the people
+    missing from a frame with more are left at 0.
+    """
+    poses = np.load(os.path.join(video_dir, POSE_ARRAY_NAME), mmap_mode='r')
+    index = np.load(os.path.join(video_dir, POSE_INDEX_NAME))
+    people_count = np.load(os.path.join(video_dir, POSE_PEOPLE_NAME))
+    frame_indices = np.asarray(frame_indices, dtype=np.int64)
+    rows = np.searchsorted(index, frame_indices)
+    if rows.max(initial=0) >= len(index) or np.any(index[np.minimum(rows, len(index) - 1)] != frame_indices):
+        raise IndexError("Frame index out of range for the poses of %s" % (video_dir))
+    people = min(max_person, poses.shape[1])
+    extracted = np.zeros((len(frame_indices), max_person, 25, 2))
+    extracted[:, :people] = poses[rows, :people]
+    single = people_count[rows] == 1
+    extracted[single] = extracted[single, :1]
+    return extracted
+
+
+def read_pose_frames(video_dir, frame_indices, max_person, name_pattern):
+    """Keypoints of the given frames of a video as read_pose_array returns
+    them, from the pose array of the video or else from its name_pattern
+    per-frame files.
+    """
+    if has_pose_array(video_dir):
+        return read_pose_array(video_dir, frame_indices, max_person)
+    extracted = np.zeros((len(frame_indices), max_person, 25, 2))
+    for frame_id, frame_index in enumerate(frame_indices):
+        pose_info = np.load(os.path.join(video_dir, name_pattern % (frame_index)))
+        extracted[frame_id] = pose_info[:max_person, :, :]
+    return extracted
+
+
+def pose_clip_positions(poses):
+    """Normalized keypoints of a clip, person x 25 x 2 x frames, from its
+    frames x person x 25 x 2 pixel keypoints. Missing keypoints are NaN.
+    """
+    positions = np.array(poses, dtype=np.float64)
+    positions[positions == 0] = None
+    positions[..., 0] /= 340
+    positions[..., 1] /= 256
+    return np.ascontiguousarray(positions.transpose(1, 2, 3, 0))
+
+
+def pose_clip_features(poses):
+    """Normalized keypoints and limb angles of a clip, person x 26 x 3 x
+    frames, from its frames x person x 25 x 2 pixel keypoints: (x, y) of the
+    25 joints (the 26th is NaN) and, in the third channel, the angle of each
+    of the 26 limbs of part_info as a fraction of a turn.
+    """
+    frames, people = poses.shape[:2]
+    features = np.zeros((frames, people, 26, 3))
+    features[:, :, :25, :2] = poses
+    features[features == 0] = None
+    features[..., 0] /= 340
+    features[..., 1] /= 256
+    limbs = features[:, :, first_part, :2] - features[:, :, second_part, :2]
+    angles = np.arctan2(-limbs[..., 1], limbs[..., 0])
+    angles[angles < 0] += 2 * np.pi
+    features[..., 2] = angles / (2 * np.pi)
+    return np.ascontiguousarray(features.transpose(1, 2, 3, 0))
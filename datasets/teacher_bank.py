@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clip sampling for MARS training from a teacher feature bank.
+
+TeacherBankSampling wraps an rgb ucf101/hmdb51 dataset. For videos that have
+all their draws in the bank it replays one of the stored (offsets, crop), so
+the teacher features can be read from the bank instead of decoding the flow
+frames and running the teacher. Other videos are sampled as usual. Every
+sample carries its clip key [index, offsets..., y1, x1, crop_h, crop_w, flip]
+to look the teacher features up in the training loop.
+"""
+
+import random
+import torch
+import torch.utils.data as data
+
+
+def split_clip_key(key, num_segments):
+    """Returns (index, offsets, crop parameters) of a clip key."""
+    key = [int(k) for k in key]
+    return key[0], key[1:1 + num_segments], key[1 + num_segments:]
+
+
+def bank_replay(bank, num_segments):
+    """Maps every clip index in the bank to its list of (offsets, crop parameters)."""
+    replay = {}
+    for key in bank.keys:
+        index, offsets, crop_parameters = split_clip_key(key, num_segments)
+        replay.setdefault(index, []).append((offsets, crop_parameters))
+    return replay
+
+
+class TeacherBankSampling(data.Dataset):
+
+    def __init__(self, dataset, crop_transform, draws=1, replay=None):
+        """dataset: dataset with sample_offsets/read_clip (ucf101, hmdb51)
+        crop_transform: video_transforms.MultiScaleCropParameters
+        draws: number of clips per video the bank holds before replaying
+        replay: bank_replay() of the teacher bank, None to always sample fresh clips
+        """
+        self.dataset = dataset
+        self.crop_transform = crop_transform
+        self.draws = draws
+        self.replay = replay or {}
+
+    def __getitem__(self, index):
+        path, duration, target = self.dataset.clips[index]
+        duration = duration - 1
+        if len(self.replay.get(index, [])) >= self.draws:
+            offsets, crop_parameters = random.choice(self.replay[index])
+            clip_input = self.dataset.read_clip(path, offsets, duration)
+            clip_input = torch.from_numpy(clip_input.transpose((2, 0, 1)))
+            crop_parameters = torch.tensor(crop_parameters)
+        else:
+            offsets = self.dataset.sample_offsets(duration)
+            clip_input = self.dataset.read_clip(path, offsets, duration)
+            clip_input, crop_parameters = self.crop_transform(clip_input)
+        key = torch.tensor([index] + list(offsets) + crop_parameters.tolist())
+        return (clip_input, crop_parameters), target, key
+
+    def __len__(self):
+        return len(self.dataset)
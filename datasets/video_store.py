@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frame access straight from the video files, without extracting frames.
+
+A VideoStore maps a video key, the frame folder of the video relative to
+the dataset root (e.g. 'ApplyEyeMakeup/v_ApplyEyeMakeup_g01_c01'), to
+<video_root>/<key>.<ext>, or else to the file under video_root whose name
+without extension is the last component of the key. Frame index i is the
+i-th decoded frame, i.e. img_%05d.jpg % i as written by
+convertVideoToImages.py, so the datasets sample the same frames from the
+video as from the frame folder.
+
+Only the requested frames are decoded. With the pyav decoder the keyframe
+positions of a video are read once from its packets (no decoding); the
+decoder seeks to the last keyframe before a requested frame only when that
+keyframe lies ahead of the current decoding position, and otherwise keeps
+decoding forward. The cv2 decoder relies on the keyframe seeking of
+cv2.VideoCapture and skips short gaps with grab().
+"""
+
+import os
+import bisect
+import numpy as np
+import cv2
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from .clip_store import sampled_frame_indices
+
+
+VIDEO_EXTENSIONS = ('.avi', '.mp4', '.webm', '.mkv', '.mov')
+
+# the cv2 decoder grabs through gaps up to this many frames instead of seeking
+MAX_GRAB_FRAMES = 16
+
+
+class VideoStore(object):
+    """Read-only access to a directory of videos.
+
+    decoder is 'pyav' or 'cv2', None picks pyav when the av package is
+    installed. The store holds no open files, so it can be created in the main
+    process and handed to DataLoader workers.
+    """
+
+    def __init__(self, video_root, decoder=None):
+        if not os.path.isdir(video_root):
+            raise RuntimeError("No video directory found at %s" % (video_root))
+        if decoder is None:
+            decoder = 'pyav' if av is not None else 'cv2'
+        if decoder == 'pyav' and av is None:
+            raise RuntimeError("The pyav decoder needs the av package (pip install av)")
+        elif decoder not in ('pyav', 'cv2'):
+            raise ValueError("No such decoder %s" % (decoder))
+        self.video_root = video_root
+        self.decoder = decoder
+        self._names = None
+        self._keyframes = {}
+
+    def video_path(self, key):
+        for extension in VIDEO_EXTENSIONS:
+            path = os.path.join(self.video_root, key + extension)
+            if os.path.exists(path):
+                return path
+        if self._names is None:
+            self._names = {}
+            for directory, _, files in os.walk(self.video_root):
+                for file_name in files:
+                    name, extension = os.path.splitext(file_name)
+                    if extension.lower() in VIDEO_EXTENSIONS:
+                        self._names.setdefault(name, os.path.join(directory, file_name))
+        name = os.path.basename(os.path.normpath(key))
+        if name not in self._names:
+            raise KeyError("Video %s is not in %s" % (key, self.video_root))
+        return self._names[name]
+
+    def read(self, key, frame_indices):
+        """Returns the frames with the given (1-based) indices of a video as a
+        list of BGR arrays, in the requested order.
+        """
+        frame_indices = np.asarray(frame_indices, dtype=np.int64)
+        if len(frame_indices) == 0:
+            return []
+        path = self.video_path(key)
+        wanted = np.unique(frame_indices - 1)
+        if self.decoder == 'pyav':
+            decoded = self._read_pyav(path, wanted)
+        else:
+            decoded = self._read_cv2(path, wanted)
+        if len(decoded) < len(wanted):
+            missing = sorted(set(wanted.tolist()) - set(decoded))
+            raise IndexError("Frame index %d out of range for %s" % (missing[0] + 1, path))
+        return [decoded[frame_number] for frame_number in (frame_indices - 1).tolist()]
+
+    def _frame_number(self, stream, pts):
+        return int(round(float((pts - (stream.start_time or 0)) * stream.time_base * stream.average_rate)))
+
+    def _keyframe_numbers(self, path, container, stream):
+        """Sorted frame numbers of the keyframes of a video, read from its packets."""
+        if path not in self._keyframes:
+            keyframes = set([0])
+            for packet in container.demux(stream):
+                if packet.is_keyframe and packet.pts is not None:
+                    keyframes.add(self._frame_number(stream, packet.pts))
+            self._keyframes[path] = sorted(keyframes)
+            container.seek(0, stream=stream)
+        return self._keyframes[path]
+
+    def _read_pyav(self, path, wanted):
+        decoded = {}
+        container = av.open(path)
+        try:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            keyframes = self._keyframe_numbers(path, container, stream)
+            wanted_set = set(wanted.tolist())
+            position = 0
+            frames = None
+            for target in wanted.tolist():
+                if target in decoded:
+                    continue
+                keyframe = keyframes[bisect.bisect_right(keyframes, target) - 1]
+                if frames is None or target < position or keyframe > position:
+                    pts = int(round(keyframe / float(stream.average_rate * stream.time_base))) \
+                        + (stream.start_time or 0)
+                    container.seek(pts, stream=stream, backward=True, any_frame=False)
+                    frames = container.decode(stream)
+                for frame in frames:
+                    if frame.pts is None:
+                        frame_number = position
+                    else:
+                        frame_number = self._frame_number(stream, frame.pts)
+                    position = frame_number + 1
+                    if frame_number in wanted_set:
+                        decoded[frame_number] = frame.to_ndarray(format='bgr24')
+                    if frame_number >= target:
+                        break
+                else:
+                    break
+        finally:
+            container.close()
+        return decoded
+
+    def _read_cv2(self, path, wanted):
+        decoded = {}
+        capture = cv2.VideoCapture(path)
+        try:
+            position = 0
+            for target in wanted.tolist():
+                if target < position or target - position > MAX_GRAB_FRAMES:
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+                    position = target
+                while position < target:
+                    capture.grab()
+                    position += 1
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                decoded[target] = frame
+                position = target + 1
+        finally:
+            capture.release()
+        return decoded
+
+
+def ReadSegmentRGBVideo(store, key, offsets, new_height, new_width, new_length, duration, temporal_stride=1):
+    interpolation = cv2.INTER_LINEAR
+
+    frame_indices = sampled_frame_indices(offsets, new_length, duration, temporal_stride)
+    frames = store.read(key, frame_indices)
+    sampled_list = []
+    for cv_img_origin in frames:
+        if new_width > 0 and new_height > 0:
+            cv_img = cv2.resize(cv_img_origin, (new_width, new_height), interpolation)
+        else:
+            cv_img = cv_img_origin
+        cv_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
+        sampled_list.append(cv_img)
+    clip_input = np.concatenate(sampled_list, axis=2)
+    return clip_input
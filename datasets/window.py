@@ -14,6 +14,8 @@ import random
 import numpy as np
 import cv2
 
+from .video_store import VideoStore, ReadSegmentRGBVideo
+
 
 def find_classes(dir):
     classes = [d for d in os.listdir(dir) if os.path.isdir(os.path.join(dir, d))]
@@ -39,7 +41,7 @@ def make_dataset(root, source):
                 clips.append(item)
     return clips
 
-def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, name_pattern, duration):
+def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, name_pattern, duration, temporal_stride=1):
     if is_color:
         cv_read_flag = cv2.IMREAD_COLOR         # > 0
     else:
@@ -49,7 +51,7 @@ def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, n
     sampled_list = []
     for offset_id in range(len(offsets)):
         offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
+        for length_id in range(1, new_length+1, temporal_stride):
             loaded_frame_index = length_id + offset
             moded_loaded_frame_index = loaded_frame_index % (duration + 1)
             if moded_loaded_frame_index == 0:
@@ -72,7 +74,7 @@ def ReadSegmentRGB(path, offsets, new_height, new_width, new_length, is_color, n
     return clip_input
 
 
-def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color, name_pattern,duration):
+def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color, name_pattern,duration, temporal_stride=1):
     if is_color:
         cv_read_flag = cv2.IMREAD_COLOR         # > 0
     else:
@@ -82,7 +84,7 @@ def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color,
     sampled_list = []
     for offset_id in range(len(offsets)):
         offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
+        for length_id in range(1, new_length+1, temporal_stride):
             loaded_frame_index = length_id + offset
             moded_loaded_frame_index = loaded_frame_index % (duration + 1)
             if moded_loaded_frame_index == 0:
@@ -109,7 +111,7 @@ def ReadSegmentFlow(path, offsets, new_height, new_width, new_length, is_color,
     clip_input = np.concatenate(sampled_list, axis=2)
     return clip_input
 
-def ReadSegmentBoth(path, offsets, new_height, new_width, new_length, name_pattern_rgb, name_pattern_flow):
+def ReadSegmentBoth(path, offsets, new_height, new_width, new_length, name_pattern_rgb, name_pattern_flow, temporal_stride=1):
     cv_read_flag_rgb = cv2.IMREAD_COLOR         # > 0
     cv_read_flag_flow = cv2.IMREAD_GRAYSCALE     # = 0
     interpolation = cv2.INTER_LINEAR
@@ -117,7 +119,7 @@ def ReadSegmentBoth(path, offsets, new_height, new_width, new_length, name_patte
     sampled_list = []
     for offset_id in range(len(offsets)):
         offset = offsets[offset_id]
-        for length_id in range(1, new_length+1):
+        for length_id in range(1, new_length+1, temporal_stride):
             frame_name_x = name_pattern_flow % ("x", length_id + offset)
             frame_path_x = path + "/" + frame_name_x
             cv_img_origin_x = cv2.imread(frame_path_x, cv_read_flag_flow)
@@ -162,11 +164,14 @@ class window(data.Dataset):
                  is_color=True,
                  num_segments=1,
                  new_length=1,
+                 temporal_stride=1,
                  new_width=0,
                  new_height=0,
                  transform=None,
                  target_transform=None,
-                 video_transform=None):
+                 video_transform=None,
+                 storage="frames",
+                 storage_path=None):
 
         classes, class_to_idx = find_classes(root)
         clips = make_dataset(root, source)
@@ -200,6 +205,7 @@ class window(data.Dataset):
         self.is_color = is_color
         self.num_segments = num_segments
         self.new_length = new_length
+        self.temporal_stride = temporal_stride
         self.new_width = new_width
         self.new_height = new_height
 
@@ -207,9 +213,16 @@ class window(data.Dataset):
         self.target_transform = target_transform
         self.video_transform = video_transform
 
-    def __getitem__(self, index):
-        path, duration, target = self.clips[index]
-        duration = duration - 1
+        self.storage = storage
+        if self.storage == "video":
+            # rgb frames are decoded from the videos, see datasets/video_store.py
+            if self.modality != "rgb":
+                raise ValueError("Storage video only holds rgb frames, not %s" % (self.modality))
+            self.store = VideoStore(storage_path)
+        elif self.storage != "frames":
+            raise ValueError("No such storage %s" % (self.storage))
+
+    def sample_offsets(self, duration):
         average_duration = int(duration / self.num_segments)
         average_part_length = int(np.floor((duration-self.new_length) / self.num_segments))
         offsets = []
@@ -235,10 +248,20 @@ class window(data.Dataset):
                     offsets.append(0 + seg_id * increase)
             else:
                 print("Only phase train and val are supported.")
-        
-
-
-        if self.modality == "rgb":
+        return offsets
+
+    def read_clip(self, path, offsets, duration):
+        if self.storage == "video":
+            clip_input = ReadSegmentRGBVideo(self.store,
+                                             os.path.relpath(path, self.root),
+                                             offsets,
+                                             self.new_height,
+                                             self.new_width,
+                                             self.new_length,
+                                             duration,
+                                             self.temporal_stride
+                                             )
+        elif self.modality == "rgb":
             clip_input = ReadSegmentRGB(path,
                                         offsets,
                                         self.new_height,
@@ -246,7 +269,8 @@ class window(data.Dataset):
                                         self.new_length,
                                         self.is_color,
                                         self.name_pattern,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
         elif self.modality == "flow":
             clip_input = ReadSegmentFlow(path,
@@ -256,7 +280,8 @@ class window(data.Dataset):
                                         self.new_length,
                                         self.is_color,
                                         self.name_pattern,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
             
         elif self.modality == "both":
@@ -266,7 +291,8 @@ class window(data.Dataset):
                                         self.new_width,
                                         self.new_length,
                                         self.name_pattern_rgb,
-                                        self.name_pattern_flow
+                                        self.name_pattern_flow,
+                                        self.temporal_stride
                                         )
         elif self.modality == "pose":
             clip_input = ReadSegmentRGB(path,
@@ -276,10 +302,18 @@ class window(data.Dataset):
                                         self.new_length,
                                         self.is_color,
                                         self.name_pattern,
-                                        duration
+                                        duration,
+                                        self.temporal_stride
                                         )
         else:
             print("No such modality %s" % (self.modality))
+        return clip_input
+
+    def __getitem__(self, index):
+        path, duration, target = self.clips[index]
+        duration = duration - 1
+        offsets = self.sample_offsets(duration)
+        clip_input = self.read_clip(path, offsets, duration)
 
         if self.transform is not None:
             clip_input = self.transform(clip_input)
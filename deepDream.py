@@ -127,6 +127,8 @@ def build_model():
     # if torch.cuda.device_count() > 1:
     #     model=torch.nn.DataParallel(model)    
     #model = model.cuda()
+    if 'deep' in args.arch:
+        model = model.split()
     
     return model
 
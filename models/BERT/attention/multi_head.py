@@ -1,16 +1,24 @@
 import torch.nn as nn
 import torch
-from .single import Attention, Attention2
+from .single import Attention, Attention2, FusedAttention
+
+attention_backends = ['dense', 'sdpa']
 
 
 class MultiHeadedAttention(nn.Module):
     """
     Take in model size and number of heads.
+
+    attention_backend 'dense' takes the [B, 1, L, L] mask of BERT and
+    materializes the score matrix, 'sdpa' takes a boolean key padding mask
+    [B, L] and runs the fused FusedAttention kernel.
     """
 
-    def __init__(self, h, d_model, dropout=0.1):
+    def __init__(self, h, d_model, dropout=0.1, attention_backend='dense'):
         super().__init__()
         assert d_model % h == 0
+        assert attention_backend in attention_backends
+        self.attention_backend = attention_backend
 
         # We assume d_v always equals d_k
         self.d_k = d_model // h
@@ -19,6 +27,7 @@ class MultiHeadedAttention(nn.Module):
         self.linear_layers = nn.ModuleList([nn.Linear(d_model, d_model) for _ in range(3)])
         self.output_linear = nn.Linear(d_model, d_model)
         self.attention = Attention()
+        self.fused_attention = FusedAttention()
 
         self.dropout = nn.Dropout(p=dropout)
 
@@ -30,7 +39,10 @@ class MultiHeadedAttention(nn.Module):
                              for l, x in zip(self.linear_layers, (query, key, value))]
 
         # 2) Apply attention on all the projected vectors in batch.
-        x, attn = self.attention(query, key, value, mask=mask, dropout=self.dropout)
+        if self.attention_backend == 'sdpa':
+            x, attn = self.fused_attention(query, key, value, key_padding_mask=mask, dropout=self.dropout)
+        else:
+            x, attn = self.attention(query, key, value, mask=mask, dropout=self.dropout)
 
         # 3) "Concat" using a view and apply a final linear.
         x = x.transpose(1, 2).contiguous().view(batch_size, -1, self.h * self.d_k)
@@ -40,11 +52,17 @@ class MultiHeadedAttention(nn.Module):
 class MultiHeadedAttention2(nn.Module):
     """
     Take in model size and number of heads.
+
+    The rgb and flow streams share the element-wise max of their attention
+    maps, so both backends compute the maps. 'sdpa' only replaces the
+    [B, 1, L, L] mask by a broadcast boolean key padding mask [B, L].
     """
 
-    def __init__(self, h, d_model, dropout=0.1):
+    def __init__(self, h, d_model, dropout=0.1, attention_backend='dense'):
         super().__init__()
         assert d_model % h == 0
+        assert attention_backend in attention_backends
+        self.attention_backend = attention_backend
 
         # We assume d_v always equals d_k
         self.d_k = d_model // h
@@ -69,6 +87,9 @@ class MultiHeadedAttention2(nn.Module):
         query_flow, key_flow, value_flow = [l(x).view(batch_size, -1, self.h, self.d_k).transpose(1, 2)
                              for l, x in zip(self.linear_layers2, (input_flow, input_flow, input_flow))]
 
+        if self.attention_backend == 'sdpa' and mask is not None:
+            mask = mask[:, None, None, :]
+
         # 2) Apply attention on all the projected vectors in batch.
         _ , attn_rgb = self.attention( query_rgb, key_rgb, value_rgb, mask=mask)
         _ , attn_flow = self.attention( query_flow, key_flow, value_flow, mask=mask)
@@ -37,3 +37,30 @@ class Attention2(nn.Module):
             p_attn = dropout(p_attn)
 
         return torch.matmul(p_attn, value), p_attn
+
+
+class FusedAttention(nn.Module):
+    """
+    Scaled Dot Product Attention with a boolean key padding mask [B, L],
+    True for the keys that are attended to. Runs the fused
+    F.scaled_dot_product_attention kernel where available, which does not
+    return the attention map.
+    """
+
+    def forward(self, query, key, value, key_padding_mask=None, dropout=None):
+        attn_mask = None
+        if key_padding_mask is not None:
+            attn_mask = key_padding_mask[:, None, None, :]
+        dropout_p = dropout.p if dropout is not None and dropout.training else 0.0
+
+        if hasattr(F, 'scaled_dot_product_attention'):
+            return F.scaled_dot_product_attention(query, key, value, attn_mask=attn_mask,
+                                                  dropout_p=dropout_p), None
+
+        scores = torch.matmul(query, key.transpose(-2, -1)) \
+                 / math.sqrt(query.size(-1))
+        if attn_mask is not None:
+            scores = scores.masked_fill(~attn_mask, float('-inf'))
+        p_attn = F.softmax(scores, dim=-1)
+        p_attn = F.dropout(p_attn, p=dropout_p)
+        return torch.matmul(p_attn, value), None
@@ -4,6 +4,33 @@ import torch
 
 from .transformer import TransformerBlock, TransformerBlock2
 from .embedding import BERTEmbedding, BERTEmbedding2, BERTEmbedding3, BERTEmbedding4
+from .attention.multi_head import attention_backends
+
+
+def attention_mask(sample, batch_size, seq_len, device, attention_backend='dense'):
+    """
+    Attention mask of the transformer blocks for the Bernoulli sample
+    [batch_size, seq_len] of kept positions. 'dense' gives the
+    [batch_size, 1, seq_len, seq_len] mask of Attention, 'sdpa' the boolean
+    key padding mask [batch_size, seq_len] of FusedAttention. Without a
+    sample (eval) every position is kept and the mask is None for both, so
+    the eval graph has no mask to build and traces for any batch size.
+    """
+    if sample is None:
+        return None
+    if attention_backend == 'sdpa':
+        return sample > 0
+    return (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+
+
+def set_attention_backend(model, attention_backend):
+    """Switches every BERT and attention module of model to attention_backend, returns model."""
+    assert attention_backend in attention_backends
+    for module in model.modules():
+        if hasattr(module, 'attention_backend'):
+            module.attention_backend = attention_backend
+    return model
+
 
 
 
@@ -12,13 +39,15 @@ class BERT(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -28,6 +57,7 @@ class BERT(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
 
@@ -39,7 +69,7 @@ class BERT(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
 
     
     
@@ -50,14 +80,14 @@ class BERT(nn.Module):
         sample=None
         if self.training:
             bernolliMatrix=torch.cat((
-                torch.tensor([1]).float().cuda(),
-                (torch.tensor([self.mask_prob]).float().cuda()).
+                torch.tensor([1], device=input_vectors.device).float(),
+                (torch.tensor([self.mask_prob], device=input_vectors.device).float()).
                 repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         context_vector = torch.mean(input_vectors, 1, True)
@@ -75,13 +105,15 @@ class BERT2(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -91,9 +123,10 @@ class BERT2(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken = torch.zeros(1,1,self.input_dim).float()
         clsToken.require_grad = True
         self.clsToken= nn.Parameter(clsToken)
         torch.nn.init.normal_(self.clsToken, std = hidden ** -0.5)
@@ -108,7 +141,7 @@ class BERT2(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
   
         for module in self.modules():
             if isinstance(module, nn.Embedding):
@@ -128,12 +161,12 @@ class BERT2(nn.Module):
         batch_size=input_vectors.shape[0]
         sample=None
         if self.training:
-            bernolliMatrix=torch.cat((torch.tensor([1]).float().cuda(), (torch.tensor([self.mask_prob]).float().cuda()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
+            bernolliMatrix=torch.cat((torch.tensor([1], device=input_vectors.device).float(), (torch.tensor([self.mask_prob], device=input_vectors.device).float()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         x = torch.cat((self.clsToken.repeat(batch_size,1,1),input_vectors),1)
@@ -150,13 +183,15 @@ class BERT3(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -166,9 +201,10 @@ class BERT3(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken = torch.zeros(1,1,self.input_dim).float()
         clsToken.require_grad = True
         self.clsToken= nn.Parameter(clsToken)
         torch.nn.init.normal_(clsToken,std=0.02)
@@ -182,7 +218,7 @@ class BERT3(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
 
     
     
@@ -192,12 +228,12 @@ class BERT3(nn.Module):
         batch_size=input_vectors.shape[0]
         sample=None
         if self.training:
-            bernolliMatrix=torch.cat((torch.tensor([1]).float().cuda(), (torch.tensor([self.mask_prob]).float().cuda()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
+            bernolliMatrix=torch.cat((torch.tensor([1], device=input_vectors.device).float(), (torch.tensor([self.mask_prob], device=input_vectors.device).float()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         x = torch.cat((self.clsToken.repeat(batch_size,1,1),input_vectors),1)
@@ -214,13 +250,15 @@ class BERT4(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -230,9 +268,10 @@ class BERT4(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken = torch.zeros(1,1,self.input_dim).float()
         clsToken.require_grad = True
         self.clsToken= nn.Parameter(clsToken)
         torch.nn.init.normal_(self.clsToken,std=0.02)
@@ -247,7 +286,7 @@ class BERT4(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
   
         for module in self.modules():
             if isinstance(module, nn.Embedding):
@@ -266,12 +305,12 @@ class BERT4(nn.Module):
         batch_size=input_vectors.shape[0]
         sample=None
         if self.training:
-            bernolliMatrix=torch.cat((torch.tensor([1]).float().cuda(), (torch.tensor([self.mask_prob]).float().cuda()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
+            bernolliMatrix=torch.cat((torch.tensor([1], device=input_vectors.device).float(), (torch.tensor([self.mask_prob], device=input_vectors.device).float()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         x = torch.cat((self.clsToken.repeat(batch_size,1,1),input_vectors),1)
@@ -290,13 +329,15 @@ class BERT5(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -306,9 +347,10 @@ class BERT5(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken = torch.zeros(1,1,self.input_dim).float()
         clsToken.require_grad = True
         self.clsToken= nn.Parameter(clsToken)
         torch.nn.init.normal_(clsToken,std=0.02)
@@ -322,7 +364,7 @@ class BERT5(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
 
     
     
@@ -333,14 +375,14 @@ class BERT5(nn.Module):
         sample=None
         if self.training:
             bernolliMatrix=torch.cat((
-                torch.tensor([1]).float().cuda(),
-                (torch.tensor([self.mask_prob]).float().cuda()).
+                torch.tensor([1], device=input_vectors.device).float(),
+                (torch.tensor([self.mask_prob], device=input_vectors.device).float()).
                 repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         x = torch.cat((self.clsToken.repeat(batch_size,1,1),input_vectors),1)
@@ -358,13 +400,15 @@ class BERT6(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -374,9 +418,10 @@ class BERT6(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken = torch.zeros(1,1,self.input_dim).float()
         clsToken.require_grad = True
         self.clsToken= nn.Parameter(clsToken)
         torch.nn.init.normal_(self.clsToken,std=0.02)
@@ -391,7 +436,7 @@ class BERT6(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
   
         for module in self.modules():
             if isinstance(module, nn.Embedding):
@@ -410,12 +455,12 @@ class BERT6(nn.Module):
         batch_size=input_vectors.shape[0]
         sample=None
         if self.training:
-            bernolliMatrix=torch.cat((torch.tensor([1]).float().cuda(), (torch.tensor([self.mask_prob]).float().cuda()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
+            bernolliMatrix=torch.cat((torch.tensor([1], device=input_vectors.device).float(), (torch.tensor([self.mask_prob], device=input_vectors.device).float()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         x = torch.cat((self.clsToken.repeat(batch_size,1,1),input_vectors),1)
@@ -432,13 +477,15 @@ class BERT7(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -448,15 +495,16 @@ class BERT7(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken = torch.zeros(1,1,self.input_dim).float()
         clsToken.require_grad = True
         torch.nn.init.normal_(clsToken,std=0.02)
         self.clsToken= nn.Parameter(clsToken)
         
         
-        maskToken = torch.zeros(1,1,self.input_dim).float().cuda()
+        maskToken = torch.zeros(1,1,self.input_dim).float()
         maskToken.require_grad = True
         torch.nn.init.normal_(maskToken,std=0.02)
         self.maskToken= nn.Parameter(maskToken)
@@ -470,7 +518,7 @@ class BERT7(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
 
     
     
@@ -482,13 +530,13 @@ class BERT7(nn.Module):
         mask = None
 
 
-        mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+        mask = attention_mask(None, batch_size, self.max_len+1, input_vectors.device, self.attention_backend)
         # embedding the indexed sequence to sequence of vectors
         x = torch.cat((self.clsToken.repeat(batch_size,1,1),input_vectors),1)
         
         
         if self.training:
-            bernolliMatrix=torch.cat((torch.tensor([1]).float().cuda(), (torch.tensor([self.mask_prob]).float().cuda()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
+            bernolliMatrix=torch.cat((torch.tensor([1], device=input_vectors.device).float(), (torch.tensor([self.mask_prob], device=input_vectors.device).float()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
             x[sample == 0] = self.maskToken
@@ -510,13 +558,15 @@ class BERT5_BOTH(nn.Module):
     BERT model : Bidirectional Encoder Representations from Transformers.
     """
 
-    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8):
+    def __init__(self, input_dim, max_len, hidden=768, n_layers=12, attn_heads=12, dropout=0.1, mask_prob=0.8,
+                 attention_backend='dense'):
         """
         :param vocab_size: vocab_size of total words
         :param hidden: BERT model hidden size
         :param n_layers: numbers of Transformer blocks(layers)
         :param attn_heads: number of attention heads
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa' attention, see MultiHeadedAttention
         """
 
         super().__init__()
@@ -526,14 +576,15 @@ class BERT5_BOTH(nn.Module):
         self.max_len=max_len
         self.input_dim=input_dim
         self.mask_prob=mask_prob
+        self.attention_backend=attention_backend
         
         
-        clsToken_rgb = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken_rgb = torch.zeros(1,1,self.input_dim).float()
         clsToken_rgb.require_grad = True
         torch.nn.init.normal_(clsToken_rgb,std=0.02)
         self.clsToken_rgb= nn.Parameter(clsToken_rgb)
         
-        clsToken_flow = torch.zeros(1,1,self.input_dim).float().cuda()
+        clsToken_flow = torch.zeros(1,1,self.input_dim).float()
         clsToken_flow.require_grad = True
         torch.nn.init.normal_(clsToken_flow,std=0.02)
         self.clsToken_flow= nn.Parameter(clsToken_flow)
@@ -548,7 +599,7 @@ class BERT5_BOTH(nn.Module):
 
         # multi-layers transformer blocks, deep network
         self.transformer_blocks = nn.ModuleList(
-            [TransformerBlock2(hidden, attn_heads, self.feed_forward_hidden, dropout) for _ in range(n_layers)])
+            [TransformerBlock2(hidden, attn_heads, self.feed_forward_hidden, dropout, attention_backend) for _ in range(n_layers)])
 
     
     
@@ -558,12 +609,12 @@ class BERT5_BOTH(nn.Module):
         batch_size=input_vectors_rgb.shape[0]
         sample=None
         if self.training:
-            bernolliMatrix=torch.cat((torch.tensor([1]).float().cuda(), (torch.tensor([self.mask_prob]).float().cuda()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
+            bernolliMatrix=torch.cat((torch.tensor([1], device=input_vectors_rgb.device).float(), (torch.tensor([self.mask_prob], device=input_vectors_rgb.device).float()).repeat(self.max_len)), 0).unsqueeze(0).repeat([batch_size,1])
             self.bernolliDistributor=torch.distributions.Bernoulli(bernolliMatrix)
             sample=self.bernolliDistributor.sample()
-            mask = (sample > 0).unsqueeze(1).repeat(1, sample.size(1), 1).unsqueeze(1)
+            mask = attention_mask(sample, batch_size, self.max_len+1, sample.device, self.attention_backend)
         else:
-            mask=torch.ones(batch_size,1,self.max_len+1,self.max_len+1).cuda()
+            mask = attention_mask(None, batch_size, self.max_len+1, input_vectors_rgb.device, self.attention_backend)
 
         # embedding the indexed sequence to sequence of vectors
         input_vectors_rgb = torch.cat((self.clsToken_rgb.repeat(batch_size,1,1),input_vectors_rgb),1)
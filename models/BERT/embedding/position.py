@@ -37,7 +37,7 @@ class LearnedPositionalEmbedding2(nn.Module):
         super().__init__()
 
         # Compute the positional encodings once in log space.
-        pe = torch.zeros(max_len, d_model).float().to(device='cuda')
+        pe = torch.zeros(max_len, d_model).float()
         pe.require_grad = True
         pe = pe.unsqueeze(0)
         self.pe=nn.Parameter(pe)
@@ -52,7 +52,7 @@ class LearnedPositionalEmbedding(nn.Module):
         super().__init__()
 
         # Compute the positional encodings once in log space.
-        pe = torch.zeros(max_len, d_model).float().to(device='cuda')
+        pe = torch.zeros(max_len, d_model).float()
         pe.require_grad = True
         pe = pe.unsqueeze(0)
         self.pe=nn.Parameter(pe)
@@ -67,9 +67,9 @@ class LearnedPositionalEmbedding3(nn.Module):
         super().__init__()
 
         # Compute the positional encodings once in log space.
-        pe = torch.zeros(max_len, d_model).float().to(device='cuda')
-        self.a_2 = nn.Parameter(torch.ones_like(pe)).to(device='cuda')
-        self.b_2 = nn.Parameter(torch.zeros_like(pe)).to(device='cuda')
+        pe = torch.zeros(max_len, d_model).float()
+        self.a_2 = nn.Parameter(torch.ones_like(pe))
+        self.b_2 = nn.Parameter(torch.zeros_like(pe))
         pe.require_grad = True
         pe = pe.unsqueeze(0)
         self.pe=nn.Parameter(pe)
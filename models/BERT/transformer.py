@@ -10,16 +10,17 @@ class TransformerBlock(nn.Module):
     Transformer = MultiHead_Attention + Feed_Forward with sublayer connection
     """
 
-    def __init__(self, hidden, attn_heads, feed_forward_hidden, dropout):
+    def __init__(self, hidden, attn_heads, feed_forward_hidden, dropout, attention_backend='dense'):
         """
         :param hidden: hidden size of transformer
         :param attn_heads: head sizes of multi-head attention
         :param feed_forward_hidden: feed_forward_hidden, usually 4*hidden_size
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa', see MultiHeadedAttention
         """
 
         super().__init__()
-        self.attention = MultiHeadedAttention(h=attn_heads, d_model=hidden)
+        self.attention = MultiHeadedAttention(h=attn_heads, d_model=hidden, attention_backend=attention_backend)
         self.feed_forward = PositionwiseFeedForward(d_model=hidden, d_ff=feed_forward_hidden, dropout=dropout)
         self.input_sublayer = SublayerConnection(size=hidden, dropout=dropout)
         self.output_sublayer = SublayerConnection(size=hidden, dropout=dropout)
@@ -36,16 +37,17 @@ class TransformerBlock2(nn.Module):
     Transformer = MultiHead_Attention + Feed_Forward with sublayer connection
     """
 
-    def __init__(self, hidden, attn_heads, feed_forward_hidden, dropout):
+    def __init__(self, hidden, attn_heads, feed_forward_hidden, dropout, attention_backend='dense'):
         """
         :param hidden: hidden size of transformer
         :param attn_heads: head sizes of multi-head attention
         :param feed_forward_hidden: feed_forward_hidden, usually 4*hidden_size
         :param dropout: dropout rate
+        :param attention_backend: 'dense' or 'sdpa', see MultiHeadedAttention
         """
 
         super().__init__()
-        self.attention = MultiHeadedAttention2(h=attn_heads, d_model=hidden)
+        self.attention = MultiHeadedAttention2(h=attn_heads, d_model=hidden, attention_backend=attention_backend)
         self.feed_forward_rgb = PositionwiseFeedForward(d_model=hidden, d_ff=feed_forward_hidden, dropout=dropout)
         self.feed_forward_flow = PositionwiseFeedForward(d_model=hidden, d_ff=feed_forward_hidden, dropout=dropout)
         self.input_sublayer = SublayerConnection2(size=hidden, dropout=dropout)
@@ -1,15 +1,15 @@
-from .rgb_vgg16 import *
-from .flow_vgg16 import *
-from .rgb_resnet import *
-from .flow_resnet import *
-from .rgb_densenet import *
-from .flow_densenet import *
-from .rgb_efficient import *
-from .both_resnet import *
-from .pose_resnet import *
-from .rgb_resnet3D import *
-from .rgb_resneXt3D import *
-from .rgb_I3D import *
-from .rgb_MFNET3D import *
-from .rgb_r2plus1d import *
-from .rgb_slowfast import *
+"""
+Architectures of the model zoo, by name.
+
+Importing the package does not import the architecture modules: every name
+in the __all__ of the modules of registry.ARCHITECTURE_MODULES is bound to a
+registry.LazyArchitecture placeholder, so models.__dict__[arch] and the
+model_names lists of the scripts see every architecture as before. Calling a
+placeholder imports its module, whose names then replace their placeholders.
+"""
+
+from . import registry
+
+for _name, _module_name in registry.architectures.items():
+    globals()[_name] = registry.LazyArchitecture(_name, _module_name)
+del _name, _module_name
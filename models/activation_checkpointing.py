@@ -0,0 +1,90 @@
+"""
+Opt-in activation checkpointing of the stages of the 3D backbones.
+
+The 64-frame backbones keep the activations of every block for the backward
+pass, which is what limits the batch size of two_stream_bert2.py to 9 clips.
+With checkpointing a stage is split into segments, only the inputs of the
+segments are kept, and each segment is recomputed during the backward pass.
+That trades about one more forward pass of the backbone for memory.
+
+The stages are the nn.Sequential containers of the residual or inception
+blocks below, wherever they sit: the layer1..layer4 of ResNeXt and of the
+r2plus1d VideoResNet, the conv2..conv5 of MFNET_3D, and the endpoints of
+InceptionI3d. The BERT heads keep their backbone as
+nn.Sequential(*backbone.children()), so the stages are found in there as
+well. A stage becomes a CheckpointedSequential with the same children, so
+the state_dict keys and the checkpoints do not change.
+
+BatchNorm layers see each checkpointed segment twice per step, so their
+running statistics are updated twice with the same batch.
+"""
+
+import inspect
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+from torch.utils.checkpoint import checkpoint_sequential
+
+# (module, class) of the blocks whose containers are checkpointed
+CHECKPOINT_BLOCKS = {
+    ('rgb_resneXt3D', 'ResNeXtBottleneck'),
+    ('r2plus1d.resnet', 'BasicBlock'),
+    ('r2plus1d.resnet', 'Bottleneck'),
+    ('rgb_I3D', 'InceptionModule'),
+    ('rgb_MFNET3D', 'MF_UNIT'),
+}
+
+_NON_REENTRANT = 'use_reentrant' in inspect.signature(checkpoint_sequential).parameters
+
+
+def is_checkpoint_block(module):
+    return (type(module).__module__.rpartition('models.')[2], type(module).__name__) in CHECKPOINT_BLOCKS
+
+
+def run_checkpointed(modules, segments, x):
+    """modules (a list or nn.Sequential) applied in order to x, in
+    checkpointed segments when training with gradients.
+    """
+    if segments <= 0 or not torch.is_grad_enabled() or not any(module.training for module in modules):
+        for module in modules:
+            x = module(x)
+        return x
+    modules = nn.Sequential(*modules) if isinstance(modules, list) else modules
+    segments = min(segments, len(modules))
+    if _NON_REENTRANT:
+        return checkpoint_sequential(modules, segments, x, use_reentrant=False)
+    if not x.requires_grad:
+        # the reentrant checkpoint only backpropagates into the parameters
+        # of a segment whose input requires grad
+        x = x.detach().requires_grad_()
+    return checkpoint_sequential(modules, segments, x)
+
+
+class CheckpointedSequential(nn.Sequential):
+    """nn.Sequential that runs its children in checkpointed segments while
+    training.
+    """
+
+    def __init__(self, modules, segments):
+        super(CheckpointedSequential, self).__init__(modules)
+        self.segments = segments
+
+    def forward(self, x):
+        return run_checkpointed(self, self.segments, x)
+
+
+def set_activation_checkpointing(model, segments):
+    """Checkpoints every stage of the 3D backbones of model in segments
+    segments, or turns checkpointing off with segments=0. Returns model.
+    """
+    for module in list(model.modules()):
+        if hasattr(module, 'checkpoint_segments'):
+            module.checkpoint_segments = segments
+        for name, child in list(module.named_children()):
+            if isinstance(child, CheckpointedSequential):
+                child.segments = segments
+            elif segments > 0 and isinstance(child, nn.Sequential) \
+                    and any(is_checkpoint_block(block) for block in child.children()):
+                setattr(module, name, CheckpointedSequential(OrderedDict(child.named_children()), segments))
+    return model
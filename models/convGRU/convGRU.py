@@ -41,10 +41,7 @@ class ConvGRUCell(nn.Module):
         # generate empty prev_state, if None is provided
         if prev_state is None:
             state_size = [batch_size, self.hidden_size] + list(spatial_size)
-            if torch.cuda.is_available():
-                prev_state = torch.zeros(state_size).cuda()
-            else:
-                prev_state = torch.zeros(state_size)
+            prev_state = torch.zeros(state_size, dtype=input_.dtype, device=input_.device)
 
         # data size is [batch, channel, height, width]
         stacked_inputs = torch.cat([input_, prev_state], dim=1)
@@ -0,0 +1,68 @@
+"""
+Export of trained models to inference-only TorchScript and ONNX graphs.
+
+The BERT heads return (logits, input_vectors, sequenceOut, maskSample) and
+sample their Bernoulli mask on the Python side while training. The exported
+graph is traced from InferenceModel in eval mode, so the sampling branch is
+never taken and only the logits are kept.
+"""
+
+import copy
+
+import torch
+import torch.nn as nn
+
+from .BERT.bert import set_attention_backend
+
+
+class InferenceModel(nn.Module):
+    """Eval-mode model that returns the logits only."""
+
+    def __init__(self, model):
+        super(InferenceModel, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        output = self.model(x)
+        if isinstance(output, tuple):
+            output = output[0]
+        return output
+
+
+def inference_model(model, attention_backend=None):
+    """InferenceModel of a copy of model in eval mode without gradients.
+    Setting attention_backend switches the BERT attention of the copy, 'dense'
+    exports to every ONNX opset. model itself is left as it was, so it stays
+    the eager reference of the exported graphs.
+    """
+    model = copy.deepcopy(model)
+    if attention_backend is not None:
+        set_attention_backend(model, attention_backend)
+    model = InferenceModel(model)
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad = False
+    return model
+
+
+def export_torchscript(model, example, path):
+    """Traces the inference graph of model on the example clips and saves it
+    to path. Returns the traced module.
+    """
+    model = inference_model(model)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    torch.jit.save(traced, path)
+    return traced
+
+
+def export_onnx(model, example, path, opset_version=14):
+    """Exports the inference graph of model to an ONNX file with the input
+    'clips' and the output 'logits', both with a dynamic batch size.
+    """
+    model = inference_model(model, attention_backend='dense')
+    with torch.no_grad():
+        torch.onnx.export(model, example, path,
+                          input_names=['clips'], output_names=['logits'],
+                          dynamic_axes={'clips': {0: 'batch'}, 'logits': {0: 'batch'}},
+                          opset_version=opset_version, do_constant_folding=True)
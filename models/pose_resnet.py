@@ -8,6 +8,7 @@ Created on Wed Nov 27 17:10:14 2019
 
 import torch.nn as nn
 import torch
+import torch.nn.functional as F
 import math
 from collections import OrderedDict
 from .BERT.bert import BERT, BERT2, BERT3, BERT4, BERT5, BERT7
@@ -480,8 +481,21 @@ class poseRaw2_bert7(nn.Module):
         torch.nn.init.xavier_uniform_(self.fc_action.weight)
         self.fc_action.bias.data.zero_()
         
+    def embed(self, x):
+        """Word embeddings of the pose grids, from the one-hot grids (float,
+        batch x length x 1024) or from their bin ids (long, batch x length x
+        joints, padded with 1024) of pose_one_hot_decoding2(sparse=True). The
+        bin ids look up the columns of one_hot_to_word_embedding instead of
+        multiplying the mostly zero grids with it.
+        """
+        if x.dtype != torch.long:
+            return self.one_hot_to_word_embedding(x)
+        weight = self.one_hot_to_word_embedding.weight.t()
+        weight = torch.cat([weight, weight.new_zeros(1, self.hidden_size)])
+        return F.embedding(x, weight).sum(2) + self.one_hot_to_word_embedding.bias
+
     def forward(self, x):
-        embedding = self.one_hot_to_word_embedding(x)
+        embedding = self.embed(x)
         output_embedding , maskSample = self.bert(embedding)
         classificationOut = output_embedding[:,0,:]
         sequenceOut = output_embedding[:,1:,:]
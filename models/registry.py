@@ -0,0 +1,75 @@
+"""
+Lazy registry of the architectures of the model zoo, see models/__init__.py.
+"""
+
+import os
+import re
+import ast
+import importlib
+
+ARCHITECTURE_MODULES = ['rgb_vgg16', 'flow_vgg16', 'rgb_resnet', 'flow_resnet', 'rgb_densenet',
+                        'flow_densenet', 'rgb_efficient', 'both_resnet', 'pose_resnet', 'rgb_resnet3D',
+                        'rgb_resneXt3D', 'rgb_I3D', 'rgb_MFNET3D', 'rgb_r2plus1d', 'rgb_slowfast']
+
+PACKAGE = __name__.rpartition('.')[0]
+
+_ALL_PATTERN = re.compile(r'^__all__\s*=\s*(\[.*?\])', re.M | re.S)
+
+
+def exported_names(module_name):
+    """The __all__ of an architecture module, read from its source without
+    importing it.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), module_name + '.py')
+    with open(path) as source_file:
+        match = _ALL_PATTERN.search(source_file.read())
+    if match is None:
+        raise RuntimeError("models/%s.py has no __all__" % (module_name))
+    return ast.literal_eval(match.group(1))
+
+
+def find_architectures():
+    """Maps every architecture name to the module that defines it. A name in
+    more than one module maps to the last one, as with star imports.
+    """
+    architectures = {}
+    for module_name in ARCHITECTURE_MODULES:
+        for name in exported_names(module_name):
+            architectures[name] = module_name
+    return architectures
+
+
+architectures = find_architectures()
+
+
+class LazyArchitecture(object):
+    """Placeholder for an architecture whose module is not imported yet."""
+
+    def __init__(self, name, module_name):
+        self.__name__ = name
+        self.module_name = module_name
+
+    def resolve(self):
+        """Imports the module of the architecture, replaces the placeholders
+        of its names in the package and returns the real class or function.
+        """
+        module = importlib.import_module('.' + self.module_name, PACKAGE)
+        package = importlib.import_module(PACKAGE)
+        for name, module_name in architectures.items():
+            if module_name == self.module_name:
+                setattr(package, name, getattr(module, name))
+        return getattr(module, self.__name__)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return "<architecture %s of %s.%s, not imported>" % (self.__name__, PACKAGE, self.module_name)
+
+
+def resolve(name):
+    """The class or function of architecture name, importing its module."""
+    architecture = getattr(importlib.import_module(PACKAGE), name)
+    if isinstance(architecture, LazyArchitecture):
+        architecture = architecture.resolve()
+    return architecture
@@ -18,6 +18,8 @@ from collections import OrderedDict
 from .non_local.models.resnet import I3Res50, I3Res50_8x8
 
 from .BERT.bert import BERT, BERT2, BERT3, BERT4, BERT5, BERT6
+from .activation_checkpointing import run_checkpointed
+from .temporal_sampling import TemporalSampling
 
 
 __all__ = ['rgb_I3D64f_bert10','flow_I3D64f_bert10','rgb_I3D64f', 'flow_I3D64f', 'rgb_I3D64f_bert4X','pose_I3D64f_bert10'
@@ -130,7 +132,9 @@ class rgb_resnet50I3D32f(nn.Module):
         x = self.fc_action(x)
         return x
     
-class rgb_resnet50I3D64f_stride2(nn.Module):
+class rgb_resnet50I3D64f_stride2(TemporalSampling, nn.Module):
+    temporal_stride = 2
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet50I3D64f_stride2, self).__init__()
         self.num_classes=num_classes
@@ -148,7 +152,7 @@ class rgb_resnet50I3D64f_stride2(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = x[:, :, ::2, :, :]
+        x = self.temporal_input(x)
         x = self.features(x)
         x = self.avgpool(x)
         x = x.view(x.size(0), -1)
@@ -180,7 +184,9 @@ class rgb_resnet50I3D64f(nn.Module):
         x = self.fc_action(x)
         return x
     
-class rgb_resnet50I3D64f_8x8(nn.Module):
+class rgb_resnet50I3D64f_8x8(TemporalSampling, nn.Module):
+    temporal_stride = 2
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet50I3D64f_8x8, self).__init__()
         self.num_classes=num_classes
@@ -198,7 +204,7 @@ class rgb_resnet50I3D64f_8x8(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = x[:, :, ::2, :, :]
+        x = self.temporal_input(x)
         x = self.features(x)
         x = self.avgpool(x)
         x = x.view(x.size(0), -1)
@@ -282,7 +288,9 @@ class rgb_resnet50I3D64fNL(nn.Module):
         x = self.fc_action(x)
         return x
     
-class rgb_resnet50I3D64fNL_stride2(nn.Module):
+class rgb_resnet50I3D64fNL_stride2(TemporalSampling, nn.Module):
+    temporal_stride = 2
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet50I3D64fNL_stride2, self).__init__()
         self.num_classes=num_classes
@@ -300,7 +308,7 @@ class rgb_resnet50I3D64fNL_stride2(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = x[:, :, ::2, :, :]
+        x = self.temporal_input(x)
         x = self.features(x)
         x = self.avgpool(x)
         x = x.view(x.size(0), -1)
@@ -1141,6 +1149,10 @@ class InceptionI3d(nn.Module):
         http://arxiv.org/pdf/1409.4842v1.pdf.
     """
 
+    # Segments of the endpoints checkpointed while training, see
+    # models/activation_checkpointing.py. 0 keeps every activation.
+    checkpoint_segments = 0
+
     # Endpoints of the model in order. During construction, all the endpoints up
     # to a designated `final_endpoint` are returned in a dictionary as the
     # second return value.
@@ -1299,9 +1311,9 @@ class InceptionI3d(nn.Module):
             self.add_module(k, self.end_points[k])
         
     def forward(self, x):
-        for end_point in self.VALID_ENDPOINTS:
-            if end_point in self.end_points:
-                x = self._modules[end_point](x) # use _modules to work with dataparallel
+        x = run_checkpointed([self._modules[end_point] for end_point in self.VALID_ENDPOINTS
+                              if end_point in self.end_points], # use _modules to work with dataparallel
+                             self.checkpoint_segments, x)
 
         x = self.logits(self.dropout(self.avg_pool(x)))
         if self._spatial_squeeze:
@@ -1311,9 +1323,9 @@ class InceptionI3d(nn.Module):
         
 
     def extract_features(self, x):
-        for end_point in self.VALID_ENDPOINTS:
-            if end_point in self.end_points:
-                x = self._modules[end_point](x)
+        x = run_checkpointed([self._modules[end_point] for end_point in self.VALID_ENDPOINTS
+                              if end_point in self.end_points],
+                             self.checkpoint_segments, x)
         return self.avg_pool(x)
     
     
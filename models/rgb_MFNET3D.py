@@ -13,6 +13,8 @@ from collections import OrderedDict
 import torch.nn as nn
 import torch
 
+from .temporal_sampling import TemporalSampling
+
 
 __all__ = ['rgb_MFNET3D16f','rgb_MFNET3D_HMDB51', 'rgb_MFNET3D64f_16x4_ensemble_112', 'rgb_MFNET3D64f_16x4_ensemble2_112']
 
@@ -41,7 +43,9 @@ class rgb_MFNET3D16f(nn.Module):
         x = self.fc_action(x)
         return x
     
-class rgb_MFNET3D64f_16x4_ensemble_112(nn.Module):
+class rgb_MFNET3D64f_16x4_ensemble_112(TemporalSampling, nn.Module):
+    temporal_stride = 4
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_MFNET3D64f_16x4_ensemble_112, self).__init__()
         self.num_classes=num_classes
@@ -75,7 +79,7 @@ class rgb_MFNET3D64f_16x4_ensemble_112(nn.Module):
  
    
     def forward(self, x):
-        x = x[:, :, ::4, :, :]
+        x = self.temporal_input(x)
         x = self.model.forward_feature(x)
         x = self.avgpool(x)
         x = x.view(x.size(0), -1)
@@ -84,7 +88,7 @@ class rgb_MFNET3D64f_16x4_ensemble_112(nn.Module):
         return x
     
     def ensemble_forward(self, x):
-        x = x[:, :, ::4, :, :]
+        x = self.temporal_input(x)
         x = self.model.forward_feature(x)
         x = self.avgpool(x)
         x = x.view(x.size(0), -1)
@@ -124,7 +128,9 @@ class feature_projection_tail(nn.Module):
         x = self.relu(x)
         return x
     
-class rgb_MFNET3D64f_16x4_ensemble2_112(nn.Module):
+class rgb_MFNET3D64f_16x4_ensemble2_112(TemporalSampling, nn.Module):
+    temporal_stride = 4
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_MFNET3D64f_16x4_ensemble2_112, self).__init__()
         self.num_classes=num_classes
@@ -158,7 +164,7 @@ class rgb_MFNET3D64f_16x4_ensemble2_112(nn.Module):
  
    
     def forward(self, x):
-        x = x[:, :, ::4, :, :]
+        x = self.temporal_input(x)
         x = self.model.forward_feature2(x)
 
         feature1 = self.feature_projection1(x)
@@ -187,7 +193,7 @@ class rgb_MFNET3D64f_16x4_ensemble2_112(nn.Module):
         return x
     
     def ensemble_forward(self, x):
-        x = x[:, :, ::4, :, :]
+        x = self.temporal_input(x)
         x = self.model.forward_feature2(x)
 
         feature1 = self.feature_projection1(x)
@@ -16,6 +16,8 @@ from .r2plus1d import r2plus1d_34_32_ig65m, r2plus1d_34_32_kinetics, flow_r2plus
 
 from .representation_flow import resnet_50_rep_flow
 
+from .temporal_sampling import TemporalSampling
+
 
 __all__ = ['rgb_r2plus1d_32f_34', 'rgb_r2plus1d_kinetics_32f_34', 'rgb_rep_flow_32f_50',
            'rgb_r2plus1d_32f_34_deep', 'rgb_rep_flow_32f_50_ver2',
@@ -218,7 +220,9 @@ class rgb_r2plus1d_32f_34_bert10_untrained(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_r2plus1d_64f_34_bert10_stride2(nn.Module):
+class rgb_r2plus1d_64f_34_bert10_stride2(TemporalSampling, nn.Module):
+    temporal_stride = 2
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_r2plus1d_64f_34_bert10_stride2, self).__init__()
         self.hidden_size=512
@@ -242,7 +246,7 @@ class rgb_r2plus1d_64f_34_bert10_stride2(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = x[:, :, ::2, :, :]
+        x = self.temporal_input(x)
         x = self.features(x)
         x = self.avgpool(x)
         
@@ -614,15 +618,20 @@ class rgb_r2plus1d_32f_34_deep(nn.Module):
         start_pos = 2
         #For final index :5
         self.features1=nn.Sequential(*list(
-            r2plus1d_34_32_ig65m(359, pretrained=True, progress=True).children())[:start_pos]).to('cuda:0')
+            r2plus1d_34_32_ig65m(359, pretrained=True, progress=True).children())[:start_pos])
         
         self.features2=nn.Sequential(*list(
-            r2plus1d_34_32_ig65m(359, pretrained=True, progress=True).children())[start_pos:3]).to('cuda:1')
+            r2plus1d_34_32_ig65m(359, pretrained=True, progress=True).children())[start_pos:3])
         
+    def split(self, device1='cuda:0', device2='cuda:1'):
+        """Places features1 and features2 on two devices, returns self."""
+        self.features1.to(device1)
+        self.features2.to(device2)
+        return self
         
     def forward(self, x):
-        x = self.features1(x.to('cuda:0'))
-        x = self.features2(x.to('cuda:1'))
+        x = self.features1(x.to(next(self.features1.parameters()).device))
+        x = self.features2(x.to(next(self.features2.parameters()).device))
         return x
     
 class rgb_r2plus1d_kinetics_32f_34(nn.Module):
@@ -742,7 +751,9 @@ class flow_r2plus1d_64f_34_bert10(nn.Module):
         return x, input_vectors, sequenceOut, maskSample
     
     
-class rgb_r2plus1d_64f_34_bert10_stride2_MARS(nn.Module):
+class rgb_r2plus1d_64f_34_bert10_stride2_MARS(TemporalSampling, nn.Module):
+    temporal_stride = 2
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_r2plus1d_64f_34_bert10_stride2_MARS, self).__init__()
         self.hidden_size=512
@@ -766,7 +777,7 @@ class rgb_r2plus1d_64f_34_bert10_stride2_MARS(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = x[:, :, ::2, :, :]
+        x = self.temporal_input(x)
         x = self.features(x)
         x = self.avgpool(x)
         
@@ -786,7 +797,9 @@ class rgb_r2plus1d_64f_34_bert10_stride2_MARS(nn.Module):
     
     
     
-class rgb_r2plus1d_64f_34_bert10_stride2_MARS2(nn.Module):
+class rgb_r2plus1d_64f_34_bert10_stride2_MARS2(TemporalSampling, nn.Module):
+    temporal_stride = 2
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_r2plus1d_64f_34_bert10_stride2_MARS2, self).__init__()
         self.hidden_size=512
@@ -817,7 +830,7 @@ class rgb_r2plus1d_64f_34_bert10_stride2_MARS2(nn.Module):
         self.fc_action_mars2.bias.data.zero_()
         
     def forward(self, x):
-        x = x[:, :, ::2, :, :]
+        x = self.temporal_input(x)
         x = self.features(x)
         x = self.avgpool(x)
         
@@ -843,7 +843,7 @@ class rgb_resnet18_RankingBert8(nn.Module):
         random_selection_vector_numpy = np.random.randint(self.possibility_count, size = batch_size)
         x = x[np.array(range(batch_size)), 
               self.pertutation_matrix[:,random_selection_vector_numpy],:].permute([1,0,2])
-        random_selection_vector_tensor = torch.from_numpy(random_selection_vector_numpy).cuda()
+        random_selection_vector_tensor = torch.from_numpy(random_selection_vector_numpy).to(x.device)
         output , maskSample = self.bert(x)
         output=self.dp(output)
         classificationOut = output[:,0,:]
@@ -903,7 +903,7 @@ class rgb_resnet18_RankingBert8Seg3(nn.Module):
         random_selection_vector_numpy = np.random.randint(self.possibility_count, size = batch_size)
         x = x[np.array(range(batch_size)), 
               self.pertutation_matrix[:,random_selection_vector_numpy],:].permute([1,0,2])
-        random_selection_vector_tensor = torch.from_numpy(random_selection_vector_numpy).cuda()
+        random_selection_vector_tensor = torch.from_numpy(random_selection_vector_numpy).to(x.device)
         output , maskSample = self.bert(x)
         output=self.dp(output)
         classificationOut = output[:,0,:]
@@ -1048,7 +1048,24 @@ class rgb_resnet18_RankingBert10(nn.Module):
         x = self.fc_action(classificationOut)
         return x, sequenceRanked, sequenceOut
     
-class rgb_resnet18_bert10(nn.Module):
+class FrameFeatureBert(object):
+    """Mixin of the 2D BERT heads whose forward is a feature per frame
+    (frame_features) followed by BERT over the sequence of those features
+    (sequence_head). VideoStreamPrediction only reuses the features of the
+    frames of earlier windows for the models that implement both."""
+
+    def frame_features(self, x):
+        x = self.features1(x)
+        x = self.features2(x)
+        x = self.avgpool(x)
+        return x.view(x.size(0), -1)
+
+    def sequence_head(self, features):
+        output, _ = self.bert(features.view(-1, self.length, features.size(-1)))
+        return self.fc_action(self.dp(output[:, 0, :]))
+
+
+class rgb_resnet18_bert10(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet18_bert10, self).__init__()
         self.hidden_size=512
@@ -1078,10 +1095,7 @@ class rgb_resnet18_bert10(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,512)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1092,7 +1106,7 @@ class rgb_resnet18_bert10(nn.Module):
         return x, input_vectors, sequenceOut, maskSample
     
     
-class rgb_resnet18_bert10_full(nn.Module):
+class rgb_resnet18_bert10_full(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet18_bert10_full, self).__init__()
         self.hidden_size=512
@@ -1122,10 +1136,7 @@ class rgb_resnet18_bert10_full(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,512)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1301,7 +1312,7 @@ class rgb_resnet18_TSN(nn.Module):
         x = self.fc_action(x)
         return x, input_out, input_out, input_out
     
-class rgb_resnet18_bert10Y(nn.Module):
+class rgb_resnet18_bert10Y(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet18_bert10Y, self).__init__()
         self.hidden_size=512
@@ -1329,10 +1340,7 @@ class rgb_resnet18_bert10Y(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,512)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1342,7 +1350,7 @@ class rgb_resnet18_bert10Y(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_resnet34_bert10(nn.Module):
+class rgb_resnet34_bert10(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet34_bert10, self).__init__()
         self.hidden_size=512
@@ -1370,10 +1378,7 @@ class rgb_resnet34_bert10(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,512)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1383,7 +1388,7 @@ class rgb_resnet34_bert10(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_resnet50_bert10X(nn.Module):
+class rgb_resnet50_bert10X(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet50_bert10X, self).__init__()
         self.hidden_size=512
@@ -1411,12 +1416,11 @@ class rgb_resnet50_bert10X(nn.Module):
         torch.nn.init.xavier_uniform_(self.fc_action.weight)
         self.fc_action.bias.data.zero_()
         
+    def frame_features(self, x):
+        return self.mapper(FrameFeatureBert.frame_features(self, x))
+
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
-        x = self.mapper(x)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,512)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1426,7 +1430,7 @@ class rgb_resnet50_bert10X(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_resnet152_bert10(nn.Module):
+class rgb_resnet152_bert10(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet152_bert10, self).__init__()
         self.hidden_size=2048
@@ -1457,10 +1461,7 @@ class rgb_resnet152_bert10(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,self.hidden_size)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1470,7 +1471,7 @@ class rgb_resnet152_bert10(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_resnet152_bert10_light(nn.Module):
+class rgb_resnet152_bert10_light(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet152_bert10_light, self).__init__()
         self.hidden_size=512
@@ -1501,12 +1502,11 @@ class rgb_resnet152_bert10_light(nn.Module):
         torch.nn.init.xavier_uniform_(self.fc_action.weight)
         self.fc_action.bias.data.zero_()
         
+    def frame_features(self, x):
+        return self.reduction(FrameFeatureBert.frame_features(self, x))
+
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
-        x = self.reduction(x)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,self.hidden_size)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1517,7 +1517,7 @@ class rgb_resnet152_bert10_light(nn.Module):
         return x, input_vectors, sequenceOut, maskSample
     
     
-class rgb_resnet152_bert10X(nn.Module):
+class rgb_resnet152_bert10X(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet152_bert10X, self).__init__()
         self.hidden_size=512
@@ -1548,12 +1548,11 @@ class rgb_resnet152_bert10X(nn.Module):
         torch.nn.init.xavier_uniform_(self.fc_action.weight)
         self.fc_action.bias.data.zero_()
         
+    def frame_features(self, x):
+        return self.mapper(FrameFeatureBert.frame_features(self, x))
+
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
-        x = self.mapper(x)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,self.hidden_size)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -1563,7 +1562,7 @@ class rgb_resnet152_bert10X(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_resnet152_bert10XX(nn.Module):
+class rgb_resnet152_bert10XX(FrameFeatureBert, nn.Module):
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_resnet152_bert10XX, self).__init__()
         self.hidden_size=2048
@@ -1594,10 +1593,7 @@ class rgb_resnet152_bert10XX(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        x = self.features1(x)
-        x = self.features2(x)
-        x = self.avgpool(x)
-        x = x.view(x.size(0), -1)
+        x = self.frame_features(x)
         x = x.view(-1,self.length,self.hidden_size)
         input_vectors=x
         output , maskSample = self.bert(x)
@@ -21,13 +21,17 @@ from collections import OrderedDict
 
 from .BERT.bert import BERT, BERT2, BERT3, BERT4, BERT5, BERT6
 from .SlowFast.slowfast_connector import slowfast_50
+from .temporal_sampling import TemporalSampling
 
 
 __all__ = ['rgb_slowfast64f_50', 'rgb_slowfast64f_50_bert10', 'rgb_slowfast64f_50_bert10X', 'rgb_slowfast64f_50_bert9'
            ,'rgb_slowfast64f_50_bert10XX', 'rgb_slowfast64f_50_bert2', 'rgb_slowfast64f_50_bert10S', 'rgb_slowfast64f_50_bert10B',
            'rgb_slowfast64f_50_bert10SS_early', 'rgb_slowfast64f_50_bert10SS_late']
 
-class rgb_slowfast64f_50(nn.Module):
+class rgb_slowfast64f_50(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50, self).__init__()
         self.model = slowfast_50(modelPath)
@@ -40,16 +44,14 @@ class rgb_slowfast64f_50(nn.Module):
         self.fc_action.bias.data.zero_()
         self.model.head.projection = self.fc_action
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward([slow_input, fast_input])
         x = x.view(-1, self.num_classes)
         #x = self.model.forward([fast_input, slow_input])
         return x
     
     def mars_forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = self.avgpool(x[0])
         fast_feature = self.avgpool(x[1])
@@ -58,7 +60,10 @@ class rgb_slowfast64f_50(nn.Module):
         features = torch.cat([slow_feature, fast_feature], 1)
         return features
     
-class rgb_slowfast64f_50_bert10(nn.Module):
+class rgb_slowfast64f_50_bert10(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10, self).__init__()
         self.hidden_size=256
@@ -85,8 +90,7 @@ class rgb_slowfast64f_50_bert10(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -105,7 +109,10 @@ class rgb_slowfast64f_50_bert10(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_slowfast64f_50_bert10X(nn.Module):
+class rgb_slowfast64f_50_bert10X(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10X, self).__init__()
         self.hidden_size_fast=256
@@ -152,8 +159,7 @@ class rgb_slowfast64f_50_bert10X(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -178,7 +184,10 @@ class rgb_slowfast64f_50_bert10X(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_slowfast64f_50_bert10XX(nn.Module):
+class rgb_slowfast64f_50_bert10XX(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10XX, self).__init__()
         self.hidden_size_fast=256
@@ -226,8 +235,7 @@ class rgb_slowfast64f_50_bert10XX(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -252,7 +260,10 @@ class rgb_slowfast64f_50_bert10XX(nn.Module):
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
     
-class rgb_slowfast64f_50_bert9(nn.Module):
+class rgb_slowfast64f_50_bert9(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert9, self).__init__()
         self.hidden_size_fast=256
@@ -283,8 +294,7 @@ class rgb_slowfast64f_50_bert9(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -309,7 +319,10 @@ class rgb_slowfast64f_50_bert9(nn.Module):
         return x, input_vectors, sequenceOut, maskSample
     
 
-class rgb_slowfast64f_50_bert10S(nn.Module):
+class rgb_slowfast64f_50_bert10S(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10S, self).__init__()
         self.hidden_size_fast=128
@@ -376,8 +389,7 @@ class rgb_slowfast64f_50_bert10S(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -409,7 +421,10 @@ class rgb_slowfast64f_50_bert10S(nn.Module):
     
     
 
-class rgb_slowfast64f_50_bert10B(nn.Module):
+class rgb_slowfast64f_50_bert10B(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10B, self).__init__()
         self.hidden_size_fast=128
@@ -476,8 +491,7 @@ class rgb_slowfast64f_50_bert10B(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -505,7 +519,10 @@ class rgb_slowfast64f_50_bert10B(nn.Module):
         output=self.dp(classificationOut)
         x = self.fc_action(output)
         return x, input_vectors, sequenceOut, maskSample
-class rgb_slowfast64f_50_bert2(nn.Module):
+class rgb_slowfast64f_50_bert2(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert2, self).__init__()
         self.hidden_size_fast=256
@@ -552,8 +569,7 @@ class rgb_slowfast64f_50_bert2(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -622,7 +638,10 @@ class Bottleneck(nn.Module):
         return out
     
     
-class rgb_slowfast64f_50_bert10SS_early(nn.Module):
+class rgb_slowfast64f_50_bert10SS_early(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10SS_early, self).__init__()
         self.hidden_size_fast=128
@@ -694,8 +713,7 @@ class rgb_slowfast64f_50_bert10SS_early(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -723,7 +741,10 @@ class rgb_slowfast64f_50_bert10SS_early(nn.Module):
         return x, input_vectors, sequenceOut, maskSample
     
     
-class rgb_slowfast64f_50_bert10SS_late(nn.Module):
+class rgb_slowfast64f_50_bert10SS_late(TemporalSampling, nn.Module):
+    temporal_stride = 2
+    pathway_strides = (4, 1)
+
     def __init__(self, num_classes , length, modelPath=''):
         super(rgb_slowfast64f_50_bert10SS_late, self).__init__()
         self.hidden_size_fast=256
@@ -772,8 +793,7 @@ class rgb_slowfast64f_50_bert10SS_late(nn.Module):
         self.fc_action.bias.data.zero_()
         
     def forward(self, x):
-        fast_input = x[:, :, ::2, :, :]
-        slow_input = x[:, :, ::8, :, :]
+        slow_input, fast_input = self.pathway_inputs(x)
         x = self.model.forward_feature([slow_input, fast_input])
         slow_feature = x[0]
         fast_feature = x[1]
@@ -0,0 +1,74 @@
+"""
+Temporal sampling pattern of the architectures that subsample their clip.
+
+Several 64-frame architectures only look at every 2nd (r2plus1d stride2, I3D
+stride2, SlowFast fast pathway) or every 4th (MFNET 16x4) frame of their
+input, and the SlowFast slow pathway at every 8th. The loaders still read,
+decode, crop and normalize the whole clip, and the forward pass threw most
+of it away.
+
+Such an architecture is a TemporalSampling and declares its pattern:
+
+- temporal_stride, the stride of the frames it consumes in the clip;
+- pathway_strides, the strides of its pathways in those frames, (1,) for a
+  single pathway and (4, 1) for the slow and fast pathways of SlowFast.
+
+architecture_stride(arch) looks the stride up in the registry, so the trainers
+and the eval scripts give it to the datasets and to VideoSpatialPrediction3D_bert
+without importing the architecture module themselves. A model whose loader
+already applies the stride is switched to pre-strided input with
+set_pre_strided, and takes clips of len(range(0, span, temporal_stride))
+frames instead of span. Both read the same frames, so the checkpoints and
+the predictions do not change.
+"""
+
+from . import registry
+
+
+class TemporalSampling(object):
+    """Mixin of the architectures that subsample their input clip in time."""
+
+    temporal_stride = 1
+    pathway_strides = (1,)
+    pre_strided = False
+
+    def temporal_input(self, x):
+        """The frames of the clip x (N x C x T x H x W) the model consumes."""
+        if self.pre_strided:
+            return x
+        return x[:, :, ::self.temporal_stride]
+
+    def pathway_inputs(self, x):
+        """The input of every pathway, in the order of pathway_strides."""
+        x = self.temporal_input(x)
+        return [x[:, :, ::stride] for stride in self.pathway_strides]
+
+
+def architecture_stride(arch):
+    """The temporal_stride of architecture arch, 1 when it consumes every frame."""
+    return getattr(registry.resolve(arch), 'temporal_stride', 1)
+
+
+def strided_length(span, stride):
+    """Frames of a clip of span frames read with stride."""
+    return len(range(0, span, stride))
+
+
+def set_pre_strided(model, pre_strided=True):
+    """Whether the TemporalSampling modules of model take clips that are
+    already strided. Returns model.
+    """
+    for module in model.modules():
+        if isinstance(module, TemporalSampling):
+            module.pre_strided = pre_strided
+    return model
+
+
+def input_stride(model):
+    """The stride the loader of model applies: the temporal_stride of its
+    pre-strided TemporalSampling module, 1 when it strides its input itself.
+    """
+    for module in model.modules():
+        if isinstance(module, TemporalSampling) and module.pre_strided:
+            return module.temporal_stride
+    return 1
@@ -2,6 +2,8 @@ import math
 import torch
 from torch.optim import Optimizer
 
+_FOREACH = hasattr(torch, '_foreach_addcdiv_')
+
 
 class AdamW(Optimizer):
     r"""Implements AdamW algorithm.
@@ -21,6 +23,18 @@ class AdamW(Optimizer):
         amsgrad (boolean, optional): whether to use the AMSGrad variant of this
             algorithm from the paper `On the Convergence of Adam and Beyond`_
             (default: False)
+        foreach (boolean, optional): whether to use the multi-tensor update
+            (default: None, where available)
+
+    With foreach (the default where torch has the torch._foreach_*
+    kernels), the parameters of a group are updated together, with one
+    kernel launch per operation for all of them instead of one per
+    parameter. The update and the state_dict are the same either way.
+
+    Parameters in half precision are updated through a float32 master copy
+    kept in the optimizer state, with float32 moments, and then copied back,
+    so small updates are not lost to fp16 rounding. Gradients scaled by the
+    GradScaler of utils/mixed_precision.py are unscaled before step().
 
     .. _Adam\: A Method for Stochastic Optimization:
         https://arxiv.org/abs/1412.6980
@@ -31,7 +45,7 @@ class AdamW(Optimizer):
     """
 
     def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8,
-                 weight_decay=1e-2, amsgrad=False):
+                 weight_decay=1e-2, amsgrad=False, foreach=None):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
         if not 0.0 <= eps:
@@ -40,14 +54,18 @@ class AdamW(Optimizer):
             raise ValueError("Invalid beta parameter at index 0: {}".format(betas[0]))
         if not 0.0 <= betas[1] < 1.0:
             raise ValueError("Invalid beta parameter at index 1: {}".format(betas[1]))
+        if foreach and not _FOREACH:
+            raise ValueError("This version of torch has no multi-tensor (foreach) kernels")
         defaults = dict(lr=lr, betas=betas, eps=eps,
-                        weight_decay=weight_decay, amsgrad=amsgrad)
+                        weight_decay=weight_decay, amsgrad=amsgrad,
+                        foreach=_FOREACH if foreach is None else foreach)
         super(AdamW, self).__init__(params, defaults)
 
     def __setstate__(self, state):
         super(AdamW, self).__setstate__(state)
         for group in self.param_groups:
             group.setdefault('amsgrad', False)
+            group.setdefault('foreach', _FOREACH)
 
     def step(self, closure=None):
         """Performs a single optimization step.
@@ -61,14 +79,11 @@ class AdamW(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            buckets = {}
             for p in group['params']:
                 if p.grad is None:
                     continue
 
-                # Perform stepweight decay
-                p.data.mul_(1 - group['lr'] * group['weight_decay'])
-
-                # Perform optimization step
                 grad = p.grad.data
                 if grad.is_sparse:
                     raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
@@ -79,37 +94,99 @@ class AdamW(Optimizer):
                 # State initialization
                 if len(state) == 0:
                     state['step'] = 0
+                    if p.data.dtype != torch.float32:
+                        # float32 master weights of a half precision parameter
+                        state['master_param'] = p.data.float()
+                    param = state.get('master_param', p.data)
                     # Exponential moving average of gradient values
-                    state['exp_avg'] = torch.zeros_like(p.data)
+                    state['exp_avg'] = torch.zeros_like(param)
                     # Exponential moving average of squared gradient values
-                    state['exp_avg_sq'] = torch.zeros_like(p.data)
+                    state['exp_avg_sq'] = torch.zeros_like(param)
                     if amsgrad:
                         # Maintains max of all exp. moving avg. of sq. grad. values
-                        state['max_exp_avg_sq'] = torch.zeros_like(p.data)
-
-                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
-                if amsgrad:
-                    max_exp_avg_sq = state['max_exp_avg_sq']
-                beta1, beta2 = group['betas']
+                        state['max_exp_avg_sq'] = torch.zeros_like(param)
 
+                param = state.get('master_param', p.data)
+                if grad.dtype != param.dtype:
+                    grad = grad.to(param.dtype)
                 state['step'] += 1
-                bias_correction1 = 1 - beta1 ** state['step']
-                bias_correction2 = 1 - beta2 ** state['step']
-
-                # Decay the first and second moment running average coefficient
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
-                exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
-                if amsgrad:
-                    # Maintains the maximum of all 2nd moment running avg. till now
-                    torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
-                    # Use the max. for normalizing running avg. of gradient
-                    denom = (max_exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
-                else:
-                    denom = (exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
 
-                step_size = group['lr'] / bias_correction1
+                if group['foreach']:
+                    # tensors that share a kernel launch: same device, dtype
+                    # and bias correction
+                    key = (param.device, param.dtype, state['step'])
+                    buckets.setdefault(key, []).append((p, param, grad, state))
+                else:
+                    _single_tensor_step(group, param, grad, state)
+                    if 'master_param' in state:
+                        p.data.copy_(param)
 
-                p.data.addcdiv_(-step_size, exp_avg, denom)
+            for (_, _, step), bucket in buckets.items():
+                _multi_tensor_step(group, step, bucket)
 
         return loss
 
+
+
+def _single_tensor_step(group, param, grad, state):
+    """AdamW update of one parameter, a few small kernels each."""
+    amsgrad = group['amsgrad']
+    beta1, beta2 = group['betas']
+    bias_correction1 = 1 - beta1 ** state['step']
+    bias_correction2 = 1 - beta2 ** state['step']
+    exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+
+    # Perform stepweight decay
+    param.mul_(1 - group['lr'] * group['weight_decay'])
+
+    # Decay the first and second moment running average coefficient
+    exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
+    exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+    if amsgrad:
+        max_exp_avg_sq = state['max_exp_avg_sq']
+        # Maintains the maximum of all 2nd moment running avg. till now
+        torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
+        # Use the max. for normalizing running avg. of gradient
+        denom = (max_exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+    else:
+        denom = (exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+
+    step_size = group['lr'] / bias_correction1
+    param.addcdiv_(exp_avg, denom, value=-step_size)
+
+
+def _multi_tensor_step(group, step, bucket):
+    """The same update as _single_tensor_step for a bucket of parameters
+    at the same step, with one torch._foreach_* kernel launch per operation
+    for the whole bucket instead of one per parameter.
+    """
+    beta1, beta2 = group['betas']
+    bias_correction1 = 1 - beta1 ** step
+    bias_correction2 = 1 - beta2 ** step
+    params = [param for _, param, _, _ in bucket]
+    grads = [grad for _, _, grad, _ in bucket]
+    exp_avgs = [state['exp_avg'] for _, _, _, state in bucket]
+    exp_avg_sqs = [state['exp_avg_sq'] for _, _, _, state in bucket]
+
+    torch._foreach_mul_(params, 1 - group['lr'] * group['weight_decay'])
+
+    torch._foreach_mul_(exp_avgs, beta1)
+    torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+    torch._foreach_mul_(exp_avg_sqs, beta2)
+    torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+    if group['amsgrad']:
+        max_exp_avg_sqs = [state['max_exp_avg_sq'] for _, _, _, state in bucket]
+        for max_exp_avg_sq, exp_avg_sq in zip(max_exp_avg_sqs, exp_avg_sqs):
+            torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
+        denoms = torch._foreach_sqrt(max_exp_avg_sqs)
+    else:
+        denoms = torch._foreach_sqrt(exp_avg_sqs)
+    torch._foreach_div_(denoms, math.sqrt(bias_correction2))
+    torch._foreach_add_(denoms, group['eps'])
+
+    step_size = group['lr'] / bias_correction1
+    torch._foreach_addcdiv_(params, exp_avgs, denoms, value=-step_size)
+    for p, _, _, state in bucket:
+        master_param = state.get('master_param')
+        if master_param is not None:
+            p.data.copy_(master_param)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputes the frozen features1 activations of 2D models such as
+rgb_resnet18_bert10 or rgb_resnet18_lstmType2 for a dataset split.
+
+Every training clip is stored for --draws (offsets, crop) draws and every
+validation clip once with the center crop, as float16 in a memory-mapped
+utils.feature_bank.FeatureBank under <out-dir>/<dataset>_<arch>_split<s>/
+{train,val}. two_stream_bert.py --feature-cache then trains the heads from
+these activations without decoding frames or running features1.
+
+features1 runs in eval mode, so its batch norm uses the running statistics
+also at training time.
+
+usage: python precompute_features.py -d window -a rgb_resnet18_bert10 --num-seg 16 --draws 8
+"""
+
+import os
+import sys
+import argparse
+
+import torch
+import torch.utils.data
+
+import video_transforms
+import models
+import datasets
+from utils.feature_bank import FeatureBank
+from utils.frozen_features import frozen_features
+from datasets.teacher_bank import TeacherBankSampling
+
+
+model_names = sorted(name for name in models.__dict__
+    if not name.startswith("__")
+    and callable(models.__dict__[name]))
+
+parser = argparse.ArgumentParser(description='Precompute frozen features1 activations')
+parser.add_argument('--settings', metavar='DIR', default='./datasets/settings',
+                    help='path to datset setting files')
+parser.add_argument('--dataset', '-d', default='window',
+                    choices=["ucf101", "hmdb51", "smtV2", "window"],
+                    help='dataset: ucf101 | hmdb51 | smtV2 | window')
+parser.add_argument('--arch', '-a', metavar='ARCH', default='rgb_resnet18_bert10',
+                    choices=model_names,
+                    help='model architecture with a frozen features1 (default: rgb_resnet18_bert10)')
+parser.add_argument('-s', '--split', default=1, type=int, metavar='S',
+                    help='which split of data to work on (default: 1)')
+parser.add_argument('-j', '--workers', default=4, type=int, metavar='N',
+                    help='number of data loading workers (default: 4)')
+parser.add_argument('-b', '--batch-size', default=8, type=int,
+                    metavar='N', help='mini-batch size (default: 8)')
+parser.add_argument('--new_width', default=340, type=int,
+                    metavar='N', help='resize width (default: 340)')
+parser.add_argument('--new_height', default=256, type=int,
+                    metavar='N', help='resize height (default: 256)')
+parser.add_argument('--num-seg', default=16, type=int,
+                    metavar='N', help='Number of segments (default: 16)')
+parser.add_argument('--draws', default=4, type=int, metavar='N',
+                    help='random (offsets, crop) draws stored per training clip (default: 4)')
+parser.add_argument('--out-dir', default='./features', type=str, metavar='DIR',
+                    help='directory to write the feature banks to (default: ./features)')
+
+dataset_classes = {'ucf101': 101, 'hmdb51': 51, 'smtV2': 174, 'window': 3}
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def precompute(features1, dataset, crop_transform, augmentation, bank, draws):
+    loader = torch.utils.data.DataLoader(
+        TeacherBankSampling(dataset, crop_transform),
+        batch_size=args.batch_size, shuffle=False,
+        num_workers=args.workers, pin_memory=True)
+    with torch.no_grad():
+        for draw in range(draws):
+            for inputs, _, keys in loader:
+                inputs = augmentation(inputs[0].to(device), inputs[1].to(device))
+                features = features1(inputs.view(-1, 3, 224, 224))
+                features = features.view((-1, args.num_seg) + features.shape[1:])
+                features = features.half().cpu().numpy()
+                for key, feature in zip(keys, features):
+                    bank.add(key.tolist(), feature)
+            bank.flush()
+            print('draw %d/%d: %d entries in %s' % (draw + 1, draws, len(bank), bank.path))
+
+
+def main():
+    global args
+    args = parser.parse_args()
+
+    modality = args.arch.split('_')[0]
+    if modality != "rgb":
+        print("Only rgb models have a frozen features1, got %s" % (args.arch))
+        sys.exit()
+    model = models.__dict__[args.arch](modelPath='', num_classes=dataset_classes[args.dataset],
+                                       length=args.num_seg)
+    features1 = frozen_features(model)
+    if features1 is None:
+        print("%s has no frozen features1 to precompute" % (args.arch))
+        sys.exit()
+    features1 = features1.to(device).eval()
+
+    scale_ratios = [1.0, 0.875, 0.75, 0.66]
+    clip_mean = [0.485, 0.456, 0.406] * args.num_seg
+    clip_std = [0.229, 0.224, 0.225] * args.num_seg
+    augmentation = video_transforms.DeviceClipAugmentation((224, 224), clip_mean, clip_std).to(device)
+
+    dataset_path = './datasets/%s_frames' % (args.dataset)
+    cache_path = os.path.join(args.out_dir, "%s_%s_split%d" % (args.dataset, args.arch, args.split))
+    phases = [("train", video_transforms.MultiScaleCropParameters((224, 224), scale_ratios), args.draws),
+              ("val", video_transforms.CenterCropParameters((224)), 1)]
+    for phase, crop_transform, draws in phases:
+        split_file = os.path.join(args.settings, args.dataset, "%s_%s_split%d.txt" % (phase, modality, args.split))
+        dataset = datasets.__dict__[args.dataset](root=dataset_path,
+                                                  source=split_file,
+                                                  phase=phase,
+                                                  modality=modality,
+                                                  is_color=True,
+                                                  new_length=1,
+                                                  new_width=args.new_width,
+                                                  new_height=args.new_height,
+                                                  num_segments=args.num_seg)
+        bank_path = os.path.join(cache_path, phase)
+        if os.path.exists(os.path.join(bank_path, 'keys.json')):
+            print("%s already holds %s features, delete it to recompute" % (bank_path, phase))
+            continue
+        bank = FeatureBank(bank_path, capacity=draws * len(dataset), dtype='float16')
+        precompute(features1, dataset, crop_transform, augmentation, bank, draws)
+    print("Train the heads with: python two_stream_bert.py -d %s -a %s --num-seg %d --feature-cache %s"
+          % (args.dataset, args.arch, args.num_seg, cache_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parity check and microbenchmark of the 'sdpa' attention backend of
+models/BERT against the 'dense' one.
+
+Copies the weights of a dense MultiHeadedAttention, MultiHeadedAttention2,
+BERT5 and BERT5_BOTH into their sdpa versions, checks that both give the
+same outputs for the same Bernoulli sample (training) and without a sample
+(eval), then reports forward+backward time of both backends.
+
+usage: python attention_benchmark.py [--batch-size 32 --length 16 --hidden 512 --heads 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+from models.BERT.bert import BERT5, BERT5_BOTH, attention_mask
+from models.BERT.attention import MultiHeadedAttention, MultiHeadedAttention2
+
+
+parser = argparse.ArgumentParser(description='BERT attention backend benchmark')
+parser.add_argument('-b', '--batch-size', default=32, type=int, metavar='N',
+                    help='batch size (default: 32)')
+parser.add_argument('--length', default=16, type=int, metavar='N',
+                    help='sequence length without the classification token (default: 16)')
+parser.add_argument('--hidden', default=512, type=int, metavar='N',
+                    help='hidden size (default: 512)')
+parser.add_argument('--heads', default=8, type=int, metavar='N',
+                    help='attention heads (default: 8)')
+parser.add_argument('--iterations', default=20, type=int, metavar='N',
+                    help='timed iterations (default: 20)')
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def pair(build):
+    """The dense and sdpa versions of a module, with the same weights."""
+    dense = build('dense').to(device)
+    sdpa = build('sdpa').to(device)
+    sdpa.load_state_dict(dense.state_dict())
+    return dense, sdpa
+
+
+def sample_mask(batch_size, seq_len):
+    sample = (torch.rand(batch_size, seq_len, device=device) < 0.8).float()
+    sample[:, 0] = 1
+    return sample
+
+
+def max_difference(a, b):
+    if isinstance(a, tuple):
+        return max(max_difference(x, y) for x, y in zip(a, b) if x is not None)
+    return (a - b).abs().max().item()
+
+
+def timed(run):
+    run()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.iterations):
+        run()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return 1000 * (time.time() - start) / args.iterations
+
+
+def check_attention(name, build):
+    dense, sdpa = pair(build)
+    dense.eval()
+    sdpa.eval()
+    seq_len = args.length + 1
+    x = torch.randn(args.batch_size, seq_len, args.hidden, device=device, requires_grad=True)
+    y = torch.randn(args.batch_size, seq_len, args.hidden, device=device)
+    sample = sample_mask(args.batch_size, seq_len)
+
+    def inputs(backend, sample):
+        mask = attention_mask(sample, args.batch_size, seq_len, device, backend)
+        if isinstance(dense, MultiHeadedAttention2):
+            return (x, y, mask)
+        return (x, x, x, mask)
+
+    for current in (sample, None):
+        difference = max_difference(dense(*inputs('dense', current)), sdpa(*inputs('sdpa', current)))
+        print('%-22s %-9s max |dense - sdpa| = %.2e' % (name, 'masked' if current is not None else 'unmasked',
+                                                       difference))
+
+    def step(module, backend):
+        def run():
+            output = module(*inputs(backend, sample))
+            output = output[0] if isinstance(output, tuple) else output
+            output.sum().backward()
+        return run
+    print('%-22s dense %.2f ms, sdpa %.2f ms per forward+backward'
+          % (name, timed(step(dense, 'dense')), timed(step(sdpa, 'sdpa'))))
+
+
+def check_bert(name, build, streams):
+    dense, sdpa = pair(build)
+    inputs = [torch.randn(args.batch_size, args.length, args.hidden, device=device) for _ in range(streams)]
+    for training in (True, False):
+        dense.train(training)
+        sdpa.train(training)
+        # dropout is the only other randomness, turn it off for the comparison
+        for module in list(dense.modules()) + list(sdpa.modules()):
+            if isinstance(module, torch.nn.Dropout):
+                module.p = 0.0
+        torch.manual_seed(0)
+        dense_output = dense(*inputs)
+        torch.manual_seed(0)
+        sdpa_output = sdpa(*inputs)
+        print('%-22s %-9s max |dense - sdpa| = %.2e' % (name, 'train' if training else 'eval',
+                                                       max_difference(dense_output, sdpa_output)))
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    print('torch %s on %s' % (torch.__version__, device))
+    check_attention('MultiHeadedAttention', lambda backend: MultiHeadedAttention(
+        args.heads, args.hidden, attention_backend=backend))
+    check_attention('MultiHeadedAttention2', lambda backend: MultiHeadedAttention2(
+        args.heads, args.hidden, attention_backend=backend))
+    check_bert('BERT5', lambda backend: BERT5(
+        args.hidden, args.length, hidden=args.hidden, n_layers=1, attn_heads=args.heads,
+        attention_backend=backend), 1)
+    check_bert('BERT5_BOTH', lambda backend: BERT5_BOTH(
+        args.hidden, args.length, hidden=args.hidden, n_layers=1, attn_heads=args.heads,
+        attention_backend=backend), 2)
+
+
+if __name__ == '__main__':
+    main()
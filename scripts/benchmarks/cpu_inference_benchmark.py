@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU inference throughput of the models served on CPU-only nodes.
+
+Builds each architecture on the CPU, optionally loads a trained
+model_best.pth.tar, and reports clips/sec of the forward pass in eval mode
+for a few batch sizes. A model that allocates on CUDA anywhere fails here
+instead of on the inference nodes.
+
+usage: python cpu_inference_benchmark.py [-a rgb_resnet18_bert10 rgb_r2plus1d_32f_34_bert10 -b 1 4 --threads 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+import models
+
+
+parser = argparse.ArgumentParser(description='CPU inference throughput benchmark')
+parser.add_argument('--arch', '-a', nargs='+',
+                    default=['rgb_resnet18_bert10', 'rgb_r2plus1d_32f_34_bert10'],
+                    help='architectures to benchmark (default: rgb_resnet18_bert10 rgb_r2plus1d_32f_34_bert10)')
+parser.add_argument('-b', '--batch-size', nargs='+', default=[1, 4], type=int,
+                    help='clips per forward pass (default: 1 4)')
+parser.add_argument('--num-seg', default=16, type=int, metavar='N',
+                    help='segments of the 2D models (default: 16)')
+parser.add_argument('--num-classes', default=101, type=int, metavar='N',
+                    help='number of classes (default: 101)')
+parser.add_argument('--checkpoint', default='', type=str, metavar='PATH',
+                    help='model_best.pth.tar to load, only with a single --arch (default: none)')
+parser.add_argument('--iterations', default=10, type=int, metavar='N',
+                    help='timed forward passes per batch size (default: 10)')
+parser.add_argument('--warmup', default=2, type=int, metavar='N',
+                    help='untimed forward passes per batch size (default: 2)')
+parser.add_argument('--threads', default=0, type=int, metavar='N',
+                    help='torch intra-op threads, 0 keeps the default (default: 0)')
+
+
+def clip_shape(arch, num_seg):
+    """Input shape of one clip, as built by the eval scripts."""
+    if '3D' in arch or 'r2plus1d' in arch or 'I3D' in arch:
+        if '64f' in arch:
+            length = 64
+        elif '32f' in arch:
+            length = 32
+        elif '8f' in arch:
+            length = 8
+        else:
+            length = 16
+        size = 224 if ('224' in arch or 'I3D' in arch) else 112
+        return 1, (3, length, size, size)
+    return num_seg, (3, 224, 224)
+
+
+def benchmark(arch):
+    rows, shape = clip_shape(arch, args.num_seg)
+    length = 1 if rows == 1 else rows
+    model = models.__dict__[arch](modelPath='', num_classes=args.num_classes, length=length)
+    if args.checkpoint:
+        params = torch.load(args.checkpoint, map_location='cpu')
+        model.load_state_dict(params['state_dict'])
+    model.eval()
+
+    for batch_size in args.batch_size:
+        inputs = torch.randn((batch_size * rows,) + shape)
+        with torch.no_grad():
+            for _ in range(args.warmup):
+                model(inputs)
+            start = time.time()
+            for _ in range(args.iterations):
+                model(inputs)
+            elapsed = time.time() - start
+        print('%-32s batch %3d: %8.2f clips/sec  %8.1f ms/batch'
+              % (arch, batch_size, batch_size * args.iterations / elapsed,
+                 1000 * elapsed / args.iterations))
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    if args.checkpoint and len(args.arch) > 1:
+        print("--checkpoint needs a single --arch")
+        sys.exit()
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    print('torch %s, %d threads' % (torch.__version__, torch.get_num_threads()))
+    for arch in args.arch:
+        benchmark(arch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latency of the eager, TorchScript and ONNX Runtime inference of the exported
+BERT heads (see models/export.py).
+
+Each architecture is built with random weights (or a trained
+model_best.pth.tar), exported to a temporary directory and run on the same
+random clips by every runtime. The max |eager - exported| of the logits is
+printed with the latency. ONNX Runtime is skipped when it is not installed.
+
+usage: python export_benchmark.py [-a rgb_r2plus1d_64f_34_bert10 rgb_I3D64f_bert2 -b 1 4 --device cuda]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../eval_ucf101_pytorch"))
+import models
+from models.export import inference_model, export_torchscript, export_onnx
+from ExportedModel import load_exported, onnxruntime
+from cpu_inference_benchmark import clip_shape
+
+
+parser = argparse.ArgumentParser(description='Exported model latency benchmark')
+parser.add_argument('--arch', '-a', nargs='+',
+                    default=['rgb_resneXt3D64f101_bertS', 'rgb_r2plus1d_64f_34_bert10', 'rgb_I3D64f_bert2'],
+                    help='architectures to benchmark (default: rgb_resneXt3D64f101_bertS '
+                         'rgb_r2plus1d_64f_34_bert10 rgb_I3D64f_bert2)')
+parser.add_argument('-b', '--batch-size', nargs='+', default=[1, 4], type=int,
+                    help='clips per forward pass (default: 1 4)')
+parser.add_argument('--num-classes', default=51, type=int, metavar='N',
+                    help='number of classes (default: 51)')
+parser.add_argument('--checkpoint', default='', type=str, metavar='PATH',
+                    help='model_best.pth.tar to load, only with a single --arch (default: none)')
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu', type=str,
+                    help='device of the benchmark (default: cuda when available)')
+parser.add_argument('--iterations', default=10, type=int, metavar='N',
+                    help='timed forward passes per batch size (default: 10)')
+parser.add_argument('--warmup', default=3, type=int, metavar='N',
+                    help='untimed forward passes per batch size (default: 3)')
+
+
+def latency(net, inputs):
+    """Milliseconds per forward pass of net on inputs."""
+    with torch.no_grad():
+        for _ in range(args.warmup):
+            net(inputs)
+        if inputs.is_cuda:
+            torch.cuda.synchronize()
+        start = time.time()
+        for _ in range(args.iterations):
+            net(inputs)
+        if inputs.is_cuda:
+            torch.cuda.synchronize()
+    return 1000 * (time.time() - start) / args.iterations
+
+
+def logits(net, inputs):
+    with torch.no_grad():
+        output = net(inputs)
+    return output[0] if isinstance(output, tuple) else output
+
+
+def benchmark(arch, directory):
+    _, shape = clip_shape(arch, 1)
+    model = models.__dict__[arch](modelPath='', num_classes=args.num_classes, length=1)
+    if args.checkpoint:
+        params = torch.load(args.checkpoint, map_location='cpu')
+        model.load_state_dict({k[7:] if k.startswith('module.') else k: v
+                               for k, v in params['state_dict'].items()})
+    model.to(args.device)
+    example = torch.randn((2,) + shape, device=args.device)
+
+    runtimes = [('eager', inference_model(model))]
+    path = os.path.join(directory, arch + '.pt')
+    export_torchscript(model, example, path)
+    runtimes.append(('torchscript', load_exported(path, arch, args.device)))
+    if onnxruntime is not None:
+        path = os.path.join(directory, arch + '.onnx')
+        export_onnx(model, example, path)
+        runtimes.append(('onnx', load_exported(path, arch, args.device)))
+
+    for batch_size in args.batch_size:
+        inputs = torch.randn((batch_size,) + shape, device=args.device)
+        reference = logits(runtimes[0][1], inputs)
+        for name, net in runtimes:
+            difference = (logits(net, inputs) - reference).abs().max().item()
+            print('%-30s %-12s batch %3d: %8.1f ms/batch  max |eager - exported| %.2e'
+                  % (arch, name, batch_size, latency(net, inputs), difference))
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    if args.checkpoint and len(args.arch) > 1:
+        print("--checkpoint needs a single --arch")
+        sys.exit()
+    print('torch %s on %s, onnxruntime %s' % (torch.__version__, args.device,
+                                                onnxruntime.__version__ if onnxruntime is not None else 'missing'))
+    directory = tempfile.mkdtemp()
+    try:
+        for arch in args.arch:
+            benchmark(arch, directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
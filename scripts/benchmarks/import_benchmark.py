@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold start time of `import models` in the training and eval scripts.
+
+Every measurement runs in a fresh interpreter:
+
+    torch     import torch, which every script pays anyway
+    lazy      import models, with the lazy registry
+    resolve   import models and build the classes of the given architectures
+    eager     import models and every architecture module, as the star imports
+              of models/__init__.py did before the registry
+
+usage: python import_benchmark.py [-a rgb_resnet18_bert10 rgb_r2plus1d_32f_34_bert10 --runs 5]
+"""
+
+import os
+import sys
+import subprocess
+import argparse
+import numpy as np
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../")
+
+parser = argparse.ArgumentParser(description='models import time benchmark')
+parser.add_argument('--arch', '-a', nargs='+',
+                    default=['rgb_resnet18_bert10', 'rgb_r2plus1d_32f_34_bert10'],
+                    help='architectures resolved in the resolve case (default: rgb_resnet18_bert10 rgb_r2plus1d_32f_34_bert10)')
+parser.add_argument('--runs', default=5, type=int, metavar='N',
+                    help='fresh interpreters per case (default: 5)')
+
+TIMER = "import sys, time\nsys.argv = ['import_benchmark']\nstart = time.time()\n%s\nprint(time.time() - start)\n"
+
+
+def cases(archs):
+    return [
+        ('torch', "import torch"),
+        ('lazy', "import torch\nimport models"),
+        ('resolve', "import torch\nimport models\n" +
+         "".join("if isinstance(models.__dict__[%r], models.registry.LazyArchitecture):\n"
+                 "    models.__dict__[%r].resolve()\n" % (arch, arch) for arch in archs)),
+        ('eager', "import torch\nimport importlib\nimport models\n"
+         "for module_name in models.registry.ARCHITECTURE_MODULES:\n"
+         "    importlib.import_module('models.' + module_name)"),
+    ]
+
+
+def cold_import_time(code):
+    output = subprocess.check_output([sys.executable, '-c', TIMER % (code)], cwd=ROOT)
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    global args
+    args = parser.parse_args()
+
+    for name, code in cases(args.arch):
+        times = [cold_import_time(code) for _ in range(args.runs)]
+        print('%-8s median %8.1f ms  min %8.1f ms' % (name, np.median(times) * 1000, np.min(times) * 1000))
+
+if __name__ == "__main__":
+    main()
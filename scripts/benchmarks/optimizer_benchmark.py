@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Step time of opt.AdamW with the per-parameter update (foreach=False) and the
+multi-tensor update (foreach=True).
+
+Each architecture is built with random weights and random gradients, and
+both optimizers step copies of the same parameters with the same gradients.
+The max |per-parameter - multi-tensor| of the parameters after the timed
+steps is printed with the step times.
+
+Before that, check_float32_parity steps a few float32 CPU parameters with
+both updates, with and without amsgrad, and asserts that they end up
+identical and without a float32 master copy in the optimizer state.
+
+usage: python optimizer_benchmark.py [-a rgb_resneXt3D64f101_bert10S rgb_r2plus1d_64f_34_bert10 --device cuda]
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+import models
+from opt.AdamW import AdamW, _FOREACH
+
+
+parser = argparse.ArgumentParser(description='AdamW step time benchmark')
+parser.add_argument('--arch', '-a', nargs='+',
+                    default=['rgb_resneXt3D64f101_bert10S', 'rgb_r2plus1d_64f_34_bert10'],
+                    help='architectures to benchmark (default: rgb_resneXt3D64f101_bert10S rgb_r2plus1d_64f_34_bert10)')
+parser.add_argument('--num-classes', default=51, type=int, metavar='N',
+                    help='number of classes (default: 51)')
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu', type=str,
+                    help='device of the benchmark (default: cuda when available)')
+parser.add_argument('--iterations', default=20, type=int, metavar='N',
+                    help='timed steps per optimizer (default: 20)')
+parser.add_argument('--warmup', default=3, type=int, metavar='N',
+                    help='untimed steps per optimizer (default: 3)')
+
+
+def synchronize():
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+def step_time(optimizer):
+    """Milliseconds per optimizer.step()."""
+    for _ in range(args.warmup):
+        optimizer.step()
+    synchronize()
+    start = time.time()
+    for _ in range(args.iterations):
+        optimizer.step()
+    synchronize()
+    return 1000 * (time.time() - start) / args.iterations
+
+
+def check_float32_parity(steps=5):
+    """Asserts that the per-parameter and the multi-tensor updates of
+    float32 CPU parameters are identical.
+    """
+    shapes = [(64, 32), (32,), (3, 3, 7, 7), (1,)]
+    for amsgrad in (False, True):
+        results = {}
+        for foreach in (False, True):
+            torch.manual_seed(1)
+            params = [torch.nn.Parameter(torch.randn(shape)) for shape in shapes]
+            optimizer = AdamW(params, lr=1e-3, weight_decay=1e-2, amsgrad=amsgrad, foreach=foreach)
+            for _ in range(steps):
+                for param in params:
+                    param.grad = torch.randn_like(param)
+                optimizer.step()
+            assert all('master_param' not in optimizer.state[param] for param in params)
+            results[foreach] = params
+        assert all(torch.equal(a, b) for a, b in zip(results[False], results[True]))
+    print('float32 per-parameter and multi-tensor updates are identical')
+
+
+def benchmark(arch):
+    model = models.__dict__[arch](modelPath='', num_classes=args.num_classes, length=1).to(args.device)
+    for param in model.parameters():
+        param.grad = torch.randn_like(param) * 1e-3
+    params = [param for param in model.parameters() if param.requires_grad]
+
+    times = {}
+    results = {}
+    for foreach in (False, True):
+        copies = [copy.deepcopy(param) for param in params]
+        for param, source in zip(copies, params):
+            param.grad = source.grad.clone()
+        optimizer = AdamW(copies, lr=1e-5, weight_decay=1e-3, foreach=foreach)
+        times[foreach] = step_time(optimizer)
+        results[foreach] = copies
+    difference = max((a - b).abs().max().item() for a, b in zip(results[False], results[True]))
+    print('%-30s %4d tensors %6.1fM parameters: per-parameter %8.2f ms/step  multi-tensor %8.2f ms/step  '
+          'max |difference| %.2e'
+          % (arch, len(params), sum(param.numel() for param in params) / 1e6,
+             times[False], times[True], difference))
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    print('torch %s on %s' % (torch.__version__, args.device))
+    if not _FOREACH:
+        print('torch %s has no multi-tensor (foreach) kernels' % (torch.__version__))
+        return
+    check_float32_parity()
+    for arch in args.arch:
+        benchmark(arch)
+
+
+if __name__ == '__main__':
+    main()
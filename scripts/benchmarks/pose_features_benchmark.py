@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the clip-level pose features of ReadSegmentPoseRaw and
+ReadSegmentPoseRaw2 (datasets/pose_store.py) against the previous
+frame-by-frame implementations.
+
+Reports clips/sec for 16/32/64-frame clips of random keypoints, with a share
+of missing keypoints and people, and checks that both versions give the same
+arrays (NaN where the other is NaN). It also checks that a video read from its
+pose array (datasets/extract_pose.py) gives the same keypoints as read from
+its per-frame pose_%05d.npy files, frames with a single person included.
+
+usage: python pose_features_benchmark.py [--missing 0.2 --iterations 200]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+from datasets.pose_store import (pose_clip_features, pose_clip_positions, first_part, second_part,
+                                 pack_poses, save_pose_array, read_pose_frames)
+
+
+def frame_loop_features(poses):
+    """ReadSegmentPoseRaw as it was before, one frame at a time."""
+    sampled_list = []
+    max_person = poses.shape[1]
+    for pose_info in poses:
+        pose_extracted = np.zeros([max_person, 26, 3])
+        pose_extracted[:,:25,:2] = pose_info[:max_person, :, :]
+        pose_extracted[pose_extracted == 0] = None
+        pose_extracted[:,:,0] = pose_extracted[:,:,0] / 340
+        pose_extracted[:,:,1] = pose_extracted[:,:,1] / 256
+        joint_information = pose_extracted[:,first_part, :] - pose_extracted[:,second_part, :]
+        angle_information = np.arctan2(-joint_information[:,:,1], joint_information[:,:,0])
+        angle_information[angle_information < 0] += 2 * np.pi
+        angle_information = angle_information / (2 * np.pi)
+        pose_extracted[:,:,2] = angle_information
+        pose_extracted = np.expand_dims(pose_extracted, 3)
+        sampled_list.append(pose_extracted)
+    return np.concatenate(sampled_list, axis=3)
+
+
+def frame_loop_positions(poses):
+    """ReadSegmentPoseRaw2 as it was before, one frame at a time."""
+    sampled_list = []
+    max_person = poses.shape[1]
+    for pose_info in poses:
+        pose_extracted = np.zeros([max_person, 25, 2])
+        pose_extracted[:,:25,:2] = pose_info[:max_person, :, :]
+        pose_extracted[pose_extracted == 0] = None
+        pose_extracted[:,:,0] = pose_extracted[:,:,0] / 340
+        pose_extracted[:,:,1] = pose_extracted[:,:,1] / 256
+        pose_extracted = np.expand_dims(pose_extracted, 3)
+        sampled_list.append(pose_extracted)
+    return np.concatenate(sampled_list, axis=3)
+
+
+def clips_per_second(features, poses, iterations):
+    start = time.time()
+    for _ in range(iterations):
+        output = features(poses)
+    return iterations / (time.time() - start), output
+
+
+def random_poses(length, people, missing):
+    """length x people x 25 x 2 keypoints in pixels of the 340x256 frames,
+    a share missing of them 0, and the second person missing in some frames.
+    """
+    poses = np.random.rand(length, people, 25, 2) * [340, 256]
+    poses[np.random.rand(length, people, 25) < missing] = 0
+    poses[np.random.rand(length) < missing, 1:] = 0
+    return poses.astype(np.float16).astype(np.float64)
+
+
+def check_pose_array(frames, missing, max_person=2):
+    """Asserts that the pose array and the per-frame files of a video of
+    frames frames with 1 to 3 people each give the same keypoints.
+    """
+    keypoints = [random_poses(1, np.random.randint(1, 4), missing)[0] for _ in range(frames)]
+    frame_indices = list(range(1, frames + 1))
+    frame_dir, array_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        for frame_index, frame_keypoints in zip(frame_indices, keypoints):
+            np.save(os.path.join(frame_dir, 'pose_%05d.npy' % (frame_index)), frame_keypoints)
+        poses, people = pack_poses(keypoints, max_person + 1)
+        save_pose_array(array_dir, poses, frame_indices, people)
+        sampled = sorted(np.random.choice(frame_indices, frames // 2, replace=False))
+        from_frames = read_pose_frames(frame_dir, sampled, max_person, 'pose_%05d.npy')
+        from_array = read_pose_frames(array_dir, sampled, max_person, 'pose_%05d.npy')
+        assert np.array_equal(from_frames, from_array)
+        assert np.array_equal(pose_clip_features(from_frames), pose_clip_features(from_array), equal_nan=True)
+    finally:
+        shutil.rmtree(frame_dir)
+        shutil.rmtree(array_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pose features microbenchmark')
+    parser.add_argument('--missing', default=0.2, type=float,
+                        help='share of missing keypoints (default: 0.2)')
+    parser.add_argument('--iterations', default=200, type=int)
+    args = parser.parse_args()
+
+    benchmarks = [
+        ('PoseRaw', frame_loop_features, pose_clip_features),
+        ('PoseRaw2', frame_loop_positions, pose_clip_positions),
+    ]
+
+    print('%-10s %7s %14s %14s %8s' % ('reader', 'frames', 'before (c/s)', 'after (c/s)', 'speedup'))
+    for name, before, after in benchmarks:
+        for length in [16, 32, 64]:
+            poses = random_poses(length, 2, args.missing)
+            before_rate, before_output = clips_per_second(before, poses, args.iterations)
+            after_rate, after_output = clips_per_second(after, poses, args.iterations)
+            assert before_output.shape == after_output.shape
+            assert np.array_equal(before_output, after_output, equal_nan=True)
+            print('%-10s %7d %14.1f %14.1f %7.1fx' % (name, length, before_rate, after_rate,
+                                                     after_rate / before_rate))
+    check_pose_array(64, args.missing)
+    print('pose array and per-frame files give the same keypoints')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput and peak GPU memory of the training step of the two_stream_*
+trainers, in float32 and with --amp (utils/mixed_precision.py), without and
+with --activation-checkpointing (models/activation_checkpointing.py).
+
+A training step is the forward pass, the cross entropy loss, the backward
+pass and an opt.AdamW step, on random clips of the input size the trainers
+use for the architecture. The eval forward pass (no_grad, eval mode) is
+timed as well. --max-batch also searches the largest batch whose training
+step fits in the GPU memory for every configuration.
+
+usage: python train_step_benchmark.py [-a rgb_resneXt3D64f101_bert10S rgb_resneXt3D64f101_bertS -b 4 8 --modes fp32 amp]
+       python train_step_benchmark.py -a rgb_resneXt3D64f101_bert10S --segments 0 2 4 --max-batch
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+import torch.nn as nn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+import models
+from opt.AdamW import AdamW
+from utils.mixed_precision import MixedPrecision
+from models.activation_checkpointing import set_activation_checkpointing
+from cpu_inference_benchmark import clip_shape
+
+
+parser = argparse.ArgumentParser(description='Training step throughput and memory benchmark')
+parser.add_argument('--arch', '-a', nargs='+',
+                    default=['rgb_resneXt3D64f101_bert10S', 'rgb_resneXt3D64f101_bertS'],
+                    help='architectures to benchmark (default: rgb_resneXt3D64f101_bert10S rgb_resneXt3D64f101_bertS)')
+parser.add_argument('-b', '--batch-size', nargs='+', default=[4, 8], type=int,
+                    help='clips per training step (default: 4 8)')
+parser.add_argument('--modes', nargs='+', default=['fp32', 'amp'], choices=['fp32', 'amp'],
+                    help='precision modes (default: fp32 amp)')
+parser.add_argument('--segments', nargs='+', default=[0], type=int,
+                    help='activation checkpointing segments per stage, 0 for off (default: 0)')
+parser.add_argument('--max-batch', action='store_true',
+                    help='search the largest batch whose training step fits for every configuration')
+parser.add_argument('--num-classes', default=51, type=int, metavar='N',
+                    help='number of classes (default: 51)')
+parser.add_argument('--iterations', default=10, type=int, metavar='N',
+                    help='timed steps per configuration (default: 10)')
+parser.add_argument('--warmup', default=3, type=int, metavar='N',
+                    help='untimed steps per configuration (default: 3)')
+
+
+def first_output(output):
+    return output[0] if isinstance(output, tuple) else output
+
+
+def measure(step):
+    """Milliseconds per call of step and the peak memory allocated, in MB."""
+    for _ in range(args.warmup):
+        step()
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    start = time.time()
+    for _ in range(args.iterations):
+        step()
+    torch.cuda.synchronize()
+    elapsed = 1000 * (time.time() - start) / args.iterations
+    return elapsed, torch.cuda.max_memory_allocated() / 2 ** 20
+
+
+def is_out_of_memory(error):
+    return 'out of memory' in str(error)
+
+
+def build(arch, segments):
+    model = models.__dict__[arch](modelPath='', num_classes=args.num_classes, length=1).cuda()
+    return set_activation_checkpointing(model, segments)
+
+
+def fits(arch, mode, segments, batch_size):
+    """Whether a training step of batch_size clips fits in the GPU memory."""
+    _, shape = clip_shape(arch, 1)
+    model = build(arch, segments)
+    mixed_precision = MixedPrecision(mode == 'amp')
+    try:
+        inputs = torch.randn((batch_size,) + shape, device='cuda')
+        output = first_output(mixed_precision.forward(model, inputs))
+        mixed_precision.backward(output.sum())
+        torch.cuda.synchronize()
+        return True
+    except RuntimeError as error:
+        if not is_out_of_memory(error):
+            raise
+        return False
+    finally:
+        del model
+        torch.cuda.empty_cache()
+
+
+def max_batch_size(arch, mode, segments):
+    """Largest training batch that fits, by doubling then bisection."""
+    low, high = 0, 1
+    while fits(arch, mode, segments, high):
+        low, high = high, high * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(arch, mode, segments, middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def benchmark(arch, mode, segments, batch_size):
+    _, shape = clip_shape(arch, 1)
+    model = build(arch, segments)
+    optimizer = AdamW(model.parameters(), lr=1e-5, weight_decay=1e-3)
+    criterion = nn.CrossEntropyLoss().cuda()
+    mixed_precision = MixedPrecision(mode == 'amp')
+    inputs = torch.randn((batch_size,) + shape, device='cuda')
+    targets = torch.randint(args.num_classes, (batch_size,), device='cuda')
+
+    def train_step():
+        output = first_output(mixed_precision.forward(model, inputs))
+        mixed_precision.backward(criterion(output, targets))
+        mixed_precision.step(optimizer)
+        optimizer.zero_grad()
+
+    def eval_step():
+        with torch.no_grad():
+            mixed_precision.forward(model, inputs)
+
+    model.train()
+    try:
+        train_ms, train_mb = measure(train_step)
+    except RuntimeError as error:
+        if not is_out_of_memory(error):
+            raise
+        train_ms, train_mb = float('nan'), float('nan')
+    optimizer.zero_grad()
+    model.eval()
+    eval_ms, eval_mb = measure(eval_step)
+    print('%-30s %-5s segments %d batch %3d: train %7.2f clips/s %8.0f MB   eval %7.2f clips/s %8.0f MB'
+          % (arch, mode, segments, batch_size, 1000 * batch_size / train_ms, train_mb,
+             1000 * batch_size / eval_ms, eval_mb))
+    del model, optimizer
+    torch.cuda.empty_cache()
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    if not torch.cuda.is_available():
+        print("The training step benchmark needs a GPU")
+        sys.exit()
+    torch.backends.cudnn.benchmark = True
+    print('torch %s on %s' % (torch.__version__, torch.cuda.get_device_name()))
+    for arch in args.arch:
+        for batch_size in args.batch_size:
+            for mode in args.modes:
+                for segments in args.segments:
+                    benchmark(arch, mode, segments, batch_size)
+        if args.max_batch:
+            for mode in args.modes:
+                for segments in args.segments:
+                    print('%-30s %-5s segments %d: largest training batch %d'
+                          % (arch, mode, segments, max_batch_size(arch, mode, segments)))
+
+
+if __name__ == '__main__':
+    main()
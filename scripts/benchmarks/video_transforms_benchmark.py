@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the clip-level MultiScaleCrop, CenterCrop and Scale in
+video_transforms against the previous frame-by-frame implementations.
+
+Reports samples/sec of transform + ToTensor for 16/32/64-frame RGB and flow
+clips and checks that both versions give the same tensors.
+
+usage: python video_transforms_benchmark.py [--height 256 --width 340 --crop 224]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+import video_transforms
+
+
+class FrameLoopScale(video_transforms.Scale):
+    """Scale as it was before resize_clip, one cv2.resize per frame."""
+
+    def __call__(self, clips):
+        h, w, c = clips.shape
+        if w < h:
+            new_w = self.size
+            new_h = int(self.size * h / w)
+        else:
+            new_w = int(self.size * w / h)
+            new_h = self.size
+        step = 3 if c % 3 == 0 else 1
+        scaled_clips = np.zeros((new_h,new_w,c))
+        for frame_id in range(int(c / step)):
+            cur_img = clips[:,:,frame_id*step:frame_id*step+step]
+            scaled_clips[:,:,frame_id*step:frame_id*step+step] = cv2.resize(
+                cur_img, (new_w, new_h), self.interpolation).reshape(new_h, new_w, step)
+        return scaled_clips
+
+
+class FrameLoopCenterCrop(video_transforms.CenterCrop):
+    """CenterCrop as it was before, copying frame by frame into float64."""
+
+    def __call__(self, clips):
+        h, w, c = clips.shape
+        th, tw = self.size
+        x1 = int(round((w - tw) / 2.))
+        y1 = int(round((h - th) / 2.))
+        step = 3 if c % 3 == 0 else 1
+        scaled_clips = np.zeros((th,tw,c))
+        for frame_id in range(int(c / step)):
+            cur_img = clips[:,:,frame_id*step:frame_id*step+step]
+            scaled_clips[:,:,frame_id*step:frame_id*step+step] = cur_img[y1:y1+th, x1:x1+tw, :]
+        return scaled_clips
+
+
+class FrameLoopMultiScaleCrop(video_transforms.MultiScaleCrop):
+    """MultiScaleCrop as it was before, one cv2.resize per frame."""
+
+    def __call__(self, clips):
+        h, w, c = clips.shape
+        crop_size_pairs = self.fillCropSize(h, w)
+        size_sel = random.randint(0, len(crop_size_pairs)-1)
+        crop_height, crop_width = crop_size_pairs[size_sel]
+        offsets = self.fillFixOffset(h, w)
+        off_sel = random.randint(0, len(offsets)-1)
+        h_off, w_off = offsets[off_sel]
+        step = 3 if c % 3 == 0 else 1
+        scaled_clips = np.zeros((self.height,self.width,c))
+        for frame_id in range(int(c / step)):
+            cur_img = clips[:,:,frame_id*step:frame_id*step+step]
+            crop_img = cur_img[h_off:h_off+crop_height, w_off:w_off+crop_width, :]
+            scaled_clips[:,:,frame_id*step:frame_id*step+step] = cv2.resize(
+                crop_img, (self.width, self.height), self.interpolation).reshape(self.height, self.width, step)
+        return scaled_clips
+
+
+def samples_per_second(transform, clips, iterations, seed):
+    random.seed(seed)
+    start = time.time()
+    for _ in range(iterations):
+        output = transform(clips)
+    return iterations / (time.time() - start), output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='video_transforms microbenchmark')
+    parser.add_argument('--height', default=256, type=int)
+    parser.add_argument('--width', default=340, type=int)
+    parser.add_argument('--crop', default=224, type=int)
+    parser.add_argument('--iterations', default=20, type=int)
+    args = parser.parse_args()
+
+    scale_ratios = [1.0, 0.875, 0.75, 0.66]
+    crop_size = (args.crop, args.crop)
+    to_tensor = video_transforms.ToTensor2()
+    benchmarks = [
+        ('MultiScaleCrop', FrameLoopMultiScaleCrop(crop_size, scale_ratios),
+         video_transforms.MultiScaleCrop(crop_size, scale_ratios)),
+        ('CenterCrop', FrameLoopCenterCrop(crop_size), video_transforms.CenterCrop(crop_size)),
+        ('Scale', FrameLoopScale(args.crop), video_transforms.Scale(args.crop)),
+    ]
+
+    print('%-15s %-5s %7s %14s %14s %8s' % ('transform', 'mod', 'frames', 'before (s/s)', 'after (s/s)', 'speedup'))
+    for name, before, after in benchmarks:
+        for modality, channels in [('rgb', 3), ('flow', 2)]:
+            for length in [16, 32, 64]:
+                clips = np.random.randint(0, 256, (args.height, args.width, channels * length), dtype=np.uint8)
+                before_rate, before_output = samples_per_second(
+                    video_transforms.Compose([before, to_tensor]), clips, args.iterations, length)
+                after_rate, after_output = samples_per_second(
+                    video_transforms.Compose([after, to_tensor]), clips, args.iterations, length)
+                assert (before_output == after_output).all()
+                print('%-15s %-5s %7d %14.1f %14.1f %7.1fx' % (name, modality, length, before_rate,
+                                                              after_rate, after_rate / before_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched multi-video inference for the eval scripts.
+
+DataLoader workers read and crop the videos of a split file with one of the
+VideoSpatialInput* functions, while the main process packs the clips of
+consecutive videos into fixed-size batches, runs the net once per batch and
+scatters the scores back to their videos. Every video gets the same
+(prediction, mean_result, top3) as the serial VideoSpatialPrediction*
+functions.
+"""
+
+import os
+import numpy as np
+
+import torch
+import torch.utils.data as data
+
+
+class VideoInputDataset(data.Dataset):
+    """The lines of a val_*_split*.txt file, read with input_fn(clip_path, num_frames=duration)."""
+
+    def __init__(self, val_list, data_dir, input_fn):
+        self.val_list = val_list
+        self.data_dir = data_dir
+        self.input_fn = input_fn
+
+    def __getitem__(self, index):
+        line_info = self.val_list[index].split(" ")
+        clip_path = os.path.join(self.data_dir, line_info[0])
+        duration = int(line_info[1])
+        return index, self.input_fn(clip_path, num_frames=duration)
+
+    def __len__(self):
+        return len(self.val_list)
+
+
+def _video_result(result):
+    mean_result=np.mean(result,0)
+    prediction=np.argmax(mean_result)
+    top3 = mean_result.argsort()[::-1][:3]
+    return prediction, mean_result, top3
+
+
+def BatchedVideoPrediction(
+        val_list,
+        data_dir,
+        net,
+        input_fn,
+        rows_per_output = 1,
+        batch_size = 8,
+        workers = 4,
+        scores = None
+        ):
+    """Yields (index, (prediction, mean_result, top3)) for every line of
+    val_list, in order.
+
+    input_fn(clip_path, num_frames=duration) returns the CPU input tensor of one video,
+    e.g. a functools.partial of VideoSpatialInput3D_bert. rows_per_output is
+    the number of input rows the net turns into one output row: 1 for 3D
+    nets, num_seg for the 2D nets that fold the segments into the batch.
+    batch_size counts output rows (clips or crops) per forward pass. The
+    output rows of every video are put in the dict scores by index when given.
+    """
+    loader = torch.utils.data.DataLoader(
+        VideoInputDataset(val_list, data_dir, input_fn),
+        batch_size=None, shuffle=False,
+        num_workers=workers)
+    device = next(net.parameters()).device
+
+    # videos whose clips are packed but not all scored yet, in order:
+    # [index, number of output rows, list of scored rows]
+    pending = []
+    inputs = []
+    queued = 0
+
+    def run(count):
+        batch = torch.cat(inputs, 0)
+        rows = count * rows_per_output
+        inputs[:] = [batch[rows:]] if rows < batch.shape[0] else []
+        with torch.no_grad():
+            output = net(batch[:rows].to(device))
+            if isinstance(output, tuple):
+                output = output[0]
+            result = output.data.cpu().numpy()
+        done = 0
+        for video in pending:
+            missing = video[1] - sum(len(scored) for scored in video[2])
+            if missing > 0 and done < len(result):
+                video[2].append(result[done:done + missing])
+                done += len(video[2][-1])
+        while pending and sum(len(scored) for scored in pending[0][2]) == pending[0][1]:
+            index, _, scored = pending.pop(0)
+            result = np.concatenate(scored, 0)
+            if scores is not None:
+                scores[index] = result
+            yield index, _video_result(result)
+
+    for index, input_tensor in loader:
+        outputs = input_tensor.shape[0] // rows_per_output
+        pending.append([index, outputs, []])
+        inputs.append(input_tensor)
+        queued += outputs
+        while queued >= batch_size:
+            for item in run(batch_size):
+                yield item
+            queued -= batch_size
+    if queued > 0:
+        for item in run(queued):
+            yield item
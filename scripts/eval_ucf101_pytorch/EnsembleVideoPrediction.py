@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ensemble evaluation that reads every video once for all of its members.
+
+EnsembleVideoPrediction evaluates several nets on the same video. The frames
+any member needs are read from disk once per kind of input (rgb/pose images,
+or flow_x/flow_y pairs) and resized once to the largest input size among the
+members of that kind, 340x256 for 224 crops. A member with a smaller input
+(170x128 for 112 crops) resizes that shared buffer to its own size, then every
+member takes its own crops, flips and normalization. When the frames were
+extracted at 340x256, the shared buffer holds the frames as read and every
+member sees the same pixels as with VideoSpatialPrediction3D(_bert).
+
+The members run concurrently on the threads of an executor, each on its own
+CUDA stream when its net is on the GPU.
+"""
+
+import os
+import collections
+import numpy as np
+import cv2
+
+import torch
+
+from VideoSpatialPrediction3D import VideoTransform3D, VideoOffsets3D, VideoSpatialScores3D
+from VideoSpatialPrediction3D_bert import VideoTransform3D_bert, VideoOffsets3D_bert, \
+    VideoClipTensor3D_bert, VideoSpatialScores3D_bert
+
+
+class EnsembleMember(object):
+    """A net of an ensemble and how it is evaluated on a video.
+
+    num_seg=None evaluates consecutive clips over the whole video like
+    VideoSpatialPrediction3D, otherwise num_seg clips like
+    VideoSpatialPrediction3D_bert. count_frames takes the length of the video
+    from its frame folder rather than from num_frames.
+    """
+
+    def __init__(self, net, architecture_name, length=16, num_seg=None,
+                 extension='img_{0:05d}.jpg', ten_crop=False, count_frames=False):
+        self.net = net
+        self.architecture_name = architecture_name
+        self.length = length
+        self.num_seg = num_seg
+        self.extension = extension
+        self.ten_crop = ten_crop
+        self.count_frames = count_frames
+        if num_seg is None:
+            self.val_transform, self.scale = VideoTransform3D(architecture_name)
+        else:
+            self.val_transform, self.scale = VideoTransform3D_bert(architecture_name)
+        self.is_flow = not ('rgb' in architecture_name or 'pose' in architecture_name)
+        self.image_size = int(224 * self.scale)
+        self.dims = (int(340 * self.scale), int(256 * self.scale))
+        self.stream = None
+
+    def offsets(self, duration):
+        if self.num_seg is None:
+            return VideoOffsets3D(duration, self.length)
+        return VideoOffsets3D_bert(duration, self.num_seg, self.length)
+
+    def input_data(self, frames, offsets):
+        """Crops and normalizes the frames at the given offsets, one row per
+        frame and crop in the order of VideoSpatialPrediction3D(_bert).
+        """
+        resized = {}
+        images = []
+        for index in offsets:
+            if index not in resized:
+                img = frames[index]
+                if img.shape[1::-1] != self.dims:
+                    img = cv2.resize(img, self.dims, interpolation=cv2.INTER_LINEAR)
+                resized[index] = img
+            images.append(resized[index])
+
+        size = self.image_size
+        top = int(16 * self.scale)
+        left = int(58 * self.scale)
+        if self.ten_crop:
+            sources = [images, [img[:, ::-1, :].copy() for img in images]]
+        else:
+            sources = [images]
+        imageList = []
+        for source in sources:
+            imageList += [img[top:top + size, left:left + size, :] for img in source]
+            if self.ten_crop:
+                imageList += [img[:size, :size, :] for img in source]
+                imageList += [img[:size, -size:, :] for img in source]
+                imageList += [img[-size:, :size, :] for img in source]
+                imageList += [img[-size:, -size:, :] for img in source]
+
+        rgb_list = [np.expand_dims(self.val_transform(img).numpy(), 0) for img in imageList]
+        return np.concatenate(rgb_list, axis=0)
+
+    def scores(self, input_data, num_categories, scores=None):
+        if self.num_seg is None:
+            return VideoSpatialScores3D(input_data, self.net, num_categories,
+                                        self.architecture_name, self.length, self.image_size, scores)
+        imgDataTensor = VideoClipTensor3D_bert(input_data, self.architecture_name,
+                                               self.length, self.image_size)
+        return VideoSpatialScores3D_bert(imgDataTensor, self.net, self.architecture_name, scores)
+
+    def predict(self, frames, offsets, num_categories, scores=None):
+        input_data = self.input_data(frames, offsets)
+        device = next(self.net.parameters()).device
+        if device.type != 'cuda':
+            return self.scores(input_data, num_categories, scores)
+        if self.stream is None:
+            self.stream = torch.cuda.Stream(device=device)
+        with torch.cuda.stream(self.stream):
+            return self.scores(input_data, num_categories, scores)
+
+
+def _count_frames(vid_name, is_flow):
+    prefix = 'flow_x' if is_flow else 'img'
+    return len([item for item in os.listdir(vid_name) if prefix in item])
+
+
+def _read_frames(vid_name, extension, is_flow, indices, dims):
+    """Reads the frames with the given indices once, resized to dims
+    (width, height): RGB images, or flow_x/flow_y stacked on the last axis.
+    """
+    frames = {}
+    for index in indices:
+        if not is_flow:
+            img = cv2.imread(os.path.join(vid_name, extension.format(index)), cv2.IMREAD_UNCHANGED)
+            img = cv2.resize(img, dims, interpolation=cv2.INTER_LINEAR)
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        else:
+            img_x = cv2.imread(os.path.join(vid_name, extension.format('x', index)), cv2.IMREAD_GRAYSCALE)
+            img_y = cv2.imread(os.path.join(vid_name, extension.format('y', index)), cv2.IMREAD_GRAYSCALE)
+            img = np.concatenate((np.expand_dims(img_x, -1), np.expand_dims(img_y, -1)), 2)
+            img = cv2.resize(img, dims, interpolation=cv2.INTER_LINEAR)
+        frames[index] = img
+    return frames
+
+
+def EnsembleVideoPrediction(
+        vid_name,
+        members,
+        num_categories,
+        executor,
+        num_frames=0,
+        scores=None
+        ):
+    """Returns the (prediction, mean_result, top3) of every member on the
+    video, in the order of members.
+
+    executor is a concurrent.futures.ThreadPoolExecutor, created once by the
+    caller with a thread per member. The outputs of the members, one row per
+    clip and crop, are appended to the list scores in the order of members
+    when given.
+    """
+    groups = collections.OrderedDict()
+    for member in members:
+        groups.setdefault((member.is_flow, member.extension), []).append(member)
+
+    offsets = {}
+    reads = []
+    for (is_flow, extension), group in groups.items():
+        indices = set()
+        for member in group:
+            if num_frames == 0 or member.count_frames:
+                duration = _count_frames(vid_name, is_flow)
+            else:
+                duration = num_frames
+            offsets[member] = member.offsets(duration)
+            indices.update(offsets[member])
+        dims = max(member.dims for member in group)
+        reads.append(executor.submit(_read_frames, vid_name, extension, is_flow, sorted(indices), dims))
+
+    frames = {}
+    for read, group in zip(reads, groups.values()):
+        group_frames = read.result()
+        for member in group:
+            frames[member] = group_frames
+
+    member_scores = [[] for member in members]
+    predictions = [executor.submit(member.predict, frames[member], offsets[member], num_categories,
+                                   member_scores[i])
+                   for i, member in enumerate(members)]
+    results = [prediction.result() for prediction in predictions]
+    if scores is not None:
+        for result in member_scores:
+            scores.extend(result)
+    return results
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs a model exported by export_model.py in place of the eager net of the
+eval scripts.
+
+load_exported picks the runtime from the file: TorchScript for .pt, ONNX
+Runtime for .onnx. The returned ExportedNet is called like the eager net of
+the architecture, so the Video*Prediction functions take it unchanged: the
+heads that return (output, input_vectors, sequenceOut, maskSample) get the
+logits and three Nones.
+"""
+
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+def tuple_output(architecture_name):
+    """Whether the eval scripts unpack four outputs from the net of the
+    architecture, as in VideoSpatialPrediction3D.
+    """
+    return 'bert' in architecture_name or 'pooling' in architecture_name or 'NLB' in architecture_name \
+        or 'lstm' in architecture_name or 'adamw' in architecture_name
+
+
+class ExportedNet(nn.Module):
+    """An exported TorchScript module or ONNX Runtime session on device."""
+
+    def __init__(self, path, architecture_name, device):
+        super(ExportedNet, self).__init__()
+        self.path = path
+        self.tuple_output = tuple_output(architecture_name)
+        self.device = torch.device(device)
+        self.session = None
+        if path.endswith('.onnx'):
+            if onnxruntime is None:
+                raise ImportError("onnxruntime is needed to run %s" % (path))
+            providers = ['CPUExecutionProvider']
+            if self.device.type == 'cuda':
+                providers.insert(0, 'CUDAExecutionProvider')
+            self.session = onnxruntime.InferenceSession(path, providers=providers)
+            # The eval scripts take the device of the net from its parameters.
+            self.device_anchor = nn.Parameter(torch.empty(0, device=self.device), requires_grad=False)
+        else:
+            self.module = torch.jit.load(path, map_location=self.device)
+            self.module.eval()
+
+    def logits(self, x):
+        if self.session is None:
+            return self.module(x)
+        output = self.session.run(['logits'], {'clips': x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(output).to(self.device)
+
+    def forward(self, x):
+        output = self.logits(x)
+        if self.tuple_output:
+            return output, None, None, None
+        return output
+
+
+def load_exported(path, architecture_name, device='cuda'):
+    net = ExportedNet(path, architecture_name, device)
+    net.eval()
+    return net
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-video score cache of the eval scripts.
+
+A cache holds the raw net outputs of one (dataset, split, arch, crop mode)
+evaluation, one row per crop and clip of every video, in columns:
+
+    videos       video names as in the split file, in evaluation order
+    labels       ground truth label of each video
+    row_offsets  rows of video i are logits[row_offsets[i]:row_offsets[i+1]]
+    logits       float32 array of shape (rows, num_categories)
+
+The mean of the rows of a video is the mean_result of the Video*Prediction
+functions, so fusion_search.py can try fusion weights and normalizations on
+the cached scores without running the nets again.
+"""
+
+import os
+import numpy as np
+
+
+SCORE_CACHE_DIR = 'results/scores'
+
+
+def score_cache_path(dataset, split, arch, crop_mode, cache_dir=SCORE_CACHE_DIR):
+    return os.path.join(cache_dir, '%s_split%d_%s_%s.npz' % (dataset, split, arch, crop_mode))
+
+
+def crop_mode_name(ten_crop, multiple_clips=False):
+    """'1crop' or '10crop', with '_clips' for the consecutive clips of
+    VideoSpatialPrediction3D.
+    """
+    crop_mode = '10crop' if ten_crop else '1crop'
+    if multiple_clips:
+        crop_mode += '_clips'
+    return crop_mode
+
+
+class ScoreCacheWriter(object):
+    """Collects the scores of the videos of one evaluation and writes them
+    to path with save().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.videos = []
+        self.labels = []
+        self.logits = []
+
+    def add(self, video, label, result):
+        """result holds the net outputs of the video, one row per crop and clip."""
+        result = np.asarray(result, dtype=np.float32)
+        self.videos.append(video)
+        self.labels.append(label)
+        self.logits.append(result.reshape(-1, result.shape[-1]))
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        row_offsets = np.cumsum([0] + [len(result) for result in self.logits])
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path,
+                 videos=np.array(self.videos),
+                 labels=np.array(self.labels, dtype=np.int64),
+                 row_offsets=row_offsets.astype(np.int64),
+                 logits=np.concatenate(self.logits, 0))
+        os.replace(tmp_path, self.path)
+        print("Scores of %d videos are saved to %s" % (len(self.videos), self.path))
+
+
+def load_scores(path):
+    """Returns the columns of a score cache as a dict of arrays."""
+    with np.load(path) as cache:
+        return {name: cache[name] for name in ('videos', 'labels', 'row_offsets', 'logits')}
+
+
+def video_scores(cache, reduction='mean'):
+    """Per-video scores of a cache, (videos, num_categories): the mean (or
+    max) over the rows of every video.
+    """
+    row_offsets = cache['row_offsets']
+    if reduction == 'mean':
+        sums = np.add.reduceat(cache['logits'], row_offsets[:-1], axis=0)
+        return sums / np.diff(row_offsets)[:, None]
+    elif reduction == 'max':
+        return np.maximum.reduceat(cache['logits'], row_offsets[:-1], axis=0)
+    raise ValueError("No such reduction %s" % (reduction))
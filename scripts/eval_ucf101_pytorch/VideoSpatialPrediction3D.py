@@ -10,6 +10,8 @@ import os
 import sys
 import numpy as np
 import math
+import queue
+import threading
 import cv2
 import scipy.io as sio
 
@@ -27,33 +29,10 @@ sys.path.insert(0, "../../")
 import video_transforms
 
 soft=nn.Softmax(dim=1)
-def VideoSpatialPrediction3D(
-        vid_name,
-        net,
-        num_categories,
-        architecture_name,
-        start_frame=0,
-        num_frames=0,
-        length = 16,
-        extension = 'img_{0:05d}.jpg',
-        ten_crop = False
-        ):
-
-    if num_frames == 0:
-        imglist = os.listdir(vid_name)
-        newImageList=[]
-        if 'rgb' in architecture_name or 'pose' in architecture_name:
-            for item in imglist:
-                if 'img' in item:
-                   newImageList.append(item) 
-        elif 'flow' in architecture_name:
-            for item in imglist:
-                if 'flow_x' in item:
-                   newImageList.append(item) 
-        duration = len(newImageList)
-    else:
-        duration = num_frames
-    
+def VideoTransform3D(architecture_name):
+    """Validation transform and input scale (1 for 224 crops, 0.5 for 112
+    crops) of the net, as used by VideoSpatialPrediction3D.
+    """
     if 'rgb' in architecture_name or 'pose' in architecture_name:
         if 'I3D' in architecture_name:
             
@@ -172,15 +151,13 @@ def VideoSpatialPrediction3D(
         scale = 1
     if '112' in architecture_name:
         scale = 0.5
-    # selection
-    #step = int(math.floor((duration-1)/(num_samples-1)))
-    dims2 = (224,224,3,duration)
-    
-    imageSize=int(224 * scale)
-    dims = (int(256 * scale),int(340 * scale),3,duration)
-    #dims = (int(256 * scale),int(256 * scale),3,duration)
+    return val_transform, scale
+
+def VideoOffsets3D(duration, length):
+    """Frame indices (1-based) of the consecutive clips of length frames
+    that VideoSpatialPrediction3D reads from a video, clip after clip.
+    """
     duration = duration - 1
-    
     offsets = []
     
     offsetMainIndexes = list(range(1,duration-length,length))
@@ -200,77 +177,39 @@ def VideoSpatialPrediction3D(
 #            if moded_loaded_frame_index == 0:
 #                moded_loaded_frame_index = (duration + 1)
 #            offsets.append(moded_loaded_frame_index)
-             
-    imageList=[]
-    imageList1=[]
-    imageList2=[]
-    imageList3=[]
-    imageList4=[]    
-    imageList5=[]  
-    imageList6=[]
-    imageList7=[]
-    imageList8=[]
-    imageList9=[]    
-    imageList10=[] 
-    imageList11=[] 
-    imageList12=[] 
-    interpolation = cv2.INTER_LINEAR
-    
-    for index in offsets:
-        if 'rgb' in architecture_name or 'pose' in architecture_name:
-            img_file = os.path.join(vid_name, extension.format(index))
-            img = cv2.imread(img_file, cv2.IMREAD_UNCHANGED)
-    
-            img = cv2.resize(img, dims[1::-1],interpolation)
-    
-            #img2 = cv2.resize(img, dims2[1::-1],interpolation)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img_flip = img[:,::-1,:].copy()
-        elif 'flow' in architecture_name:
-            flow_x_file = os.path.join(vid_name, extension.format('x',index))
-            flow_y_file = os.path.join(vid_name, extension.format('y',index))
-            img_x = cv2.imread(flow_x_file, cv2.IMREAD_GRAYSCALE)
-            img_y = cv2.imread(flow_y_file, cv2.IMREAD_GRAYSCALE)
-            img_x = np.expand_dims(img_x,-1)
-            img_y = np.expand_dims(img_y,-1)
-            img = np.concatenate((img_x,img_y),2)    
-            img = cv2.resize(img, dims[1::-1],interpolation)
-            img_flip = img[:,::-1,:].copy()
-        #img_flip2 = img2[:,::-1,:].copy()
-        #imageList1.append(img[int(16 * scale):int(16 * scale + imageSize), int(16 * scale) : int(16 * scale + imageSize), :])
-        imageList1.append(img[int(16 * scale):int(16 * scale + imageSize), int(58 * scale) : int(58 * scale + imageSize), :])
-        imageList2.append(img[:imageSize, :imageSize, :])
-        imageList3.append(img[:imageSize, -imageSize:, :])
-        imageList4.append(img[-imageSize:, :imageSize, :])
-        imageList5.append(img[-imageSize:, -imageSize:, :])
-        imageList6.append(img_flip[int(16 * scale):int(16 * scale + imageSize), int(58 * scale) : int(58 * scale + imageSize), :])
-        imageList7.append(img_flip[:imageSize, :imageSize, :])
-        imageList8.append(img_flip[:imageSize, -imageSize:, :])
-        imageList9.append(img_flip[-imageSize:, :imageSize, :])
-        imageList10.append(img_flip[-imageSize:, -imageSize:, :])
-#        imageList11.append(img2)
-#        imageList12.append(img_flip2)
+    return offsets
 
-    if ten_crop:
-        imageList=imageList1+imageList2+imageList3+imageList4+imageList5+imageList6+imageList7+imageList8+imageList9+imageList10
+def VideoClipOutput3D(input_data_batched, net, architecture_name, length, imageSize, device):
+    """Net outputs of a batch of clips, (clips, length, channels, imageSize,
+    imageSize), as a numpy array.
+    """
+    imgDataTensor = torch.from_numpy(input_data_batched).type(torch.FloatTensor).to(device)
+    if 'rgb' in architecture_name or 'pose' in architecture_name:
+        if 'tsm' in architecture_name:
+            imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize)
+        else:
+            imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize).transpose(1,2)
+    elif 'flow' in architecture_name:
+        imgDataTensor = imgDataTensor.view(-1,length,2,imageSize,imageSize).transpose(1,2)
+            
+    if 'bert' in architecture_name or 'pooling' in architecture_name or 'NLB' in architecture_name \
+        or 'lstm' in architecture_name or 'adamw' in architecture_name:
+        output, input_vectors, sequenceOut, maskSample = net(imgDataTensor)
     else:
-        imageList=imageList1
-    
-    #imageList=imageList11+imageList12
-    
-    rgb_list=[]     
+        output = net(imgDataTensor)
+    return output.data.cpu().numpy()
 
-    for i in range(len(imageList)):
-        cur_img = imageList[i]
-        cur_img_tensor = val_transform(cur_img)
-        rgb_list.append(np.expand_dims(cur_img_tensor.numpy(), 0))
-         
-    input_data=np.concatenate(rgb_list,axis=0)   
+def VideoSpatialScores3D(input_data, net, num_categories, architecture_name, length, imageSize, scores=None):
+    """Runs the net on the normalized crops of a video (one row per frame
+    and crop), 10 clips per forward pass. The outputs, one row per clip and
+    crop, are appended to the list scores when given.
+    """
     if 'rgb' in architecture_name or 'pose' in architecture_name:
         input_data = input_data.reshape(-1,length,3,imageSize,imageSize)
     elif 'flow' in architecture_name:
         input_data = input_data.reshape(-1,length,2,imageSize,imageSize)
 
+    device = next(net.parameters()).device
     batch_size = 10
     result = np.zeros([input_data.shape[0],num_categories])
     num_batches = int(math.ceil(float(input_data.shape[0])/batch_size))
@@ -279,25 +218,173 @@ def VideoSpatialPrediction3D(
         for bb in range(num_batches):
             span = range(batch_size*bb, min(input_data.shape[0],batch_size*(bb+1)))
             input_data_batched = input_data[span,:,:,:,:]
-            imgDataTensor = torch.from_numpy(input_data_batched).type(torch.FloatTensor).cuda()
-            if 'rgb' in architecture_name or 'pose' in architecture_name:
-                if 'tsm' in architecture_name:
-                    imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize)
-                else:
-                    imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize).transpose(1,2)
-            elif 'flow' in architecture_name:
-                imgDataTensor = imgDataTensor.view(-1,length,2,imageSize,imageSize).transpose(1,2)
-                    
-            if 'bert' in architecture_name or 'pooling' in architecture_name or 'NLB' in architecture_name \
-                or 'lstm' in architecture_name or 'adamw' in architecture_name:
-                output, input_vectors, sequenceOut, maskSample = net(imgDataTensor)
-            else:
-                output = net(imgDataTensor)
-            #span = range(sample_size*bb, min(int(input_data.shape[0]/length),sample_size*(bb+1)))
-            result[span,:] = output.data.cpu().numpy()
+            result[span,:] = VideoClipOutput3D(input_data_batched, net, architecture_name, length, imageSize, device)
+        if scores is not None:
+            scores.append(result)
+        mean_result=np.mean(result,0)
+        prediction=np.argmax(mean_result)
+        top3 = mean_result.argsort()[::-1][:3]
+        
+    return prediction, mean_result, top3
+
+def VideoFrame3D(vid_name, index, architecture_name, extension, dims):
+    """Reads frame index of the video resized to dims (width, height): an RGB
+    image, or flow_x/flow_y stacked on the last axis.
+    """
+    interpolation = cv2.INTER_LINEAR
+    if 'rgb' in architecture_name or 'pose' in architecture_name:
+        img_file = os.path.join(vid_name, extension.format(index))
+        img = cv2.imread(img_file, cv2.IMREAD_UNCHANGED)
+        img = cv2.resize(img, dims, interpolation)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif 'flow' in architecture_name:
+        flow_x_file = os.path.join(vid_name, extension.format('x',index))
+        flow_y_file = os.path.join(vid_name, extension.format('y',index))
+        img_x = cv2.imread(flow_x_file, cv2.IMREAD_GRAYSCALE)
+        img_y = cv2.imread(flow_y_file, cv2.IMREAD_GRAYSCALE)
+        img_x = np.expand_dims(img_x,-1)
+        img_y = np.expand_dims(img_y,-1)
+        img = np.concatenate((img_x,img_y),2)    
+        img = cv2.resize(img, dims, interpolation)
+    return img
+
+def VideoCrops3D(img, scale, imageSize, ten_crop):
+    """Center crop of a frame, or its ten crops in the order of the rows of
+    VideoSpatialScores3D: center, the four corners, then the same on the
+    flipped frame.
+    """
+    crops = [img[int(16 * scale):int(16 * scale + imageSize), int(58 * scale) : int(58 * scale + imageSize), :]]
+    if ten_crop:
+        img_flip = img[:,::-1,:].copy()
+        crops += [img[:imageSize, :imageSize, :],
+                  img[:imageSize, -imageSize:, :],
+                  img[-imageSize:, :imageSize, :],
+                  img[-imageSize:, -imageSize:, :],
+                  img_flip[int(16 * scale):int(16 * scale + imageSize), int(58 * scale) : int(58 * scale + imageSize), :],
+                  img_flip[:imageSize, :imageSize, :],
+                  img_flip[:imageSize, -imageSize:, :],
+                  img_flip[-imageSize:, :imageSize, :],
+                  img_flip[-imageSize:, -imageSize:, :]]
+    return crops
+
+def VideoClips3D(vid_name, architecture_name, offsets, length, extension, ten_crop, val_transform, scale):
+    """Yields the clips of the video one at a time, each as a (crops, length,
+    channels, imageSize, imageSize) array, reading only the frames of the
+    clip.
+    """
+    imageSize = int(224 * scale)
+    dims = (int(340 * scale), int(256 * scale))
+    for clip_start in range(0, len(offsets), length):
+        clip_crops = [VideoCrops3D(VideoFrame3D(vid_name, index, architecture_name, extension, dims),
+                                   scale, imageSize, ten_crop)
+                      for index in offsets[clip_start:clip_start + length]]
+        yield np.stack([np.stack([val_transform(frame_crops[crop]).numpy() for frame_crops in clip_crops], 0)
+                        for crop in range(len(clip_crops[0]))], 0)
+
+def _prefetch(clips, prefetch):
+    """Iterates over clips while a background thread reads up to prefetch
+    clips ahead. An exception of the reader is raised by the iteration.
+    """
+    clip_queue = queue.Queue(maxsize=prefetch)
+    done = threading.Event()
+
+    def put(item):
+        while not done.is_set():
+            try:
+                clip_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for clip in clips:
+                if not put(clip):
+                    return
+            put(None)
+        except Exception as error:
+            put(error)
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            clip = clip_queue.get()
+            if clip is None:
+                return
+            if isinstance(clip, Exception):
+                raise clip
+            yield clip
+    finally:
+        done.set()
+
+def VideoSpatialStreamScores3D(clips, num_clips, net, num_categories, architecture_name, length, imageSize,
+                               scores=None, batch_size=10, prefetch=2):
+    """VideoSpatialScores3D on the clips yielded by VideoClips3D. Clips are
+    read by a background thread at most prefetch clips ahead of the net, and
+    batch_size rows go through each forward pass, so the memory held does
+    not grow with the length of the video. The rows of the outputs are in
+    the order of VideoSpatialScores3D, crop-major.
+    """
+    device = next(net.parameters()).device
+    result = None
+    pending = []
+    pending_rows = []
+
+    with torch.no_grad():
+        for clip_index, clip in enumerate(_prefetch(clips, prefetch)):
+            if result is None:
+                result = np.zeros([clip.shape[0] * num_clips,num_categories])
+            for crop in range(clip.shape[0]):
+                pending.append(clip[crop])
+                pending_rows.append(crop * num_clips + clip_index)
+            while len(pending) >= batch_size or (clip_index == num_clips - 1 and len(pending) > 0):
+                input_data_batched = np.stack(pending[:batch_size], 0)
+                result[pending_rows[:batch_size],:] = VideoClipOutput3D(input_data_batched, net, architecture_name,
+                                                                       length, imageSize, device)
+                del pending[:batch_size]
+                del pending_rows[:batch_size]
+        if scores is not None:
+            scores.append(result)
         mean_result=np.mean(result,0)
         prediction=np.argmax(mean_result)
         top3 = mean_result.argsort()[::-1][:3]
-        top5 = mean_result.argsort()[::-1][:5]
         
-    return prediction, mean_result, top3
\ No newline at end of file
+    return prediction, mean_result, top3
+
+def VideoSpatialPrediction3D(
+        vid_name,
+        net,
+        num_categories,
+        architecture_name,
+        start_frame=0,
+        num_frames=0,
+        length = 16,
+        extension = 'img_{0:05d}.jpg',
+        ten_crop = False,
+        scores = None
+        ):
+
+    if num_frames == 0:
+        imglist = os.listdir(vid_name)
+        newImageList=[]
+        if 'rgb' in architecture_name or 'pose' in architecture_name:
+            for item in imglist:
+                if 'img' in item:
+                   newImageList.append(item) 
+        elif 'flow' in architecture_name:
+            for item in imglist:
+                if 'flow_x' in item:
+                   newImageList.append(item) 
+        duration = len(newImageList)
+    else:
+        duration = num_frames
+    
+    val_transform, scale = VideoTransform3D(architecture_name)
+    imageSize=int(224 * scale)
+    offsets = VideoOffsets3D(duration, length)
+    clips = VideoClips3D(vid_name, architecture_name, offsets, length, extension, ten_crop, val_transform, scale)
+    return VideoSpatialStreamScores3D(clips, len(offsets) // length, net, num_categories, architecture_name,
+                                      length, imageSize, scores)
@@ -26,36 +26,13 @@ import torchvision.models as models
 
 sys.path.insert(0, "../../")
 import video_transforms
+from models.temporal_sampling import input_stride
 
 soft=nn.Softmax(dim=1)
-def VideoSpatialPrediction3D_bert(
-        vid_name,
-        net,
-        num_categories,
-        architecture_name,
-        start_frame=0,
-        num_frames=0,
-        num_seg=4,
-        length = 16,
-        extension = 'img_{0:05d}.jpg',
-        ten_crop = False
-        ):
-
-    if num_frames == 0:
-        imglist = os.listdir(vid_name)
-        newImageList=[]
-        if 'rgb' in architecture_name or 'pose' in architecture_name:
-            for item in imglist:
-                if 'img' in item:
-                   newImageList.append(item) 
-        elif 'flow' in architecture_name:
-            for item in imglist:
-                if 'flow_x' in item:
-                   newImageList.append(item) 
-        duration = len(newImageList)
-    else:
-        duration = num_frames
-    
+def VideoTransform3D_bert(architecture_name):
+    """Validation transform and input scale (1 for 224 crops, 0.5 for 112
+    crops) of the net, as used by VideoSpatialInput3D_bert.
+    """
     if 'rgb' in architecture_name:
         if 'I3D' in architecture_name:
             
@@ -159,15 +136,17 @@ def VideoSpatialPrediction3D_bert(
                     normalize,
                 ])
 
-    # selection
-    #step = int(math.floor((duration-1)/(num_samples-1)))
     if '224' in architecture_name:
         scale = 1
     if '112' in architecture_name:
         scale = 0.5
+    return val_transform, scale
 
-    imageSize=int(224 * scale)
-    dims = (int(256 * scale),int(340 * scale),3,duration)
+def VideoOffsets3D_bert(duration, num_seg, length, temporal_stride=1):
+    """Frame indices (1-based) of the num_seg clips of length frames that
+    VideoSpatialInput3D_bert reads from a video, clip after clip, every
+    temporal_stride-th frame of a clip for a pre-strided net.
+    """
     duration = duration - 1
     average_duration = int(duration / num_seg)
     offsetMainIndexes = []
@@ -182,12 +161,66 @@ def VideoSpatialPrediction3D_bert(
             increase = int(duration / num_seg)
             offsetMainIndexes.append(0 + seg_id * increase)
     for mainOffsetValue in offsetMainIndexes:
-        for lengthID in range(1, length+1):
+        for lengthID in range(1, length+1, temporal_stride):
             loaded_frame_index = lengthID + mainOffsetValue
             moded_loaded_frame_index = loaded_frame_index % (duration + 1)
             if moded_loaded_frame_index == 0:
                 moded_loaded_frame_index = (duration + 1)
             offsets.append(moded_loaded_frame_index)
+    return offsets
+
+def VideoClipTensor3D_bert(input_data, architecture_name, length, imageSize):
+    """Turns the normalized crops of a video (one row per frame and crop)
+    into the input tensor of the net, one clip per row.
+    """
+    imgDataTensor = torch.from_numpy(input_data).type(torch.FloatTensor)
+    if 'rgb' in architecture_name or 'pose' in architecture_name:
+        if 'tsm' in architecture_name:
+            imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize)
+        else:
+            imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize).transpose(1,2)
+    elif 'flow' in architecture_name:
+        imgDataTensor = imgDataTensor.view(-1,length,2,imageSize,imageSize).transpose(1,2)
+    return imgDataTensor
+
+def VideoSpatialInput3D_bert(
+        vid_name,
+        architecture_name,
+        start_frame=0,
+        num_frames=0,
+        num_seg=4,
+        length = 16,
+        extension = 'img_{0:05d}.jpg',
+        ten_crop = False,
+        temporal_stride = 1
+        ):
+    """Reads, crops and normalizes the clips of one video, only every
+    temporal_stride-th frame of a clip with temporal_stride > 1. Returns the
+    CPU input tensor of the net, one clip per row.
+    """
+
+    if num_frames == 0:
+        imglist = os.listdir(vid_name)
+        newImageList=[]
+        if 'rgb' in architecture_name or 'pose' in architecture_name:
+            for item in imglist:
+                if 'img' in item:
+                   newImageList.append(item) 
+        elif 'flow' in architecture_name:
+            for item in imglist:
+                if 'flow_x' in item:
+                   newImageList.append(item) 
+        duration = len(newImageList)
+    else:
+        duration = num_frames
+    
+    val_transform, scale = VideoTransform3D_bert(architecture_name)
+
+    # selection
+    #step = int(math.floor((duration-1)/(num_samples-1)))
+    imageSize=int(224 * scale)
+    dims = (int(256 * scale),int(340 * scale),3,duration)
+    offsets = VideoOffsets3D_bert(duration, num_seg, length, temporal_stride)
              
     imageList=[]
     imageList1=[]
@@ -253,25 +286,46 @@ def VideoSpatialPrediction3D_bert(
         rgb_list.append(np.expand_dims(cur_img_tensor.numpy(), 0))
          
     input_data=np.concatenate(rgb_list,axis=0)   
+    return VideoClipTensor3D_bert(input_data, architecture_name, len(offsets) // num_seg, imageSize)
 
+def VideoSpatialScores3D_bert(imgDataTensor, net, architecture_name, scores=None):
+    """Runs the net on the input tensor of a video, all clips in one pass.
+    The outputs, one row per clip and crop, are appended to the list scores
+    when given.
+    """
     with torch.no_grad():
-        imgDataTensor = torch.from_numpy(input_data).type(torch.FloatTensor).cuda()
-        if 'rgb' in architecture_name or 'pose' in architecture_name:
-            if 'tsm' in architecture_name:
-                imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize)
-            else:
-                imgDataTensor = imgDataTensor.view(-1,length,3,imageSize,imageSize).transpose(1,2)
-        elif 'flow' in architecture_name:
-            imgDataTensor = imgDataTensor.view(-1,length,2,imageSize,imageSize).transpose(1,2)
-            
+        imgDataTensor = imgDataTensor.to(next(net.parameters()).device)
         if 'bert' in architecture_name or 'pooling' in architecture_name:
             output, input_vectors, sequenceOut, maskSample = net(imgDataTensor)
         else:
             output = net(imgDataTensor)
 #        outputSoftmax=soft(output)
         result = output.data.cpu().numpy()
+        if scores is not None:
+            scores.append(result)
         mean_result=np.mean(result,0)
         prediction=np.argmax(mean_result)
         top3 = mean_result.argsort()[::-1][:3]
         
-    return prediction, mean_result, top3
\ No newline at end of file
+    return prediction, mean_result, top3
+
+def VideoSpatialPrediction3D_bert(
+        vid_name,
+        net,
+        num_categories,
+        architecture_name,
+        start_frame=0,
+        num_frames=0,
+        num_seg=4,
+        length = 16,
+        extension = 'img_{0:05d}.jpg',
+        ten_crop = False,
+        scores = None
+        ):
+    """Predicts one video. A net switched to pre-strided input by
+    models.temporal_sampling.set_pre_strided gets only the frames it consumes.
+    """
+
+    imgDataTensor = VideoSpatialInput3D_bert(vid_name, architecture_name, start_frame, num_frames,
+                                             num_seg, length, extension, ten_crop, input_stride(net))
+    return VideoSpatialScores3D_bert(imgDataTensor, net, architecture_name, scores)
\ No newline at end of file
@@ -27,10 +27,8 @@ sys.path.insert(0, "../../")
 import video_transforms
 
 soft=nn.Softmax(dim=1)
-def VideoSpatialPrediction_bert(
+def VideoSpatialInput_bert(
         vid_name,
-        net,
-        num_categories,
         architecture_name,
         start_frame=0,
         num_frames=0,
@@ -38,6 +36,9 @@ def VideoSpatialPrediction_bert(
         extension = 'img_{0:05d}.jpg',
         ten_crop = False
         ):
+    """Reads, crops and normalizes the frames of one video. Returns the CPU
+    input tensor of the net, num_seg frames per crop.
+    """
 
     if num_frames == 0:
         imglist = os.listdir(vid_name)
@@ -149,14 +150,33 @@ def VideoSpatialPrediction_bert(
         cur_img_tensor = val_transform(cur_img)
         rgb_list.append(np.expand_dims(cur_img_tensor.numpy(), 0))
          
-    input_data=np.concatenate(rgb_list,axis=0)   
+    input_data=np.concatenate(rgb_list,axis=0)
+    return torch.from_numpy(input_data).type(torch.FloatTensor)
+
+def VideoSpatialPrediction_bert(
+        vid_name,
+        net,
+        num_categories,
+        architecture_name,
+        start_frame=0,
+        num_frames=0,
+        num_seg=16,
+        extension = 'img_{0:05d}.jpg',
+        ten_crop = False,
+        scores = None
+        ):
+
+    imgDataTensor = VideoSpatialInput_bert(vid_name, architecture_name, start_frame, num_frames,
+                                           num_seg, extension, ten_crop)
     with torch.no_grad():
-        imgDataTensor = torch.from_numpy(input_data).type(torch.FloatTensor).cuda()
+        imgDataTensor = imgDataTensor.to(next(net.parameters()).device)
         output, _, _, _ = net(imgDataTensor)
         #output, _ , _ = net(imgDataTensor)
 #        output = net(imgDataTensor)
 #        outputSoftmax=soft(output)
         result = output.data.cpu().numpy()
+        if scores is not None:
+            scores.append(result)
         mean_result=np.mean(result,0)
         prediction=np.argmax(mean_result)
         top3 = mean_result.argsort()[::-1][:3]
@@ -33,7 +33,8 @@ def VideoSpatialPrediction_lstm2(
         num_categories,
         start_frame=0,
         num_frames=0,
-        num_seg=16
+        num_seg=16,
+        scores=None
         ):
 
     if num_frames == 0:
@@ -110,6 +111,8 @@ def VideoSpatialPrediction_lstm2(
         output = net(imgDataTensor)
 #        outputSoftmax=soft(output)
         result = output.data.cpu().numpy()
+        if scores is not None:
+            scores.append(result)
         prediction=np.argmax(np.mean(result,0))
         
     return prediction
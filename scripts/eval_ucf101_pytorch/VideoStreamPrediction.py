@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Online action recognition over a stream of frames.
+
+VideoStreamPrediction takes BGR frames one at a time (e.g. from
+cv2.VideoCapture), keeps a ring buffer of the last `length` frames and
+predicts every `stride` frames once the buffer is full. 2D BERT models such
+as rgb_resnet18_bert10 see num_seg frames sampled evenly from the window, as
+VideoSpatialInput_bert does over a whole video. The models that split their
+forward into frame_features and sequence_head (the FrameFeatureBert heads of
+models/rgb_resnet.py) have their frame features cached per frame number, so a
+frame that stays in the window is run through the backbone once and only the
+BERT head runs on every prediction; the other models run their whole forward
+on every window. 3D models see the whole window as one clip.
+"""
+
+import collections
+import numpy as np
+import cv2
+
+import torch
+
+
+def frame_transform(architecture_name):
+    """(crop size, resize (width, height), crop offset (y, x), mean, std,
+    pixel range) of the center-crop validation transform of
+    VideoSpatialInput_bert / VideoSpatialInput3D_bert for rgb models.
+    """
+    is_3D = '3D' in architecture_name or 'r2plus1d' in architecture_name
+    pixel_range = 255.0
+    if not is_3D:
+        scale = 1
+        clip_mean = [0.485, 0.456, 0.406]
+        clip_std = [0.229, 0.224, 0.225]
+    elif 'I3D' in architecture_name:
+        scale = 0.5 if '112' in architecture_name else 1
+        if not 'resnet' in architecture_name:
+            clip_mean = [0.5, 0.5, 0.5]
+            clip_std = [0.5, 0.5, 0.5]
+        else:
+            clip_mean = [0.45, 0.45, 0.45]
+            clip_std = [0.225, 0.225, 0.225]
+    elif 'MFNET3D' in architecture_name:
+        scale = 0.5 if '112' in architecture_name else 1
+        clip_mean = [0.48627451, 0.45882353, 0.40784314]
+        clip_std = [0.234, 0.234, 0.234]
+    elif 'r2plus1d' in architecture_name:
+        scale = 0.5
+        clip_mean = [0.43216, 0.394666, 0.37645]
+        clip_std = [0.22803, 0.22145, 0.216989]
+    else:
+        scale = 0.5
+        clip_mean = [114.7748, 107.7354, 99.4750]
+        clip_std = [1, 1, 1]
+        pixel_range = 1.0
+    if '224' in architecture_name:
+        scale = 1
+    if '112' in architecture_name:
+        scale = 0.5
+    image_size = int(224 * scale)
+    return (image_size, (int(340 * scale), int(256 * scale)), (int(16 * scale), int(58 * scale)),
+            clip_mean, clip_std, pixel_range)
+
+
+def _unwrap(net):
+    return net.module if isinstance(net, torch.nn.DataParallel) else net
+
+
+def has_frame_features(net):
+    """True for the models whose forward is frame_features followed by
+    sequence_head, as the FrameFeatureBert heads implement it."""
+    return all(callable(getattr(_unwrap(net), name, None)) for name in ('frame_features', 'sequence_head'))
+
+
+def segment_offsets(length, num_seg):
+    """Window positions of the num_seg frames of a 2D model, the frame in the
+    middle of each segment as in VideoSpatialInput_bert."""
+    average_duration = length // num_seg
+    if average_duration >= 1:
+        return [average_duration // 2 + seg_id * average_duration for seg_id in range(num_seg)]
+    return [int(seg_id * length / num_seg) for seg_id in range(num_seg)]
+
+
+class VideoStreamPrediction(object):
+    """Predicts over the last `length` frames every `stride` frames.
+
+    push(frame) takes a BGR uint8 frame and returns (prediction, mean_result,
+    top3) as VideoSpatialPrediction*_bert do, or None when no prediction is
+    due. num_seg is the number of frames a 2D model sees per window and has
+    to match the length the model was built with.
+    """
+
+    def __init__(self, net, architecture_name, length=16, stride=4, num_seg=16):
+        self.net = net
+        self.architecture_name = architecture_name
+        self.length = length
+        self.stride = stride
+        self.num_seg = num_seg
+        self.device = next(net.parameters()).device
+        self.is_3D = '3D' in architecture_name or 'r2plus1d' in architecture_name
+        self.reuse_features = not self.is_3D and has_frame_features(net)
+        if not self.is_3D and num_seg > length:
+            raise RuntimeError("a window of %d frames can't hold %d segments" % (length, num_seg))
+        if self.reuse_features and _unwrap(net).length != num_seg:
+            raise RuntimeError("%s was built for %d segments, not %d" % (architecture_name, _unwrap(net).length, num_seg))
+
+        (self.image_size, self.resize, self.crop_offset,
+         clip_mean, clip_std, self.pixel_range) = frame_transform(architecture_name)
+        self.mean = torch.tensor(clip_mean).view(3, 1, 1)
+        self.std = torch.tensor(clip_std).view(3, 1, 1)
+
+        # ring buffer of (frame number, preprocessed frame)
+        self.frames = collections.deque(maxlen=length)
+        # frame number -> backbone feature of the 2D models
+        self.features = {}
+        self.frame_count = 0
+        self.backbone_frames = 0
+
+    def reset(self):
+        self.frames.clear()
+        self.features.clear()
+        self.frame_count = 0
+        self.backbone_frames = 0
+
+    def preprocess(self, frame):
+        """Resize, center crop and normalize one BGR frame as the eval scripts do."""
+        img = cv2.resize(frame, self.resize, interpolation=cv2.INTER_LINEAR)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        y, x = self.crop_offset
+        img = img[y:y + self.image_size, x:x + self.image_size, :]
+        img = torch.from_numpy(np.ascontiguousarray(img.transpose((2, 0, 1)))).float()
+        return img.div_(self.pixel_range).sub_(self.mean).div_(self.std)
+
+    def push(self, frame):
+        self.frames.append((self.frame_count, self.preprocess(frame)))
+        self.frame_count += 1
+        if self.frame_count < self.length or (self.frame_count - self.length) % self.stride != 0:
+            return None
+        return self.predict()
+
+    def predict(self):
+        """Prediction over the frames in the ring buffer."""
+        with torch.no_grad():
+            if self.is_3D:
+                clip = torch.stack([img for _, img in self.frames], 1).unsqueeze(0)
+                output = self.net(clip.to(self.device))
+            else:
+                window = list(self.frames)
+                selected = [window[offset] for offset in segment_offsets(len(window), self.num_seg)]
+                if self.reuse_features:
+                    output = self.head(self.frame_features(selected))
+                else:
+                    output = self.net(torch.stack([img for _, img in selected], 0).to(self.device))
+            if isinstance(output, tuple):
+                output = output[0]
+            result = output.data.cpu().numpy()
+        mean_result=np.mean(result,0)
+        prediction=np.argmax(mean_result)
+        top3 = mean_result.argsort()[::-1][:3]
+        return prediction, mean_result, top3
+
+    def frame_features(self, selected):
+        """Backbone features of the selected frames, computing only the ones
+        not cached from earlier windows."""
+        net = _unwrap(self.net)
+        missing = [(number, img) for number, img in selected if number not in self.features]
+        if missing:
+            x = net.frame_features(torch.stack([img for _, img in missing], 0).to(self.device))
+            for (number, _), feature in zip(missing, x):
+                self.features[number] = feature
+            self.backbone_frames += len(missing)
+        oldest = self.frames[0][0]
+        for number in [number for number in self.features if number < oldest]:
+            del self.features[number]
+        return torch.stack([self.features[number] for number, _ in selected], 0)
+
+    def head(self, features):
+        return _unwrap(self.net).sequence_head(features.unsqueeze(0))
@@ -43,6 +43,7 @@ def VideoTemporalPrediction3D(
         num_frames=0,
         num_seg=4,
         length = 16,
+        scores = None
         ):
 
     if num_frames == 0:
@@ -155,6 +156,8 @@ def VideoTemporalPrediction3D(
     #        outputSoftmax=soft(output)
             span = range(sample_size*bb, min(int(input_data.shape[0]/64),sample_size*(bb+1)))
             result[span,:] = output.data.cpu().numpy()
+        if scores is not None:
+            scores.append(result)
         mean_result=np.mean(result,0)
         prediction=np.argmax(mean_result)
         
@@ -34,7 +34,8 @@ def VideoTemporalPrediction_bert(
         start_frame=0,
         num_frames=0,
         num_seg=16,
-        length = 1
+        length = 1,
+        scores = None
         ):
 
     if num_frames == 0:
@@ -130,6 +131,8 @@ def VideoTemporalPrediction_bert(
         output,_,_,_ = net(imgDataTensor)
 #        outputSoftmax=soft(output)
         result = output.data.cpu().numpy()
+        if scores is not None:
+            scores.append(result)
         mean_result=np.mean(result,0)
         prediction=np.argmax(mean_result)
         
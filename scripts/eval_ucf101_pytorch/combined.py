@@ -33,6 +33,7 @@ sys.path.insert(0, "../../")
 import models
 from VideoSpatialPrediction import VideoSpatialPrediction
 from VideoTemporalPrediction import VideoTemporalPrediction
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
@@ -155,6 +156,10 @@ def main():
     y_pred_max=[]
     timeList=[]
     #result_list = []
+    rgb_score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch_rgb,
+                                                        crop_mode_name(ten_crop=True)))
+    flow_score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch_flow,
+                                                         crop_mode_name(ten_crop=True)))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -177,6 +182,8 @@ def main():
                 start_frame,
                 duration)
 
+        rgb_score_cache.add(line_info[0], input_video_label, spatial_prediction.T)
+        flow_score_cache.add(line_info[0], input_video_label, temporal_prediction.T)
         spatial_result = spatial_prediction / LA.norm(spatial_prediction)
         temporal_result = temporal_prediction / LA.norm(temporal_prediction)
         result = spatial_result + temporal_result
@@ -267,6 +274,8 @@ def main():
     print(modelLocation_rgb)
     print(modelLocation_flow)
     print("Mean Estimated Time %0.4f" % (np.mean(timeList)))
+    rgb_score_cache.save()
+    flow_score_cache.save()
     # resultDict={'y_true':y_true,'y_pred_mean':y_pred_mean,'y_pred_max':y_pred_max,'y_pred_3_mean':y_pred_3_mean,
     #             'y_pred_5_mean':y_pred_5_mean,'y_pred_7_mean':y_pred_7_mean,'y_pred_10_mean':y_pred_10_mean,
     #             'y_pred_30_mean':y_pred_30_mean,'y_pred_50_mean':y_pred_50_mean,'y_pred_70_mean':y_pred_70_mean,
@@ -14,6 +14,7 @@ import math
 import random
 import time
 import argparse
+import concurrent.futures
 
 import torch
 import torch.nn as nn
@@ -30,8 +31,11 @@ from sklearn.metrics import confusion_matrix
 datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 import models
+from utils.mixed_precision import AutocastModel
 from VideoSpatialPrediction3D import VideoSpatialPrediction3D
 from VideoSpatialPrediction3D_bert import VideoSpatialPrediction3D_bert
+from EnsembleVideoPrediction import EnsembleVideoPrediction, EnsembleMember
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
 os.environ["CUDA_VISIBLE_DEVICES"]="1"
@@ -65,6 +69,11 @@ parser.add_argument('-t', '--tsn', dest='tsn', action='store_true',
 parser.add_argument('-v', '--val', dest='window_val', action='store_true',
                     help='Window Validation Selection')
 
+parser.add_argument('--shared-decode', dest='shared_decode', action='store_true',
+                    help='read each video once for both streams and run the nets concurrently')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='run the nets under autocast (mixed precision)')
+
 multiGPUTest=False
 multiGPUTrain=False
 
@@ -108,6 +117,8 @@ def buildModel(model_path,arch,num_categories):
         model.load_state_dict(params['state_dict'])
     model.cuda()
     model.eval()  
+    if args.amp:
+        model = AutocastModel(model)
     return model
 
 def main():
@@ -197,6 +208,19 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    crop_mode = crop_mode_name(ten_crop_enabled, multiple_clips_enabled)
+    score_caches = [ScoreCacheWriter(score_cache_path(args.dataset, args.split, arch, crop_mode))
+                    for arch in [args.arch_rgb, args.arch_flow]]
+    if args.shared_decode:
+        if multiple_clips_enabled:
+            num_seg_members = None
+        else:
+            num_seg_members = num_seg_3D
+        members = [EnsembleMember(spatial_net, args.arch_rgb, rgb_length, num_seg_members,
+                                  rgb_extension, ten_crop_enabled),
+                   EnsembleMember(temporal_net, args.arch_flow, flow_length, num_seg_members,
+                                  flow_extension, ten_crop_enabled, count_frames=True)]
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(members))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -205,7 +229,12 @@ def main():
         
         start = time.time()
         
-        if not multiple_clips_enabled:
+        video_scores = []
+        if args.shared_decode:
+            (_, spatial_result, _), (_, temporal_result, _) = EnsembleVideoPrediction(
+                clip_path, members, num_categories, executor, duration,
+                scores=video_scores)
+        elif not multiple_clips_enabled:
             _ , spatial_result, _ = VideoSpatialPrediction3D_bert(
                                            clip_path,
                                            spatial_net,
@@ -216,7 +245,8 @@ def main():
                                            num_seg=num_seg_3D ,
                                            length = rgb_length, 
                                            extension = rgb_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
             
             _ , temporal_result, _ = VideoSpatialPrediction3D_bert(
                                            clip_path,
@@ -228,7 +258,8 @@ def main():
                                            num_seg=num_seg_3D ,
                                            length = flow_length, 
                                            extension = flow_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
     
     
         else:
@@ -241,7 +272,8 @@ def main():
                                            duration,
                                            length = rgb_length, 
                                            extension = rgb_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
             
             _ , temporal_result, _ = VideoSpatialPrediction3D(
                                            clip_path,
@@ -252,12 +284,15 @@ def main():
                                            0,
                                            length = flow_length, 
                                            extension = flow_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
                          
             
         end = time.time()
         estimatedTime=end-start
         timeList.append(estimatedTime)
+        for score_cache, result in zip(score_caches, video_scores):
+            score_cache.add(line_info[0], input_video_label, result)
         
         spatial_result = spatial_result / LA.norm(spatial_result)
         temporal_result = temporal_result / LA.norm(temporal_result)
@@ -297,6 +332,8 @@ def main():
     resultDict={'y_true':y_true,'y_pred':y_pred}
     
     np.save('results/%s.npy' %(args.dataset+'_'+args.arch_rgb+'_'+ args.arch_flow +"_split"+str(args.split)), resultDict) 
+    for score_cache in score_caches:
+        score_cache.save()
 
 if __name__ == "__main__":
     main()
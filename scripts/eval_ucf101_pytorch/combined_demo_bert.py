@@ -37,6 +37,7 @@ from VideoSpatialPrediction_bert import VideoSpatialPrediction_bert
 from VideoSpatialPrediction3D import VideoSpatialPrediction3D
 from VideoTemporalPrediction3D import VideoTemporalPrediction3D
 from VideoSpatialPrediction3D_bert import VideoSpatialPrediction3D_bert
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
 os.environ["CUDA_VISIBLE_DEVICES"]="1"
@@ -182,6 +183,12 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    member_archs = [args.arch_rgb, args.arch_flow]
+    if poseEnabled:
+        member_archs.append(args.arch_pose)
+    score_caches = [ScoreCacheWriter(score_cache_path(args.dataset, args.split, arch,
+                                                      crop_mode_name(ten_crop_enabled)))
+                    for arch in member_archs]
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -190,6 +197,7 @@ def main():
         
         start = time.time()
         
+        video_scores = []
 
             
         _, spatial_result, _ = VideoSpatialPrediction_bert(
@@ -201,7 +209,8 @@ def main():
                 duration,
                 num_seg = num_seg_rgb,
                 extension = rgb_extension,
-                ten_crop = ten_crop_enabled)
+                ten_crop = ten_crop_enabled,
+                scores = video_scores)
         
         _, temporal_result, _ = VideoSpatialPrediction_bert(
                 clip_path,
@@ -212,7 +221,8 @@ def main():
                 0,
                 num_seg = num_seg_flow,
                 extension = flow_extension,
-                ten_crop = ten_crop_enabled)
+                ten_crop = ten_crop_enabled,
+                scores = video_scores)
         
         
         if poseEnabled:
@@ -226,13 +236,16 @@ def main():
                     duration,
                     num_seg = num_seg_pose,
                     extension = pose_extension,
-                    ten_crop = ten_crop_enabled)
+                    ten_crop = ten_crop_enabled,
+                    scores = video_scores)
                 
               
             
         end = time.time()
         estimatedTime=end-start
         timeList.append(estimatedTime)
+        for score_cache, result in zip(score_caches, video_scores):
+            score_cache.add(line_info[0], input_video_label, result)
         
         spatial_result = spatial_result / LA.norm(spatial_result)
         temporal_result = temporal_result / LA.norm(temporal_result)
@@ -271,6 +284,8 @@ def main():
         print('10 crops')
     else:
         print('single crop')
+    for score_cache in score_caches:
+        score_cache.save()
     
     #resultDict={'y_true':y_true,'y_pred':y_pred}
     
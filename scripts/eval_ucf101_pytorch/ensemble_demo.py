@@ -14,6 +14,7 @@ import math
 import random
 import time
 import argparse
+import concurrent.futures
 
 import torch
 import torch.nn as nn
@@ -30,8 +31,11 @@ from sklearn.metrics import confusion_matrix
 datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 import models
+from utils.mixed_precision import AutocastModel
 from VideoSpatialPrediction3D import VideoSpatialPrediction3D
 from VideoSpatialPrediction3D_bert import VideoSpatialPrediction3D_bert
+from EnsembleVideoPrediction import EnsembleVideoPrediction, EnsembleMember
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
 os.environ["CUDA_VISIBLE_DEVICES"]="1"
@@ -65,6 +69,11 @@ parser.add_argument('-t', '--tsn', dest='tsn', action='store_true',
 parser.add_argument('-v', '--val', dest='window_val', action='store_true',
                     help='Window Validation Selection')
 
+parser.add_argument('--shared-decode', dest='shared_decode', action='store_true',
+                    help='read each video once for all models and run the models concurrently')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='run the nets under autocast (mixed precision)')
+
 multiGPUTest=False
 multiGPUTrain=False
 
@@ -134,6 +143,8 @@ def buildModel(model_path,arch,num_categories):
         model.load_state_dict(params['state_dict'])
     model.cuda()
     model.eval()  
+    if args.amp:
+        model = AutocastModel(model)
     return model
 
 def main():
@@ -206,6 +217,25 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    crop_mode = crop_mode_name(ten_crop_enabled, multiple_clips_enabled)
+    member_archs = [args.arch1, args.arch2]
+    if third_enabled:
+        member_archs.append(args.arch3)
+    score_caches = [ScoreCacheWriter(score_cache_path(args.dataset, args.split, arch, crop_mode))
+                    for arch in member_archs]
+    if args.shared_decode:
+        if multiple_clips_enabled:
+            num_seg_members = None
+        else:
+            num_seg_members = num_seg_3D
+        members = [EnsembleMember(arch1_net, args.arch1, arch1_length, num_seg_members,
+                                  arch1_extension, ten_crop_enabled),
+                   EnsembleMember(arch2_net, args.arch2, arch2_length, num_seg_members,
+                                  arch2_extension, ten_crop_enabled)]
+        if third_enabled:
+            members.append(EnsembleMember(arch3_net, args.arch3, arch3_length, num_seg_members,
+                                          arch3_extension, ten_crop_enabled))
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(members))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -214,7 +244,15 @@ def main():
         
         start = time.time()
         
-        if not multiple_clips_enabled:
+        video_scores = []
+        if args.shared_decode:
+            member_results = EnsembleVideoPrediction(clip_path, members, num_categories,
+                                                     executor, duration, scores=video_scores)
+            arch1_result = member_results[0][1]
+            arch2_result = member_results[1][1]
+            if third_enabled:
+                arch3_result = member_results[2][1]
+        elif not multiple_clips_enabled:
             _ , arch1_result, _ = VideoSpatialPrediction3D_bert(
                                            clip_path,
                                            arch1_net,
@@ -225,7 +263,8 @@ def main():
                                            num_seg=num_seg_3D ,
                                            length = arch1_length, 
                                            extension = arch1_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
             
             _ , arch2_result, _ = VideoSpatialPrediction3D_bert(
                                            clip_path,
@@ -237,7 +276,8 @@ def main():
                                            num_seg=num_seg_3D ,
                                            length = arch2_length, 
                                            extension = arch2_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
             
             if third_enabled:
                 _ , arch3_result, _ = VideoSpatialPrediction3D_bert(
@@ -250,7 +290,8 @@ def main():
                                                num_seg=num_seg_3D ,
                                                length = arch3_length, 
                                                extension = arch3_extension,
-                                               ten_crop = ten_crop_enabled)    
+                                               ten_crop = ten_crop_enabled,
+                                               scores = video_scores)    
     
     
         else:
@@ -263,7 +304,8 @@ def main():
                                            duration,
                                            length = arch1_length, 
                                            extension = arch1_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
             
             _ , arch2_result, _ = VideoSpatialPrediction3D(
                                            clip_path,
@@ -274,7 +316,8 @@ def main():
                                            duration,
                                            length = arch2_length, 
                                            extension = arch2_extension,
-                                           ten_crop = ten_crop_enabled)
+                                           ten_crop = ten_crop_enabled,
+                                           scores = video_scores)
             if third_enabled:
                 _ , arch3_result, _ = VideoSpatialPrediction3D(
                                                clip_path,
@@ -285,12 +328,15 @@ def main():
                                                duration,
                                                length = arch3_length, 
                                                extension = arch3_extension,
-                                               ten_crop = ten_crop_enabled)
+                                               ten_crop = ten_crop_enabled,
+                                               scores = video_scores)
                          
             
         end = time.time()
         estimatedTime=end-start
         timeList.append(estimatedTime)
+        for score_cache, result in zip(score_caches, video_scores):
+            score_cache.add(line_info[0], input_video_label, result)
         
         arch1_result = arch1_result / LA.norm(arch1_result)
         arch2_result = arch2_result / LA.norm(arch2_result)
@@ -333,6 +379,8 @@ def main():
         print('10 crops')
     else:
         print('single crop')
+    for score_cache in score_caches:
+        score_cache.save()
     
 #    resultDict={'y_true':y_true,'y_pred':y_pred}
     
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exports the model_best.pth.tar of an architecture to TorchScript and ONNX.
+
+The exported graphs are inference only: eval mode, logits only, no
+Bernoulli masking in BERT (see models/export.py). They are written next to
+the checkpoint as model_best.pt and model_best.onnx, then loaded back with
+ExportedModel.load_exported and checked against the eager model on random
+clips, at the traced batch size and at another one.
+
+    python export_model.py -d hmdb51 -s 1 -a rgb_r2plus1d_64f_34_bert10
+    python spatial_demo3D.py -d hmdb51 -s 1 -a rgb_r2plus1d_64f_34_bert10 \
+        --exported ../../checkpoint/hmdb51_rgb_r2plus1d_64f_34_bert10_split1/model_best.onnx
+"""
+
+import os, sys
+import argparse
+
+import torch
+
+sys.path.insert(0, "../../")
+
+import models
+from models.export import inference_model, export_torchscript, export_onnx
+from VideoSpatialPrediction3D import VideoTransform3D
+from ExportedModel import load_exported
+
+model_names = sorted(name for name in models.__dict__
+    if name.islower() and not name.startswith("__")
+    and callable(models.__dict__[name]))
+
+parser = argparse.ArgumentParser(description='TorchScript and ONNX export of the 3D models')
+
+parser.add_argument('--dataset', '-d', default='hmdb51',
+                    choices=["ucf101", "hmdb51", "smtV2", "window"],
+                    help='dataset: ucf101 | hmdb51 | smtV2 | window')
+parser.add_argument('--arch', '-a', metavar='ARCH', default='rgb_r2plus1d_64f_34_bert10',
+                    choices=model_names)
+parser.add_argument('-s', '--split', default=1, type=int, metavar='S',
+                    help='which split of data to work on (default: 1)')
+parser.add_argument('-t', '--tsn', dest='tsn', action='store_true',
+                    help='TSN Mode')
+parser.add_argument('--formats', nargs='+', default=['torchscript', 'onnx'], choices=['torchscript', 'onnx'],
+                    help='export formats (default: torchscript onnx)')
+parser.add_argument('--opset', default=14, type=int,
+                    help='ONNX opset version (default: 14)')
+parser.add_argument('--device', default='cuda', type=str,
+                    help='device the model is traced and checked on (default: cuda)')
+parser.add_argument('--tolerance', default=1e-3, type=float,
+                    help='largest accepted |eager - exported| of the logits (default: 1e-3)')
+
+multiGPUTrain = True
+num_seg_3D=1
+
+num_categories_of = {'ucf101': 101, 'hmdb51': 51, 'smtV2': 174, 'window': 3}
+
+
+def buildModel(model_path,num_categories):
+    model=models.__dict__[args.arch](modelPath='', num_classes=num_categories,length=num_seg_3D)
+    params = torch.load(model_path, map_location='cpu')
+    if args.tsn or multiGPUTrain:
+        new_dict = {k[7:]: v for k, v in params['state_dict'].items()}
+        model_dict=model.state_dict()
+        model_dict.update(new_dict)
+        model.load_state_dict(model_dict)
+    else:
+        model.load_state_dict(params['state_dict'])
+    model.to(args.device)
+    model.eval()
+    return model
+
+
+def clip_shape(arch):
+    """Shape of one clip of the 3D eval scripts, (channels, length, size, size)."""
+    if '64f' in arch:
+        length=64
+    elif '32f' in arch:
+        length=32
+    elif '8f' in arch:
+        length=8
+    else:
+        length=16
+    _, scale = VideoTransform3D(arch)
+    channels = 2 if 'flow' in arch else 3
+    return (channels, length, int(224 * scale), int(224 * scale))
+
+
+def check_parity(model, path, shape):
+    """Largest |eager - exported| of the logits on random clips, for a batch
+    of 2 (the traced size) and a batch of 3.
+    """
+    eager = inference_model(model)
+    exported = load_exported(path, args.arch, args.device)
+    difference = 0.0
+    with torch.no_grad():
+        for batch_size in (2, 3):
+            clips = torch.randn((batch_size,) + shape, device=args.device)
+            output = exported(clips)
+            if isinstance(output, tuple):
+                output = output[0]
+            difference = max(difference, (eager(clips) - output).abs().max().item())
+    return difference
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    if args.tsn:
+        modelLocation="./checkpoint/"+args.dataset+"_tsn_"+args.arch+"_split"+str(args.split)
+    else:
+        modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
+    model_path = os.path.join('../../',modelLocation,'model_best.pth.tar')
+
+    model = buildModel(model_path, num_categories_of[args.dataset])
+    shape = clip_shape(args.arch)
+    example = torch.randn((2,) + shape, device=args.device)
+
+    failed = False
+    for export_format in args.formats:
+        if export_format == 'torchscript':
+            path = os.path.join('../../',modelLocation,'model_best.pt')
+            export_torchscript(model, example, path)
+        else:
+            path = os.path.join('../../',modelLocation,'model_best.onnx')
+            export_onnx(model, example, path, args.opset)
+        difference = check_parity(model, path, shape)
+        failed = failed or difference > args.tolerance
+        print("%s is exported to %s, max |eager - exported| = %.2e"
+              % (args.arch, path, difference))
+    if failed:
+        print("The exported logits differ from the eager ones by more than %.0e" % (args.tolerance))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline search for fusion weights and score normalizations of an ensemble.
+
+Reads the score caches written by the eval scripts (see ScoreCache.py) and
+tries every normalization of every model with every weighting on a grid, on
+the CPU and without running any net. ensemble_demo.py and combined_demo.py
+fuse with l2 normalization and equal weights.
+
+    python fusion_search.py -d hmdb51 -s 1 -m 10crop_clips \
+        --archs rgb_r2plus1d_32f_34 rgb_r2plus1d_32f_34_bert10
+"""
+
+import os
+import time
+import argparse
+import itertools
+import numpy as np
+from numpy import linalg as LA
+
+from ScoreCache import SCORE_CACHE_DIR, score_cache_path, load_scores, video_scores
+
+NORMALIZATIONS = ['none', 'l2', 'softmax']
+
+parser = argparse.ArgumentParser(description='Fusion weight search over cached scores')
+
+parser.add_argument('caches', nargs='*', metavar='CACHE',
+                    help='score cache files, instead of --archs')
+parser.add_argument('--dataset', '-d', default='hmdb51',
+                    choices=["ucf101", "hmdb51", "smtV2", "window"],
+                    help='dataset: ucf101 | hmdb51 | smtV2 | window')
+parser.add_argument('-s', '--split', default=1, type=int, metavar='S',
+                    help='which split of data to work on (default: 1)')
+parser.add_argument('--archs', nargs='+', default=[], metavar='ARCH',
+                    help='architectures whose caches are fused')
+parser.add_argument('-m', '--crop-mode', default='1crop', type=str,
+                    help='crop mode of the caches: 1crop | 10crop, with _clips for multiple clips (default: 1crop)')
+parser.add_argument('--cache-dir', default=SCORE_CACHE_DIR, type=str, metavar='DIR',
+                    help='directory of the score caches (default: %s)' % SCORE_CACHE_DIR)
+parser.add_argument('--normalizations', nargs='+', default=NORMALIZATIONS, choices=NORMALIZATIONS,
+                    help='normalizations tried for every model (default: none l2 softmax)')
+parser.add_argument('--reduction', default='mean', choices=['mean', 'max'],
+                    help='how the rows (clips and crops) of a video are reduced (default: mean)')
+parser.add_argument('--step', default=0.05, type=float,
+                    help='grid step of the fusion weights, which sum to 1 (default: 0.05)')
+parser.add_argument('--top', default=10, type=int, metavar='N',
+                    help='number of best fusions printed (default: 10)')
+
+
+def normalize(scores, normalization):
+    if normalization == 'l2':
+        return scores / LA.norm(scores, axis=1, keepdims=True)
+    elif normalization == 'softmax':
+        exp_scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exp_scores / exp_scores.sum(axis=1, keepdims=True)
+    return scores
+
+
+def aligned_scores(caches, reduction):
+    """Per-video scores of every cache on the videos all caches share, as a
+    (models, videos, num_categories) array, and the labels of the videos.
+    """
+    shared = set(caches[0]['videos'].tolist())
+    for cache in caches[1:]:
+        shared &= set(cache['videos'].tolist())
+    videos = [video for video in caches[0]['videos'].tolist() if video in shared]
+    if len(videos) == 0:
+        raise ValueError("The caches have no video in common")
+    scores = []
+    labels = None
+    for cache in caches:
+        rows = {video: i for i, video in enumerate(cache['videos'].tolist())}
+        order = np.array([rows[video] for video in videos])
+        if labels is None:
+            labels = cache['labels'][order]
+        elif not np.array_equal(labels, cache['labels'][order]):
+            raise ValueError("The caches disagree on the labels of the videos")
+        scores.append(video_scores(cache, reduction)[order])
+    return np.stack(scores, 0), labels
+
+
+def weight_grid(num_models, step):
+    """All weightings of num_models models with weights on a grid of the
+    given step that sum to 1, as a (weightings, num_models) array.
+    """
+    parts = int(round(1.0 / step))
+    grid = [weights for weights in itertools.product(range(parts + 1), repeat=num_models)
+            if sum(weights) == parts]
+    return np.array(grid, dtype=np.float64) / parts
+
+
+def fusion_accuracy(scores, labels, weights, chunk_size=256):
+    """Top-1 and top-3 accuracy of every weighting of the model scores."""
+    top1 = np.zeros(len(weights))
+    top3 = np.zeros(len(weights))
+    for start in range(0, len(weights), chunk_size):
+        span = slice(start, start + chunk_size)
+        fused = np.tensordot(weights[span], scores, axes=1)
+        top1[span] = np.mean(np.argmax(fused, 2) == labels, 1)
+        best3 = np.argpartition(-fused, 2, axis=2)[:, :, :3]
+        top3[span] = np.mean(np.any(best3 == labels[:, None], 2), 1)
+    return top1, top3
+
+
+def main():
+    global args
+    args = parser.parse_args()
+
+    if args.caches:
+        cache_paths = args.caches
+    else:
+        cache_paths = [score_cache_path(args.dataset, args.split, arch, args.crop_mode, args.cache_dir)
+                       for arch in args.archs]
+    if len(cache_paths) == 0:
+        parser.error('give the score caches or --archs')
+
+    start = time.time()
+    caches = [load_scores(path) for path in cache_paths]
+    scores, labels = aligned_scores(caches, args.reduction)
+    names = [os.path.splitext(os.path.basename(path))[0] for path in cache_paths]
+    print("%d models on %d shared videos" % (len(names), len(labels)))
+    for name, model_scores in zip(names, scores):
+        top1, top3 = fusion_accuracy(model_scores[None], labels, np.ones((1, 1)))
+        print("%-60s top1 %4.4f top3 %4.4f" % (name, top1[0], top3[0]))
+
+    weights = weight_grid(len(names), args.step)
+    results = []
+    for normalizations in itertools.product(args.normalizations, repeat=len(names)):
+        normalized = np.stack([normalize(model_scores, normalization)
+                               for model_scores, normalization in zip(scores, normalizations)], 0)
+        top1, top3 = fusion_accuracy(normalized, labels, weights)
+        for i in range(len(weights)):
+            results.append((top1[i], top3[i], normalizations, weights[i]))
+    results.sort(key=lambda result: (result[0], result[1]), reverse=True)
+    print("%d fusions searched in %4.4f seconds" % (len(results), time.time() - start))
+
+    for top1, top3, normalizations, fusion_weights in results[:args.top]:
+        print("top1 %4.4f top3 %4.4f  %s" % (top1, top3, '  '.join(
+            "%s %s*%.2f" % (name, normalization, weight)
+            for name, normalization, weight in zip(names, normalizations, fusion_weights))))
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,7 @@ sys.path.insert(0, "../../")
 import models
 from VideoSpatialPrediction import VideoSpatialPrediction
 from VideoTemporalPrediction import VideoTemporalPrediction
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
@@ -147,6 +148,8 @@ def main():
     y_pred_max=[]
     timeList=[]
     #result_list = []
+    score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch,
+                                                    crop_mode_name(ten_crop=True)))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -173,6 +176,7 @@ def main():
         end = time.time()
         estimatedTime=end-start
         timeList.append(estimatedTime)
+        score_cache.add(line_info[0], input_video_label, spatial_prediction.T)
         avg_spatial_pred_mean = np.mean(spatial_prediction, axis=1)
         avg_spatial_pred_max = np.max(spatial_prediction, axis=1)
         spatial_sorted = np.sort(spatial_prediction, axis=1)
@@ -261,6 +265,7 @@ def main():
                 'y_pred_100_mean':y_pred_100_mean}
     
     np.save('results/%s.npy' %(args.dataset+"_tsn_"+args.arch+"_split"+str(args.split)), resultDict) 
+    score_cache.save()
 
 if __name__ == "__main__":
     main()
@@ -30,7 +30,10 @@ datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 
 import models
+from utils.mixed_precision import AutocastModel
 from VideoSpatialPrediction3D import VideoSpatialPrediction3D
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
+from ExportedModel import load_exported
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
 os.environ["CUDA_VISIBLE_DEVICES"]="0"
@@ -61,6 +64,11 @@ parser.add_argument('-t', '--tsn', dest='tsn', action='store_true',
 parser.add_argument('-v', '--val', dest='window_val', action='store_true',
                     help='Window Validation Selection')
 
+parser.add_argument('--exported', default='', type=str, metavar='PATH',
+                    help='run a TorchScript (.pt) or ONNX (.onnx) export of export_model.py instead of the checkpoint')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='run the nets under autocast (mixed precision)')
+
 
 multiGPUTest = False
 multiGPUTrain = True
@@ -95,6 +103,8 @@ def buildModel(model_path,num_categories):
         model.load_state_dict(params['state_dict'])
     model.cuda()
     model.eval()  
+    if args.amp:
+        model = AutocastModel(model)
     return model
 
 
@@ -169,7 +179,10 @@ def main():
         num_categories = 3
 
     model_start_time = time.time()
-    spatial_net=buildModel(model_path,num_categories)
+    if args.exported:
+        spatial_net=load_exported(args.exported, args.arch, 'cuda')
+    else:
+        spatial_net=buildModel(model_path,num_categories)
     model_end_time = time.time()
     model_time = model_end_time - model_start_time
     print("Action recognition model is loaded in %4.4f seconds." % (model_time))
@@ -187,6 +200,8 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch,
+                                                    crop_mode_name(ten_crop_enabled, multiple_clips=True)))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -195,6 +210,7 @@ def main():
         
         start = time.time()
         print(clip_path)
+        video_scores = []
         spatial_prediction = VideoSpatialPrediction3D(
             clip_path,
             spatial_net,
@@ -204,7 +220,8 @@ def main():
             duration,
             length = length, 
             extension = extension,
-            ten_crop = ten_crop_enabled)
+            ten_crop = ten_crop_enabled,
+            scores = video_scores)
             
         
         end = time.time()
@@ -212,6 +229,7 @@ def main():
         timeList.append(estimatedTime)
         
         pred_index, _, top3 = spatial_prediction
+        score_cache.add(line_info[0], input_video_label, video_scores[0])
         
         print("Sample %d/%d: GT: %d, Prediction: %d" % (line_id, len(val_list), input_video_label, pred_index))
         print("Estimated Time  %0.4f" % estimatedTime)
@@ -245,6 +263,7 @@ def main():
     resultDict={'y_true':y_true,'y_pred':y_pred}
     
     np.save('results/%s.npy' %(args.dataset+args.arch+"_split"+str(args.split)), resultDict) 
+    score_cache.save()
 
 if __name__ == "__main__":
     main()
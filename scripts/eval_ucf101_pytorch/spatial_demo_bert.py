@@ -14,6 +14,7 @@ import math
 import random
 import time
 import argparse
+import functools
 
 from ptflops import get_model_complexity_info
 
@@ -31,8 +32,13 @@ from sklearn.metrics import confusion_matrix
 datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 import models
-from VideoSpatialPrediction_bert import VideoSpatialPrediction_bert
-from VideoSpatialPrediction3D_bert import VideoSpatialPrediction3D_bert
+from utils.mixed_precision import AutocastModel
+from models.BERT.bert import set_attention_backend, attention_backends
+from models.temporal_sampling import set_pre_strided, input_stride, strided_length
+from VideoSpatialPrediction_bert import VideoSpatialPrediction_bert, VideoSpatialInput_bert
+from VideoSpatialPrediction3D_bert import VideoSpatialPrediction3D_bert, VideoSpatialInput3D_bert
+from BatchedVideoPrediction import BatchedVideoPrediction
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
 os.environ["CUDA_VISIBLE_DEVICES"]="1"
@@ -63,6 +69,17 @@ parser.add_argument('-t', '--tsn', dest='tsn', action='store_true',
 parser.add_argument('-v', '--val', dest='window_val', action='store_true',
                     help='Window Validation Selection')
 
+parser.add_argument('-b', '--batch-size', default=0, type=int, metavar='N',
+                    help='clips per forward pass across videos, 0 runs one video at a time (default: 0)')
+
+parser.add_argument('-j', '--workers', default=4, type=int, metavar='N',
+                    help='number of video reading workers of the batched mode (default: 4)')
+
+parser.add_argument('--attention', default='dense', choices=attention_backends,
+                    help='BERT attention: dense (score matrix) | sdpa (fused kernel, key padding mask)')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='run the nets under autocast (mixed precision)')
+
 multiGPUTest = False
 multiGPUTrain = False
 ten_crop_enabled = False
@@ -71,6 +88,8 @@ num_seg_3D=1
 
 result_dict = {}
 
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
 def buildModel(model_path,num_categories):
     if '3D' in args.arch:
         model=models.__dict__[args.arch](modelPath='', num_classes=num_categories,length=num_seg_3D)
@@ -80,7 +99,7 @@ def buildModel(model_path,num_categories):
         model=models.__dict__[args.arch](modelPath='', num_classes=num_categories,length=num_seg)
 
     
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     if args.tsn:
         new_dict = {k[7:]: v for k, v in params['state_dict'].items()} 
         model_dict=model.state_dict() 
@@ -98,8 +117,13 @@ def buildModel(model_path,num_categories):
         model.load_state_dict(model_dict)
     else:
         model.load_state_dict(params['state_dict'])
-    model.cuda()
+    set_attention_backend(model, args.attention)
+    # the clips are read with the temporal stride of the model
+    set_pre_strided(model)
+    model.to(device)
     model.eval()  
+    if args.amp:
+        model = AutocastModel(model)
     return model
 
 
@@ -169,7 +193,8 @@ def main():
     model_time = model_end_time - model_start_time
     print("Action recognition model is loaded in %4.4f seconds." % (model_time))
     
-    flops, params = get_model_complexity_info(spatial_net, (3,length, 224, 224), as_strings=True, print_per_layer_stat=False)
+    temporal_stride = input_stride(spatial_net)
+    flops, params = get_model_complexity_info(spatial_net, (3,strided_length(length, temporal_stride), 224, 224), as_strings=True, print_per_layer_stat=False)
     #flops, params = get_model_complexity_info(spatial_net, (3, 224, 224), as_strings=True, print_per_layer_stat=False)
     print('{:<30}  {:<8}'.format('Computational complexity: ', flops))
     print('{:<30}  {:<8}'.format('Number of parameters: ', params))
@@ -186,6 +211,33 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch,
+                                                    crop_mode_name(ten_crop_enabled)))
+    is_3D = '3D' in args.arch or 'tsm' in args.arch or 'r2plus1d' in args.arch \
+        or 'rep_flow' in args.arch or 'slowfast' in args.arch
+    if args.batch_size > 0:
+        if is_3D:
+            input_fn = functools.partial(VideoSpatialInput3D_bert,
+                                         architecture_name=args.arch,
+                                         start_frame=start_frame,
+                                         num_seg=num_seg_3D,
+                                         length=length,
+                                         extension=extension,
+                                         ten_crop=ten_crop_enabled,
+                                         temporal_stride=temporal_stride)
+            rows_per_output = 1
+        else:
+            input_fn = functools.partial(VideoSpatialInput_bert,
+                                         architecture_name=args.arch,
+                                         start_frame=start_frame,
+                                         num_seg=num_seg,
+                                         extension=extension,
+                                         ten_crop=ten_crop_enabled)
+            rows_per_output = num_seg
+        batch_scores = {}
+        predictions = BatchedVideoPrediction(val_list, data_dir, spatial_net, input_fn,
+                                             rows_per_output, args.batch_size, args.workers,
+                                             batch_scores)
     with open('%s.csv' %(args.arch), mode='w') as result_csvfile:
         employee_writer = csv.writer(result_csvfile, delimiter=';')    
         for i,line in enumerate(val_list):
@@ -196,8 +248,11 @@ def main():
             
             start = time.time()
             
-            if '3D' in args.arch or 'tsm' in args.arch or 'r2plus1d' in args.arch \
-                or 'rep_flow' in args.arch or 'slowfast' in args.arch:
+            video_scores = []
+            if args.batch_size > 0:
+                index, spatial_prediction = next(predictions)
+                video_scores.append(batch_scores.pop(index))
+            elif is_3D:
                 spatial_prediction = VideoSpatialPrediction3D_bert(
                     clip_path,
                     spatial_net,
@@ -208,7 +263,8 @@ def main():
                     num_seg=num_seg_3D ,
                     length = length, 
                     extension = extension,
-                    ten_crop = ten_crop_enabled)
+                    ten_crop = ten_crop_enabled,
+                    scores = video_scores)
             
             else:
                 spatial_prediction = VideoSpatialPrediction_bert(
@@ -220,13 +276,15 @@ def main():
                         duration,
                         num_seg=num_seg,
                         extension = extension,
-                        ten_crop = ten_crop_enabled)
+                        ten_crop = ten_crop_enabled,
+                        scores = video_scores)
                 
             end = time.time()
             estimatedTime=end-start
             timeList.append(estimatedTime)
             
             pred_index, mean_result, top3 = spatial_prediction
+            score_cache.add(line_info[0], input_video_label, video_scores[0])
             if args.dataset=='smtV2' and 'test' in val_fileName:
                 top5 = np.argsort(mean_result)[::-1][:5]                   
                 employee_writer.writerow([line_info[0], str(top5[0]), str(top5[1]),str(top5[2]),str(top5[3]),str(top5[4])])
@@ -263,6 +321,7 @@ def main():
         resultDict={'y_true':y_true,'y_pred':y_pred}
         
         np.save('results/%s.npy' %(args.dataset+args.arch+"_split"+str(args.split)), resultDict) 
+        score_cache.save()
 
 if __name__ == "__main__":
     main()
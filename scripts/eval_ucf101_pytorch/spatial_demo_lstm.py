@@ -30,6 +30,7 @@ datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 import models
 from VideoSpatialPrediction_lstm import VideoSpatialPrediction_lstm
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
@@ -148,6 +149,8 @@ def main():
     averagePackageCorrectionList=[]
     totalPackage=0
     #result_list = []
+    score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch,
+                                                    crop_mode_name(ten_crop=True)))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -161,6 +164,7 @@ def main():
                 start_frame,
                 duration)
 
+        score_cache.add(line_info[0], input_video_label, spatial_prediction.T)
         numberofPackage=int(spatial_prediction.shape[1]/16)
         packageResult=np.argmax(np.mean(np.reshape(spatial_prediction,(num_categories,numberofPackage,16)),2),0)
         binCount=np.bincount(packageResult,minlength=num_categories)
@@ -291,6 +295,7 @@ def main():
                 'y_pred_package':y_pred_package}
     
     np.save('results/%s.npy' %(args.dataset+args.arch+"_split"+str(args.split)), resultDict) 
+    score_cache.save()
 
 if __name__ == "__main__":
     main()
@@ -30,6 +30,7 @@ datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 import models
 from VideoSpatialPrediction_lstm2 import VideoSpatialPrediction_lstm2
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
@@ -122,6 +123,8 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch,
+                                                    crop_mode_name(ten_crop=True)))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -129,18 +132,21 @@ def main():
         input_video_label = int(line_info[2]) 
 
         start = time.time()
+        video_scores = []
         spatial_prediction = VideoSpatialPrediction_lstm2(
                 clip_path,
                 spatial_net,
                 num_categories,
                 start_frame,
-                duration)
+                duration,
+                scores=video_scores)
         
         end = time.time()
         estimatedTime=end-start
         timeList.append(estimatedTime)
         
         pred_index = spatial_prediction
+        score_cache.add(line_info[0], input_video_label, video_scores[0])
         
         print("Sample %d/%d: GT: %d, Prediction: %d" % (line_id, len(val_list), input_video_label, pred_index))
         print("Estimated Time  %0.4f" % estimatedTime)
@@ -162,6 +168,7 @@ def main():
     resultDict={'y_true':y_true,'y_pred':y_pred}
     
     np.save('results/%s.npy' %(args.dataset+args.arch+"_split"+str(args.split)), resultDict) 
+    score_cache.save()
 
 if __name__ == "__main__":
     main()
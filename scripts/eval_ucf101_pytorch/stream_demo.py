@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Online action recognition on a camera, a video file or a folder of frames.
+
+Feeds the frames one by one to VideoStreamPrediction and prints a prediction
+every --stride frames over the last --length frames.
+
+usage: python stream_demo.py -d window -a rgb_resnet18_bert10 --source 0 --length 32 --stride 4
+"""
+
+import os, sys
+import time
+import argparse
+
+import cv2
+import torch
+
+sys.path.insert(0, "../../")
+import models
+from VideoStreamPrediction import VideoStreamPrediction
+
+model_names = sorted(name for name in models.__dict__
+    if not name.startswith("__")
+    and callable(models.__dict__[name]))
+
+parser = argparse.ArgumentParser(description='PyTorch Online Action Recognition')
+
+parser.add_argument('--dataset', '-d', default='window',
+                    choices=["ucf101", "hmdb51", "smtV2", "window"],
+                    help='dataset the model was trained on: ucf101 | hmdb51 | smtV2 | window')
+parser.add_argument('--arch', '-a', metavar='ARCH', default='rgb_resnet18_bert10',
+                    choices=model_names)
+parser.add_argument('-s', '--split', default=1, type=int, metavar='S',
+                    help='which split the model was trained on (default: 1)')
+parser.add_argument('--source', default='0', type=str,
+                    help='camera index, video file or folder of img_*.jpg frames (default: 0)')
+parser.add_argument('--length', default=0, type=int, metavar='N',
+                    help='frames in the ring buffer, 0 for the clip length of 3D models '
+                         'and --num-seg for 2D models (default: 0)')
+parser.add_argument('--stride', default=4, type=int, metavar='K',
+                    help='predict every K frames (default: 4)')
+parser.add_argument('--num-seg', default=16, type=int, metavar='N',
+                    help='frames per window of 2D models (default: 16)')
+
+dataset_classes = {'ucf101': 101, 'hmdb51': 51, 'smtV2': 174, 'window': 3}
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def read_frames(source):
+    """BGR frames of a camera index, a video file or a folder of frames."""
+    if os.path.isdir(source):
+        for name in sorted(item for item in os.listdir(source) if 'img' in item):
+            yield cv2.imread(os.path.join(source, name), cv2.IMREAD_UNCHANGED)
+        return
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+def main():
+    global args
+    args = parser.parse_args()
+    is_3D = '3D' in args.arch or 'r2plus1d' in args.arch
+    if '64f' in args.arch:
+        clip_length=64
+    elif '32f' in args.arch:
+        clip_length=32
+    elif '8f' in args.arch:
+        clip_length=8
+    else:
+        clip_length=16
+    if args.length == 0:
+        args.length = clip_length if is_3D else args.num_seg
+
+    modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
+    model_path = os.path.join('../../',modelLocation,'model_best.pth.tar')
+    num_seg = 1 if is_3D else args.num_seg
+    model=models.__dict__[args.arch](modelPath='', num_classes=dataset_classes[args.dataset],length=num_seg)
+    params = torch.load(model_path, map_location=device)
+    model.load_state_dict(params['state_dict'])
+    model.to(device)
+    model.eval()
+
+    stream = VideoStreamPrediction(model, args.arch, length=args.length, stride=args.stride,
+                                   num_seg=args.num_seg)
+    print("%s on %s, %d frame window, prediction every %d frames%s"
+          % (args.arch, device, args.length, args.stride,
+             ", backbone features reused" if stream.reuse_features else ""))
+    start = time.time()
+    for frame in read_frames(args.source):
+        spatial_prediction = stream.push(frame)
+        if spatial_prediction is None:
+            continue
+        prediction, mean_result, top3 = spatial_prediction
+        print("frame %d: class %d (%.3f), top3 %s, %.1f frames/sec"
+              % (stream.frame_count, prediction, mean_result[prediction], list(top3),
+                 stream.frame_count / (time.time() - start)))
+    if stream.reuse_features:
+        print("%d frames, %d backbone passes" % (stream.frame_count, stream.backbone_frames))
+
+
+if __name__ == '__main__':
+    main()
@@ -30,8 +30,10 @@ from sklearn.metrics import confusion_matrix
 datasetFolder="../../datasets"
 sys.path.insert(0, "../../")
 import models
+from utils.mixed_precision import AutocastModel
 from VideoTemporalPrediction_bert import VideoTemporalPrediction_bert
 from VideoTemporalPrediction3D import VideoTemporalPrediction3D
+from ScoreCache import ScoreCacheWriter, score_cache_path, crop_mode_name
 
 
 os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"   
@@ -61,6 +63,8 @@ parser.add_argument('-t', '--tsn', dest='tsn', action='store_true',
 
 parser.add_argument('-v', '--val', dest='window_val', action='store_true',
                     help='Window Validation Selection')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='run the nets under autocast (mixed precision)')
 multiGPUTest=False
 multiGPUTrain=False
 
@@ -89,6 +93,8 @@ def buildModel(model_path,num_categories):
         model.load_state_dict(params['state_dict'])
     model.cuda()
     model.eval()  
+    if args.amp:
+        model = AutocastModel(model)
     return model
 
 
@@ -144,6 +150,8 @@ def main():
     y_pred=[]
     timeList=[]
     #result_list = []
+    score_cache = ScoreCacheWriter(score_cache_path(args.dataset, args.split, args.arch,
+                                                    crop_mode_name(ten_crop=True)))
     for line in val_list:
         line_info = line.split(" ")
         clip_path = os.path.join(data_dir,line_info[0])
@@ -152,6 +160,7 @@ def main():
         
         start = time.time()
         
+        video_scores = []
         if not '3D' in args.arch:
             spatial_prediction,_ = VideoTemporalPrediction_bert(
                     clip_path,
@@ -160,7 +169,8 @@ def main():
                     start_frame,
                     duration,
                     num_seg=num_seg,
-                    length = length)
+                    length = length,
+                    scores = video_scores)
         else:
             spatial_prediction,_ = VideoTemporalPrediction3D(
                 clip_path,
@@ -169,7 +179,8 @@ def main():
                 start_frame,
                 duration,
                 num_seg = num_seg_3D,
-                length = 64)        
+                length = 64,
+                scores = video_scores)        
         
         
         end = time.time()
@@ -177,6 +188,7 @@ def main():
         timeList.append(estimatedTime)
         
         pred_index = spatial_prediction
+        score_cache.add(line_info[0], input_video_label, video_scores[0])
         
         print("Sample %d/%d: GT: %d, Prediction: %d" % (line_id, len(val_list), input_video_label, pred_index))
         print("Estimated Time  %0.4f" % estimatedTime)
@@ -198,6 +210,7 @@ def main():
     resultDict={'y_true':y_true,'y_pred':y_pred}
     
     np.save('results/%s.npy' %(args.dataset+args.arch+"_split"+str(args.split)), resultDict) 
+    score_cache.save()
 
 if __name__ == "__main__":
     main()
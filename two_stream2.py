@@ -30,6 +30,9 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
+from models.activation_checkpointing import set_activation_checkpointing
 import datasets
 import swats
 
@@ -82,6 +85,12 @@ parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                     help='evaluate model on validation set')
 parser.add_argument('-c', '--continue', dest='contine', action='store_true',
                     help='evaluate model on validation set')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--activation-checkpointing', default=0, type=int, metavar='N',
+                    help='recompute the 3D backbone stages in N checkpointed segments to fit larger batches (default: 0, off)')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 
@@ -91,7 +100,8 @@ warmUpEpoch=5
 learning_rate_index = 0
 max_learning_rate_decay_count = 3
 best_in_existing_learning_rate = 0
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
 
 select_according_to_best_classsification_lost = False #Otherwise select according to top1 default: False
 
@@ -99,7 +109,10 @@ training_continue = False
 def main():
     global args, best_prec1,model,writer,best_loss, length, width, height
     global max_learning_rate_decay_count, best_in_existing_learning_rate, learning_rate_index, input_size
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     training_continue = args.contine
     if '3D' in args.arch:
         if 'I3D' in args.arch or 'MFNET3D' in args.arch:
@@ -138,12 +151,8 @@ def main():
         model = build_model()
         #model = build_model_validate()
     
-    if HALF:
-        model.half()  # convert to half precision
-        for layer in model.modules():
-            if isinstance(layer, nn.BatchNorm2d):
-                layer.float()
     
+    set_activation_checkpointing(model, args.activation_checkpointing)
     print("Model %s is loaded. " % (args.arch))
 
     # define loss function (criterion) and optimizer
@@ -397,6 +406,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -407,6 +417,7 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
@@ -486,6 +497,8 @@ def build_model_continue():
         dampening=0.9,
         weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     
     startEpoch = params['epoch']
     best_prec = params['best_prec1']
@@ -523,13 +536,10 @@ def train(train_loader, model, criterion, optimizer, epoch,modality):
         elif modality == "both":
             inputs=inputs.view(-1,5*length,input_size,input_size)
             
-        if HALF:
-            inputs = inputs.cuda().half()
-        else:
-            inputs = inputs.cuda()
+        inputs = inputs.cuda()
         targets = targets.cuda()
         
-        output = model(inputs)
+        output = mixed_precision.forward(model, inputs)
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
         acc_mini_batch += prec1.item()
         acc_mini_batch_top3 += prec3.item()
@@ -543,11 +553,11 @@ def train(train_loader, model, criterion, optimizer, epoch,modality):
         totalLoss=lossClassification 
         #totalLoss = lossMSE + lossClassification 
         loss_mini_batch_classification += lossClassification.data.item()
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             top1.update(acc_mini_batch/args.iter_size, totalSamplePerIter)
@@ -612,14 +622,11 @@ def validate(val_loader, model, criterion,modality):
             elif modality == "both":
                 inputs=inputs.view(-1,5*length,input_size,input_size)
                 
-            if HALF:
-                inputs = inputs.cuda().half()
-            else:
-                inputs = inputs.cuda()
+            inputs = inputs.cuda()
             targets = targets.cuda()
     
             # compute output
-            output= model(inputs)
+            output= mixed_precision.forward(model, inputs)
                 
             lossClassification = criterion(output, targets)
     
@@ -642,11 +649,7 @@ def validate(val_loader, model, criterion,modality):
     return top1.avg, top3.avg, lossesClassification.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -29,6 +29,9 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
+from utils import distributed
 import datasets
 import swats
 
@@ -95,6 +98,21 @@ parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                     help='evaluate model on validation set')
 parser.add_argument('-c', '--continue', dest='contine', action='store_true',
                     help='continue training')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--nproc', default=1, type=int, metavar='N',
+                    help='training processes on this machine, one per GPU, with DistributedDataParallel (default: 1)')
+parser.add_argument('--num-shards', default=1, type=int, metavar='N',
+                    help='machines of the distributed run (default: 1)')
+parser.add_argument('--shard-id', default=0, type=int, metavar='N',
+                    help='index of this machine in the distributed run (default: 0)')
+parser.add_argument('--init-method', default='tcp://localhost:9999', type=str,
+                    help='rendezvous of the distributed run (default: tcp://localhost:9999)')
+parser.add_argument('--dist-backend', default='nccl' if torch.cuda.is_available() else 'gloo',
+                    choices=['nccl', 'gloo'],
+                    help='distributed backend: nccl | gloo, which also runs on CPU (default: nccl with GPUs)')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
@@ -103,14 +121,24 @@ warmUpEpoch=5
 learning_rate_index = 0
 max_learning_rate_decay_count = 3
 best_in_existing_learning_rate = 0
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 training_continue = False
 
 def main():
+    distributed.launch(main_worker, parser.parse_args())
+
+def main_worker(parsed_args):
     global args, best_prec1,model ,writer, best_loss, length, width, height, model_teacher1, model_teacher2, model_teacher3
     global max_learning_rate_decay_count, best_in_existing_learning_rate, learning_rate_index, input_size
-    args = parser.parse_args()
+    global mixed_precision
+    global device
+    args = parsed_args
+    device = distributed.process_device()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     
     input_size = 224
@@ -118,9 +146,12 @@ def main():
     height = 256
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
-    if not os.path.exists(saveLocation):
-        os.makedirs(saveLocation)
-    writer = SummaryWriter(saveLocation)
+    if distributed.is_main_process():
+        if not os.path.exists(saveLocation):
+            os.makedirs(saveLocation)
+        writer = SummaryWriter(saveLocation)
+    else:
+        writer = distributed.NullWriter()
    
     # create model
 
@@ -131,30 +162,30 @@ def main():
         print("Building model ... ")
         model = build_model(args.arch)
         
-        model_teacher1 = build_model(args.arch_teacher1)
+        model_teacher1 = build_model(args.arch_teacher1, trainable=False)
         modelLocation1="./checkpoint/"+args.dataset+"_"+args.arch_teacher1+"_split"+str(args.split)
 
         model_path = os.path.join(modelLocation1,'model_best.pth.tar') 
-        params = torch.load(model_path)
-        model_teacher1.load_state_dict(params['state_dict'])
+        params = torch.load(model_path, map_location=device)
+        distributed.load_state_dict(model_teacher1, params['state_dict'])
         for param in model_teacher1.parameters():
             param.requires_grad = False
             
-        model_teacher2 = build_model(args.arch_teacher2)
+        model_teacher2 = build_model(args.arch_teacher2, trainable=False)
         modelLocation2="./checkpoint/"+args.dataset+"_"+args.arch_teacher2+"_split"+str(args.split)
 
         model_path = os.path.join(modelLocation2,'model_best.pth.tar') 
-        params = torch.load(model_path)
-        model_teacher2.load_state_dict(params['state_dict'])
+        params = torch.load(model_path, map_location=device)
+        distributed.load_state_dict(model_teacher2, params['state_dict'])
         for param in model_teacher2.parameters():
             param.requires_grad = False
             
-        model_teacher3 = build_model(args.arch_teacher3)
+        model_teacher3 = build_model(args.arch_teacher3, trainable=False)
         modelLocation3="./checkpoint/"+args.dataset+"_"+args.arch_teacher3+"_split"+str(args.split)
 
         model_path = os.path.join(modelLocation3,'model_best.pth.tar') 
-        params = torch.load(model_path)
-        model_teacher3.load_state_dict(params['state_dict'])
+        params = torch.load(model_path, map_location=device)
+        distributed.load_state_dict(model_teacher3, params['state_dict'])
         for param in model_teacher3.parameters():
             param.requires_grad = False
             
@@ -163,8 +194,8 @@ def main():
     print("Model %s is loaded. " % (args.arch))
 
     # define loss function (criterion) and optimizer
-    criterion = nn.CrossEntropyLoss().cuda()
-    criterion_mse = nn.MSELoss().cuda()
+    criterion = nn.CrossEntropyLoss().to(device)
+    criterion_mse = nn.MSELoss().to(device)
     
 
     optimizer = torch.optim.SGD(
@@ -275,13 +306,14 @@ def main():
                                                                            len(train_dataset),
                                                                            len(val_dataset)))
 
+    train_sampler = distributed.data_sampler(train_dataset, shuffle=True)
     train_loader = torch.utils.data.DataLoader(
         train_dataset,
-        batch_size=args.batch_size, shuffle=True,
+        batch_size=args.batch_size, shuffle=(train_sampler is None), sampler=train_sampler,
         num_workers=args.workers, pin_memory=True)
     val_loader = torch.utils.data.DataLoader(
         val_dataset,
-        batch_size=args.batch_size, shuffle=False,
+        batch_size=args.batch_size, shuffle=False, sampler=distributed.data_sampler(val_dataset, shuffle=False),
         num_workers=args.workers, pin_memory=True)
 
     if args.evaluate:
@@ -289,6 +321,7 @@ def main():
         return
 
     for epoch in range(args.start_epoch, args.epochs):
+        distributed.set_epoch(train_loader, epoch)
 #        if learning_rate_index > max_learning_rate_decay_count:
 #            break
 #        adjust_learning_rate4(optimizer, learning_rate_index)
@@ -329,6 +362,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -339,12 +373,13 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
 
 
-def build_model(architecture_name):
+def build_model(architecture_name, trainable=True):
     modality=architecture_name.split('_')[0]
     if modality == "rgb":
         model_path = rgb_3d_model_path_selection(architecture_name)
@@ -369,38 +404,36 @@ def build_model(architecture_name):
         print('model path is: %s' %(model_path))
         model = models.__dict__[architecture_name](modelPath=model_path, num_classes=51, length=args.num_seg)
 
-    if torch.cuda.device_count() > 1:
-        model=torch.nn.DataParallel(model)    
-    model = model.cuda()
+    model = distributed.parallel_model(model, device, trainable)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
-    model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    distributed.load_state_dict(model, params['state_dict'])
+    model = distributed.parallel_model(model, device)
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
-    model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    distributed.load_state_dict(model, params['state_dict'])
+    model = distributed.parallel_model(model, device)
     optimizer = torch.optim.SGD(
         model.parameters(),
         lr=args.lr,
@@ -408,6 +441,8 @@ def build_model_continue():
         dampening=0.9,
         weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     
     startEpoch = params['epoch']
     best_prec = params['best_prec1']
@@ -421,7 +456,7 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
     top1 = AverageMeter()
     top3 = AverageMeter()
     
-    mse_loss_coeff = torch.tensor(50 / 3).cuda()
+    mse_loss_coeff = torch.tensor(50 / 3).to(device)
     # switch to train mode
     model.train()
 
@@ -438,17 +473,18 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
         input_teacher2 = input_teacher2.view(-1,length,3, input_teacher2.shape[-1], input_teacher2.shape[-1]).transpose(1,2)
         input_teacher3 = input_teacher3.view(-1,length,3, input_teacher3.shape[-1], input_teacher3.shape[-1]).transpose(1,2)
        
-        input_student = input_student.cuda()
-        input_teacher1 = input_teacher1.cuda()
-        input_teacher2 = input_teacher2.cuda()
-        input_teacher3 = input_teacher3.cuda()
+        input_student = input_student.to(device)
+        input_teacher1 = input_teacher1.to(device)
+        input_teacher2 = input_teacher2.to(device)
+        input_teacher3 = input_teacher3.to(device)
         
-        targets = targets.cuda()
+        targets = targets.to(device)
         
-        output, features_student1, features_student2, features_student3 = model.ensemble_forward(input_student)
-        features_teacher1 = model_teacher1.mars_forward(input_teacher1)
-        features_teacher2 = model_teacher2.mars_forward(input_teacher2)
-        features_teacher3 = model_teacher3.mars_forward(input_teacher3)
+        distributed.set_gradient_sync(model, (i+1) % args.iter_size == 0)
+        output, features_student1, features_student2, features_student3 = mixed_precision.forward(model.ensemble_forward, input_student)
+        features_teacher1 = mixed_precision.forward(model_teacher1.mars_forward, input_teacher1)
+        features_teacher2 = mixed_precision.forward(model_teacher2.mars_forward, input_teacher2)
+        features_teacher3 = mixed_precision.forward(model_teacher3.mars_forward, input_teacher3)
         
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
         acc_mini_batch += prec1.item()
@@ -471,11 +507,11 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
         loss_mini_batch_classification += lossClassification.data.item()
         loss_mini_batch_MSE += lossMSE.data.item()
         
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -493,6 +529,7 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
                 batch_time.avg, lossesClassification.avg, lossesMSE.avg))
 
           
+    distributed.all_reduce_meters(lossesClassification, lossesMSE, top1, top3)
     print(' * Epoch: {epoch} Prec@1 {top1.avg:.3f} Prec@3 {top3.avg:.3f} Classification Loss {lossClassification.avg:.4f} '
           'MSE Loss {lossMSE.avg:.4f}\n'
           .format(epoch = epoch, top1=top1, top3=top3, lossClassification=lossesClassification, lossMSE=lossesMSE))
@@ -516,17 +553,17 @@ def validate(val_loader, model, criterion, criterion_mse):
             input_teacher2 = input_teacher2.view(-1,length,3, input_teacher2.shape[-1], input_teacher2.shape[-1]).transpose(1,2)
             input_teacher3 = input_teacher3.view(-1,length,3, input_teacher3.shape[-1], input_teacher3.shape[-1]).transpose(1,2)
            
-            input_student = input_student.cuda()
-            input_teacher1 = input_teacher1.cuda()
-            input_teacher2 = input_teacher2.cuda()
-            input_teacher3 = input_teacher3.cuda()
+            input_student = input_student.to(device)
+            input_teacher1 = input_teacher1.to(device)
+            input_teacher2 = input_teacher2.to(device)
+            input_teacher3 = input_teacher3.to(device)
             
-            targets = targets.cuda()
+            targets = targets.to(device)
             
-            output, features_student1, features_student2, features_student3 = model.ensemble_forward(input_student)
-            features_teacher1 = model_teacher1.mars_forward(input_teacher1)
-            features_teacher2 = model_teacher2.mars_forward(input_teacher2)
-            features_teacher3 = model_teacher3.mars_forward(input_teacher3)
+            output, features_student1, features_student2, features_student3 = mixed_precision.forward(model.ensemble_forward, input_student)
+            features_teacher1 = mixed_precision.forward(model_teacher1.mars_forward, input_teacher1)
+            features_teacher2 = mixed_precision.forward(model_teacher2.mars_forward, input_teacher2)
+            features_teacher3 = mixed_precision.forward(model_teacher3.mars_forward, input_teacher3)
             
             #lossRanking = criterion(out_rank, targetRank)
             lossClassification = criterion(output, targets)
@@ -550,6 +587,7 @@ def validate(val_loader, model, criterion, criterion_mse):
             end = time.time()
     
     
+        distributed.all_reduce_meters(lossesClassification, lossesMSE, top1, top3)
         print(' * * Prec@1 {top1.avg:.3f} Prec@3 {top3.avg:.3f} Classification Loss {lossClassification.avg:.4f} ' 
               'MSE Loss {lossMSE.avg:.4f}\n'
               .format(top1=top1, top3=top3, lossClassification=lossesClassification, lossMSE=lossesMSE))
@@ -557,11 +595,9 @@ def validate(val_loader, model, criterion, criterion_mse):
     return top1.avg, top3.avg, lossesClassification.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    if not distributed.is_main_process():
+        return
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -29,11 +29,17 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
+from utils import distributed
+from models.activation_checkpointing import set_activation_checkpointing
 import datasets
 import swats
 
 from opt.AdamW import AdamW
 from utils.model_path import rgb_3d_model_path_selection
+from utils.feature_bank import FeatureBank
+from datasets.teacher_bank import TeacherBankSampling, bank_replay, split_clip_key
 
 
 model_names = sorted(name for name in models.__dict__
@@ -86,6 +92,31 @@ parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                     help='evaluate model on validation set')
 parser.add_argument('-c', '--continue', dest='contine', action='store_true',
                     help='continue training')
+parser.add_argument('--device-augment', dest='device_augment', action='store_true',
+                    help='crop, flip and normalize on the GPU instead of in the loader workers')
+parser.add_argument('--teacher-bank', default='', type=str, metavar='DIR',
+                    help='read the teacher features from a feature bank instead of running the teacher')
+parser.add_argument('--teacher-bank-draws', default=4, type=int, metavar='N',
+                    help='augmented clips stored per training video in the teacher bank (default: 4)')
+parser.add_argument('--teacher-bank-dump', action='store_true',
+                    help='fill the teacher bank and exit without training')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--activation-checkpointing', default=0, type=int, metavar='N',
+                    help='recompute the 3D backbone stages in N checkpointed segments to fit larger batches (default: 0, off)')
+parser.add_argument('--nproc', default=1, type=int, metavar='N',
+                    help='training processes on this machine, one per GPU, with DistributedDataParallel (default: 1)')
+parser.add_argument('--num-shards', default=1, type=int, metavar='N',
+                    help='machines of the distributed run (default: 1)')
+parser.add_argument('--shard-id', default=0, type=int, metavar='N',
+                    help='index of this machine in the distributed run (default: 0)')
+parser.add_argument('--init-method', default='tcp://localhost:9999', type=str,
+                    help='rendezvous of the distributed run (default: tcp://localhost:9999)')
+parser.add_argument('--dist-backend', default='nccl' if torch.cuda.is_available() else 'gloo',
+                    choices=['nccl', 'gloo'],
+                    help='distributed backend: nccl | gloo, which also runs on CPU (default: nccl with GPUs)')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
@@ -94,7 +125,11 @@ warmUpEpoch=5
 learning_rate_index = 0
 max_learning_rate_decay_count = 3
 best_in_existing_learning_rate = 0
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+device_augmentation = None
+teacher_bank = None
 lrPlateuPrec1 = False
 
 save_everything = True
@@ -104,9 +139,21 @@ cosine_similarity_enabled = False
 training_continue = False
 msecoeff = 2500
 def main():
+    distributed.launch(main_worker, parser.parse_args())
+
+def main_worker(parsed_args):
     global args, best_prec1,model ,writer, best_loss, length, width, height, model_teacher, msecoeff
     global max_learning_rate_decay_count, best_in_existing_learning_rate, learning_rate_index, input_size, teacher_rgb
-    args = parser.parse_args()
+    global device_augmentation, teacher_bank, teacher_dataset, student_augmentation, teacher_augmentation
+    global mixed_precision
+    global device
+    args = parsed_args
+    device = distributed.process_device()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
+    if args.teacher_bank and distributed.is_distributed():
+        print("The teacher bank is filled by a single process, train without --nproc")
+        return
     
     if '3D' in args.arch:
         if 'I3D' in args.arch or 'MFNET3D' in args.arch:
@@ -128,9 +175,12 @@ def main():
     height = int(256 * scale)
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
-    if not os.path.exists(saveLocation):
-        os.makedirs(saveLocation)
-    writer = SummaryWriter(saveLocation)
+    if distributed.is_main_process():
+        if not os.path.exists(saveLocation):
+            os.makedirs(saveLocation)
+        writer = SummaryWriter(saveLocation)
+    else:
+        writer = distributed.NullWriter()
    
     # create model
     
@@ -145,33 +195,30 @@ def main():
     else:
         print("Building model ... ")
         model = build_model(args.arch)
-        model_teacher = build_model(args.arch_teacher)
+        model_teacher = build_model(args.arch_teacher, trainable=False)
         modelLocation="./checkpoint/"+args.dataset+"_"+args.arch_teacher+"_split"+str(args.split)
 
 
         model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-        params = torch.load(model_path)
-        if torch.cuda.device_count() > 1:
-            new_dict={"module."+k: v for k, v in params['state_dict'].items()} 
-            model_teacher.load_state_dict(new_dict)
-        else:
-            model_teacher.load_state_dict(params['state_dict'])
+        params = torch.load(model_path, map_location=device)
+        distributed.load_state_dict(model_teacher, params['state_dict'])
 
         for param in model_teacher.parameters():
             param.requires_grad = False
             
             
     
+    set_activation_checkpointing(model, args.activation_checkpointing)
     print("Model %s is loaded. " % (args.arch))
 
     # define loss function (criterion) and optimizer
-    criterion = nn.CrossEntropyLoss().cuda()
+    criterion = nn.CrossEntropyLoss().to(device)
     if cosine_similarity_enabled:
         print("cosine similarity enabled")
-        criterion_mse = nn.CosineEmbeddingLoss().cuda()
+        criterion_mse = nn.CosineEmbeddingLoss().to(device)
     else:
         print("MSE enabled")
-        criterion_mse = nn.MSELoss().cuda()
+        criterion_mse = nn.MSELoss().to(device)
     
     if 'bert' in args.arch:
         print("Optimizer ADAMW")
@@ -255,6 +302,14 @@ def main():
         ])
 
 
+    if args.device_augment:
+        # workers only pick the crop and flip, the rest runs batched on the GPU
+        train_transform = video_transforms.MultiScaleCropParameters((input_size, input_size), scale_ratios)
+        val_transform = video_transforms.CenterCropParameters((input_size))
+        device_augmentation = video_transforms.DeviceClipAugmentation((input_size, input_size),
+                                                                      clip_mean, clip_std, 1.0)
+        device_augmentation = device_augmentation.to(device)
+
     # data loading
     train_setting_file = "train_%s_split%d.txt" % ('both', args.split)
     train_split_file = os.path.join(args.settings, args.dataset, train_setting_file)
@@ -289,25 +344,81 @@ def main():
                                                                            len(train_dataset),
                                                                            len(val_dataset)))
 
+    train_sampler = distributed.data_sampler(train_dataset, shuffle=True)
     train_loader = torch.utils.data.DataLoader(
         train_dataset,
-        batch_size=args.batch_size, shuffle=True,
+        batch_size=args.batch_size, shuffle=(train_sampler is None), sampler=train_sampler,
         num_workers=args.workers, pin_memory=True)
     val_loader = torch.utils.data.DataLoader(
         val_dataset,
-        batch_size=args.batch_size, shuffle=False,
+        batch_size=args.batch_size, shuffle=False, sampler=distributed.data_sampler(val_dataset, shuffle=False),
         num_workers=args.workers, pin_memory=True)
 
+    if args.teacher_bank:
+        # The student reads only rgb frames and replays the clips stored in
+        # the bank; the flow frames are read only for clips that are missing.
+        if teacher_rgb:
+            teacher_modality = 'rgb'
+            teacher_channels = slice(0, 3)
+        else:
+            teacher_modality = 'flow'
+            teacher_channels = slice(3, 5)
+        student_augmentation = video_transforms.DeviceClipAugmentation((input_size, input_size),
+                                                                       clip_mean[0:3] * args.num_seg * length,
+                                                                       clip_std[0:3] * args.num_seg * length, 1.0)
+        teacher_augmentation = video_transforms.DeviceClipAugmentation((input_size, input_size),
+                                                                       clip_mean[teacher_channels] * args.num_seg * length,
+                                                                       clip_std[teacher_channels] * args.num_seg * length, 1.0)
+        student_augmentation = student_augmentation.to(device)
+        teacher_augmentation = teacher_augmentation.to(device)
+        student_dataset = datasets.__dict__[args.dataset](root=dataset,
+                                                          source=train_split_file,
+                                                          phase="train",
+                                                          modality="rgb",
+                                                          is_color=True,
+                                                          new_length=length,
+                                                          new_width=width,
+                                                          new_height=height,
+                                                          num_segments=args.num_seg)
+        teacher_dataset = datasets.__dict__[args.dataset](root=dataset,
+                                                          source=train_split_file,
+                                                          phase="train",
+                                                          modality=teacher_modality,
+                                                          is_color=teacher_rgb,
+                                                          new_length=length,
+                                                          new_width=width,
+                                                          new_height=height,
+                                                          num_segments=args.num_seg)
+        teacher_bank = FeatureBank(args.teacher_bank, capacity=args.teacher_bank_draws * len(student_dataset))
+        crop_transform = video_transforms.MultiScaleCropParameters((input_size, input_size), scale_ratios)
+        print("Teacher bank %s has %d clips" % (args.teacher_bank, len(teacher_bank)))
+        if args.teacher_bank_dump:
+            dump_loader = torch.utils.data.DataLoader(
+                TeacherBankSampling(teacher_dataset, crop_transform, draws=args.teacher_bank_draws),
+                batch_size=args.batch_size, shuffle=False,
+                num_workers=args.workers, pin_memory=True)
+            dump_teacher_bank(dump_loader)
+            return
+        train_loader = torch.utils.data.DataLoader(
+            TeacherBankSampling(student_dataset, crop_transform, draws=args.teacher_bank_draws),
+            batch_size=args.batch_size, shuffle=True,
+            num_workers=args.workers, pin_memory=True)
+
     if args.evaluate:
         prec1,prec3=validate(val_loader, model, criterion)
         return
 
     for epoch in range(args.start_epoch, args.epochs):
+        distributed.set_epoch(train_loader, epoch)
 #        if learning_rate_index > max_learning_rate_decay_count:
 #            break
 #        adjust_learning_rate4(optimizer, learning_rate_index)
         # train for one epoch
+        if teacher_bank is not None:
+            train_loader.dataset.replay = bank_replay(teacher_bank, args.num_seg)
         train(train_loader, model, criterion, criterion_mse, optimizer, epoch)
+        if teacher_bank is not None:
+            teacher_bank.flush()
 
         # evaluate on validation set
         prec1 = 0.0
@@ -347,6 +458,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
 
@@ -354,7 +466,7 @@ def main():
     writer.close()
 
 
-def build_model(architecture_name):
+def build_model(architecture_name, trainable=True):
     modality=architecture_name.split('_')[0]
     if modality == "rgb":
         model_path = rgb_3d_model_path_selection(architecture_name)
@@ -379,38 +491,36 @@ def build_model(architecture_name):
         print('model path is: %s' %(model_path))
         model = models.__dict__[architecture_name](modelPath=model_path, num_classes=51, length=args.num_seg)
 
-    if torch.cuda.device_count() > 1:
-        model=torch.nn.DataParallel(model)    
-    model = model.cuda()
+    model = distributed.parallel_model(model, device, trainable)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
-    model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    distributed.load_state_dict(model, params['state_dict'])
+    model = distributed.parallel_model(model, device)
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
-    model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    distributed.load_state_dict(model, params['state_dict'])
+    model = distributed.parallel_model(model, device)
     if 'bert' in args.arch:
         optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     else:
@@ -421,6 +531,8 @@ def build_model_continue():
             dampening=0.9,
             weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     
     startEpoch = params['epoch']
     best_prec = params['best_prec1']
@@ -435,11 +547,11 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
     top3 = AverageMeter()
     
     if 'bert' in args.arch:
-        mse_loss_coeff = torch.tensor(msecoeff).cuda()
+        mse_loss_coeff = torch.tensor(msecoeff).to(device)
     else:
-        mse_loss_coeff = torch.tensor(50).cuda()
+        mse_loss_coeff = torch.tensor(50).to(device)
     
-    c = torch.tensor(1).float().cuda()
+    c = torch.tensor(1).float().to(device)
     # switch to train mode
     model.train()
 
@@ -450,25 +562,36 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
     acc_mini_batch = 0.0
     acc_mini_batch_top3 = 0.0
     totalSamplePerIter=0
-    for i, (inputs, targets) in enumerate(train_loader):
-        inputs=inputs.view(-1,length,5,input_size,input_size).transpose(1,2)
-        inputs_student = inputs[:,:3,...]
-        if teacher_rgb:
-            inputs_teacher = inputs[:,:3,...]
+    for i, (inputs, targets, *keys) in enumerate(train_loader):
+        if teacher_bank is not None:
+            inputs_student = student_augmentation(*inputs)
+            inputs_student = inputs_student.view(-1,length,3,input_size,input_size).transpose(1,2)
         else:
-            inputs_teacher = inputs[:,3:5,...]
+            if device_augmentation is not None:
+                inputs = device_augmentation(*inputs)
+            inputs=inputs.view(-1,length,5,input_size,input_size).transpose(1,2)
+            inputs_student = inputs[:,:3,...]
+            if teacher_rgb:
+                inputs_teacher = inputs[:,:3,...]
+            else:
+                inputs_teacher = inputs[:,3:5,...]
+            inputs_teacher = inputs_teacher.to(device)
 
-        inputs_student = inputs_student.cuda()
-        inputs_teacher = inputs_teacher.cuda()
+        inputs_student = inputs_student.to(device)
         
-        targets = targets.cuda()
+        targets = targets.to(device)
         
+        distributed.set_gradient_sync(model, (i+1) % args.iter_size == 0)
         if 'bert' in args.arch:
-                output, _ , features_student, _ = model(inputs_student)
-                _ , features_teacher , _ , _ = model_teacher(inputs_teacher)
+                output, _ , features_student, _ = mixed_precision.forward(model, inputs_student)
+        else:
+            output, features_student = mixed_precision.forward(model.student_forward, inputs_student)
+        if teacher_bank is not None:
+            features_teacher = bank_teacher_features(keys[0])
+        elif 'bert' in args.arch:
+            _ , features_teacher , _ , _ = mixed_precision.forward(model_teacher, inputs_teacher)
         else:
-            output, features_student = model.student_forward(inputs_student)
-            features_teacher = model_teacher.mars_forward(inputs_teacher)
+            features_teacher = mixed_precision.forward(model_teacher.mars_forward, inputs_teacher)
             
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
         acc_mini_batch += prec1.item()
@@ -491,11 +614,11 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
         loss_mini_batch_classification += lossClassification.data.item()
         loss_mini_batch_MSE += lossMSE.data.item()
         
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -513,6 +636,7 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
                 batch_time.avg, lossesClassification.avg, lossesMSE.avg))
 
           
+    distributed.all_reduce_meters(lossesClassification, lossesMSE, top1, top3)
     print(' * Epoch: {epoch} Prec@1 {top1.avg:.3f} Prec@3 {top3.avg:.3f} Classification Loss {lossClassification.avg:.4f} '
           'MSE Loss {lossMSE.avg:.6f}\n'
           .format(epoch = epoch, top1=top1, top3=top3, lossClassification=lossesClassification, lossMSE=lossesMSE))
@@ -529,9 +653,11 @@ def validate(val_loader, model, criterion, criterion_mse):
     # switch to evaluate mode
     model.eval()
     end = time.time()
-    c = torch.tensor(1).float().cuda()
+    c = torch.tensor(1).float().to(device)
     with torch.no_grad():
         for i, (inputs, targets) in enumerate(val_loader):
+            if device_augmentation is not None:
+                inputs = device_augmentation(*inputs)
             inputs=inputs.view(-1,length,5,input_size,input_size).transpose(1,2)
             inputs_student = inputs[:,:3,...]
             if teacher_rgb:
@@ -539,17 +665,17 @@ def validate(val_loader, model, criterion, criterion_mse):
             else:
                 inputs_teacher = inputs[:,3:5,...]
     
-            inputs_student = inputs_student.cuda()
-            inputs_teacher = inputs_teacher.cuda()
-            targets = targets.cuda()
+            inputs_student = inputs_student.to(device)
+            inputs_teacher = inputs_teacher.to(device)
+            targets = targets.to(device)
     
             # compute output
             if 'bert' in args.arch:
-                output, _ , features_student, _ = model(inputs_student)
-                _ , features_teacher , _ , _ = model_teacher(inputs_teacher)
+                output, _ , features_student, _ = mixed_precision.forward(model, inputs_student)
+                _ , features_teacher , _ , _ = mixed_precision.forward(model_teacher, inputs_teacher)
             else:
-                output, features_student = model.student_forward(inputs_student)
-                features_teacher = model_teacher.mars_forward(inputs_teacher)
+                output, features_student = mixed_precision.forward(model.student_forward, inputs_student)
+                features_teacher = mixed_precision.forward(model_teacher.mars_forward, inputs_teacher)
                 
             lossClassification = criterion(output, targets)
             if cosine_similarity_enabled:
@@ -572,18 +698,71 @@ def validate(val_loader, model, criterion, criterion_mse):
             end = time.time()
     
     
+        distributed.all_reduce_meters(lossesClassification, lossesMSE, top1, top3)
         print(' * * Prec@1 {top1.avg:.3f} Prec@3 {top3.avg:.3f} Classification Loss {lossClassification.avg:.4f} ' 
               'MSE Loss {lossMSE.avg:.6f}\n'
               .format(top1=top1, top3=top3, lossClassification=lossesClassification, lossMSE=lossesMSE))
 
     return top1.avg, top3.avg, lossesClassification.avg
 
+def teacher_forward(clips, crop_parameters):
+    """Teacher features of uint8 clips and their crop parameters, with the
+    teacher in eval mode so that they are a function of the clip only."""
+    channels = 3 if teacher_rgb else 2
+    inputs_teacher = teacher_augmentation(clips, crop_parameters)
+    inputs_teacher = inputs_teacher.view(-1,length,channels,input_size,input_size).transpose(1,2).to(device)
+    model_teacher.eval()
+    with torch.no_grad():
+        if 'bert' in args.arch:
+            _ , features_teacher , _ , _ = mixed_precision.forward(model_teacher, inputs_teacher)
+        else:
+            features_teacher = mixed_precision.forward(model_teacher.mars_forward, inputs_teacher)
+    return features_teacher
+
+def bank_teacher_features(keys):
+    """Teacher features of a batch of clip keys. Clips that are not in the
+    teacher bank are read from the teacher frames, run through the teacher
+    and added to the bank."""
+    keys = keys.tolist()
+    rows = teacher_bank.lookup(keys)
+    hit = rows >= 0
+    features_teacher = None
+    if hit.any():
+        bank_features = torch.from_numpy(teacher_bank.get(rows[hit])).float().to(device)
+        features_teacher = bank_features.new_empty((len(keys),) + bank_features.shape[1:])
+        features_teacher[torch.from_numpy(hit).to(device)] = bank_features
+    if not hit.all():
+        clips = []
+        crops = []
+        missing = [key for key, row in zip(keys, rows) if row < 0]
+        for key in missing:
+            index, offsets, crop_parameters = split_clip_key(key, args.num_seg)
+            path, duration, _ = teacher_dataset.clips[index]
+            clip_input = teacher_dataset.read_clip(path, offsets, duration - 1)
+            clips.append(torch.from_numpy(clip_input.transpose((2, 0, 1))))
+            crops.append(torch.tensor(crop_parameters))
+        computed_features = teacher_forward(torch.stack(clips), torch.stack(crops)).float()
+        for key, feature in zip(missing, computed_features.cpu().numpy()):
+            teacher_bank.add(key, feature)
+        if features_teacher is None:
+            return computed_features
+        features_teacher[torch.from_numpy(~hit).to(device)] = computed_features
+    return features_teacher
+
+def dump_teacher_bank(dump_loader):
+    for draw in range(args.teacher_bank_draws):
+        dump_loader.dataset.replay = bank_replay(teacher_bank, args.num_seg)
+        for i, ((clips, crop_parameters), _, keys) in enumerate(dump_loader):
+            features_teacher = teacher_forward(clips, crop_parameters).float()
+            for key, feature in zip(keys.tolist(), features_teacher.cpu().numpy()):
+                teacher_bank.add(key, feature)
+        teacher_bank.flush()
+        print("Teacher bank: %d clips after draw %d" % (len(teacher_bank), draw + 1))
+
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    if not distributed.is_main_process():
+        return
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
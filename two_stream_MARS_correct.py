@@ -29,6 +29,8 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
 import datasets
 import swats
 
@@ -91,6 +93,10 @@ parser.add_argument('-c', '--continue', dest='contine', action='store_true',
                     help='continue training')
 parser.add_argument('--bert_teacher', dest='bert', action='store_true',
                     help='Bert Teacher Enabled')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
@@ -99,7 +105,9 @@ warmUpEpoch=5
 learning_rate_index = 0
 max_learning_rate_decay_count = 3
 best_in_existing_learning_rate = 0
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 lrPlateuPrec1 = False
 
 save_everything = True
@@ -111,7 +119,10 @@ multi_gpu = False
 def main():
     global args, best_prec1,model ,writer, best_loss, length, width, height, model_teacher, msecoeff, multi_gpu, bert_teacher_enabled
     global max_learning_rate_decay_count, best_in_existing_learning_rate, learning_rate_index, input_size, teacher_rgb
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     msecoeff = args.msecoeff
     training_continue = args.contine
     bert_teacher_enabled = args.bert
@@ -144,7 +155,7 @@ def main():
 
 
         model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-        params = torch.load(model_path)
+        params = torch.load(model_path, map_location=device)
         if torch.cuda.device_count() > 1:
             new_dict={"module."+k: v for k, v in params['state_dict'].items()} 
             model_teacher.load_state_dict(new_dict)
@@ -345,6 +356,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
 
@@ -379,14 +391,14 @@ def build_model(architecture_name):
 
     if torch.cuda.device_count() > 1:
         model=torch.nn.DataParallel(model)    
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -394,13 +406,13 @@ def build_model_validate():
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -410,7 +422,7 @@ def build_model_continue():
     if torch.cuda.device_count() > 1:
         model=torch.nn.DataParallel(model) 
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     if 'bert' in args.arch:
         optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     else:
@@ -421,6 +433,8 @@ def build_model_continue():
             dampening=0.9,
             weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     
     startEpoch = params['epoch']
     best_prec = params['best_prec1']
@@ -465,19 +479,19 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
         targets = targets.cuda()
         
         if 'bert' in args.arch:
-            output, _ , features_student, _ = model(inputs_student)
+            output, _ , features_student, _ = mixed_precision.forward(model, inputs_student)
             if bert_teacher_enabled:
-                _ , _ , features_teacher , _ = model_teacher(inputs_teacher)
+                _ , _ , features_teacher , _ = mixed_precision.forward(model_teacher, inputs_teacher)
             else:
-                _ , features_teacher , _ , _ = model_teacher(inputs_teacher)
+                _ , features_teacher , _ , _ = mixed_precision.forward(model_teacher, inputs_teacher)
                     
         else:
             if multi_gpu:
-                output, features_student = model.module.student_forward(inputs_student)
-                features_teacher = model_teacher.module.mars_forward(inputs_teacher)
+                output, features_student = mixed_precision.forward(model.module.student_forward, inputs_student)
+                features_teacher = mixed_precision.forward(model_teacher.module.mars_forward, inputs_teacher)
             else:
-                output, features_student = model.student_forward(inputs_student)
-                features_teacher = model_teacher.mars_forward(inputs_teacher)
+                output, features_student = mixed_precision.forward(model.student_forward, inputs_student)
+                features_teacher = mixed_precision.forward(model_teacher.mars_forward, inputs_teacher)
             
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
         acc_mini_batch += prec1.item()
@@ -500,11 +514,11 @@ def train(train_loader, model, criterion, criterion_mse, optimizer, epoch):
         loss_mini_batch_classification += lossClassification.data.item()
         loss_mini_batch_MSE += lossMSE.data.item()
         
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -555,18 +569,18 @@ def validate(val_loader, model, criterion, criterion_mse):
     
             # compute output
             if 'bert' in args.arch:
-                output, _ , features_student, _ = model(inputs_student)
+                output, _ , features_student, _ = mixed_precision.forward(model, inputs_student)
                 if bert_teacher_enabled:
-                    _ , _ , features_teacher , _ = model_teacher(inputs_teacher)
+                    _ , _ , features_teacher , _ = mixed_precision.forward(model_teacher, inputs_teacher)
                 else:
-                    _ , features_teacher , _ , _ = model_teacher(inputs_teacher)
+                    _ , features_teacher , _ , _ = mixed_precision.forward(model_teacher, inputs_teacher)
             else:
                 if multi_gpu:
-                    output, features_student = model.module.student_forward(inputs_student)
-                    features_teacher = model_teacher.module.mars_forward(inputs_teacher)
+                    output, features_student = mixed_precision.forward(model.module.student_forward, inputs_student)
+                    features_teacher = mixed_precision.forward(model_teacher.module.mars_forward, inputs_teacher)
                 else:
-                    output, features_student = model.student_forward(inputs_student)
-                    features_teacher = model_teacher.mars_forward(inputs_teacher)
+                    output, features_student = mixed_precision.forward(model.student_forward, inputs_student)
+                    features_teacher = mixed_precision.forward(model_teacher.mars_forward, inputs_teacher)
                 
             lossClassification = criterion(output, targets)
             if cosine_similarity_enabled:
@@ -596,11 +610,7 @@ def validate(val_loader, model, criterion, criterion_mse):
     return top1.avg, top3.avg, lossesClassification.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
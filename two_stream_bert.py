@@ -28,8 +28,13 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
+from models.BERT.bert import set_attention_backend, attention_backends
 import datasets
 import swats
+from utils.frozen_features import skip_frozen_features
+from datasets.feature_cache import CachedFeatureSampling
 
 
 model_names = sorted(name for name in models.__dict__
@@ -97,6 +102,14 @@ parser.add_argument('-r', '--ranking', dest='ranking', action='store_true',
 
 parser.add_argument('-more', '--more-cropping', dest='more_cropping', action='store_true',
                     help='enable ranking mode')
+parser.add_argument('--feature-cache', default='', type=str, metavar='DIR',
+                    help='train the heads from features1 activations of precompute_features.py')
+parser.add_argument('--attention', default='dense', choices=attention_backends,
+                    help='BERT attention: dense (score matrix) | sdpa (fused kernel, key padding mask)')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
@@ -108,7 +121,8 @@ smt_pretrained = False
 
 
 
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
 logSoftFunc=torch.nn.LogSoftmax(dim=-1)
 def BatchSimilarityLossFunction(outs,inputs):
     batchSize=outs.shape[0]
@@ -146,7 +160,10 @@ def SequenceSimilarityLossFunction(outs,inputs):
 
 def main():
     global args, best_prec1,writer,best_loss,mseCoeffStart, length, warmUpEpoch
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     if not os.path.exists(saveLocation):
@@ -169,7 +186,7 @@ def main():
         model = build_model()
         if smt_pretrained:
             smtV2_pretrained_weights = './weights/smtV2_' + args.arch + '.pth'
-            weights = torch.load(smtV2_pretrained_weights)         
+            weights = torch.load(smtV2_pretrained_weights, map_location=device)         
             weights['fc_action.weight'] = model.state_dict()['fc_action.weight']
             weights['fc_action.bias'] = model.state_dict()['fc_action.bias']
             model.load_state_dict(weights)
@@ -180,12 +197,8 @@ def main():
         #model = build_model_validate()
         startEpoch = 0
     
-    if HALF:
-        model.half()  # convert to half precision
-        for layer in model.modules():
-            if isinstance(layer, nn.BatchNorm2d):
-                layer.float()
     
+    set_attention_backend(model, args.attention)
     print("Model %s is loaded. " % (args.arch))
 
     # define loss function (criterion) and optimizer
@@ -315,6 +328,15 @@ def main():
                                                   video_transform=val_transform,
                                                   num_segments=args.num_seg)
 
+    if args.feature_cache:
+        if args.more_cropping:
+            print("--more-cropping is not supported with --feature-cache")
+            return 0
+        # frames and features1 are replaced by the precomputed activations
+        skip_frozen_features(model)
+        train_dataset = CachedFeatureSampling(train_dataset, os.path.join(args.feature_cache, 'train'))
+        val_dataset = CachedFeatureSampling(val_dataset, os.path.join(args.feature_cache, 'val'))
+
     print('{} samples found, {} train samples and {} test samples.'.format(len(val_dataset)+len(train_dataset),
                                                                            len(train_dataset),
                                                                            len(val_dataset)))
@@ -370,6 +392,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -380,6 +403,7 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
@@ -426,14 +450,14 @@ def build_model():
     if torch.cuda.device_count() > 1:
         print('Multi-GPU test enabled...')
         model=torch.nn.DataParallel(model)
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         print('model path is: %s' %(model_path))
@@ -449,14 +473,14 @@ def build_model_validate():
         model = models.__dict__[args.arch](modelPath=model_path, num_classes=3, length=args.num_seg)  
    
     model.load_state_dict(params['state_dict'])
-    model.cuda()
+    model.to(device)
     model.eval() 
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -464,9 +488,11 @@ def build_model_continue():
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     for param_group in optimizer.param_groups:
         lr = param_group['lr'] 
     
@@ -503,7 +529,9 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
     acc_mini_batch_top3 = 0.0
     totalSamplePerIter=0
     for i, (inputs, targets) in enumerate(train_loader):
-        if modality == "rgb" or modality == "pose":
+        if args.feature_cache:
+            inputs=inputs.view((-1,)+inputs.shape[2:]).float()
+        elif modality == "rgb" or modality == "pose":
             if "3D" in args.arch:
                 inputs=inputs.view(-1,length,3,224,224).transpose(1,2)
             else:
@@ -513,15 +541,12 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         elif modality == "both":
             inputs=inputs.view(-1,5,224,224)
             
-        if HALF:
-            inputs = inputs.to(device).half()
-        else:
-            inputs = inputs.to(device)
+        inputs = inputs.to(device)
         targets = targets.to(device)
         if modality == 'both':
-            output_rgb, output_flow, input_vectors, sequenceOut, maskSample = model(inputs)
+            output_rgb, output_flow, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
         else:
-            output, input_vectors, sequenceOut, maskSample = model(inputs)
+            output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
 
         
 #        maskSample=maskSample.cuda()
@@ -567,11 +592,11 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         loss_mini_batch_batchSimilarity += lossBatchSimilarity.data.item()
         loss_mini_batch_sequenceSimilarity += lossSequenceSimilarity.data.item()
         loss_mini_batch_ranking += lossRanking.data.item()
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -643,7 +668,9 @@ def validate(val_loader, model, criterion,criterion2,modality):
     end = time.time()
     with torch.no_grad():
         for i, (inputs, targets) in enumerate(val_loader):
-            if modality == "rgb" or modality == "pose":
+            if args.feature_cache:
+                inputs=inputs.view((-1,)+inputs.shape[2:]).float()
+            elif modality == "rgb" or modality == "pose":
                 if "3D" in args.arch:
                     inputs=inputs.view(-1,length,3,224,224).transpose(1,2)
                 else:
@@ -653,17 +680,14 @@ def validate(val_loader, model, criterion,criterion2,modality):
             elif modality == "both":
                 inputs=inputs.view(-1,5,224,224)
                 
-            if HALF:
-                inputs = inputs.to(device).half()
-            else:
-                inputs = inputs.to(device)
+            inputs = inputs.to(device)
             targets = targets.to(device)
     
             # compute output
             if modality == 'both':
-                output_rgb, output_flow, input_vectors, sequenceOut, maskSample = model(inputs)
+                output_rgb, output_flow, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
             else:
-                output, input_vectors, sequenceOut, maskSample = model(inputs)
+                output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
                 
             if args.more_cropping and (not modality == 'both'):
                 
@@ -749,11 +773,7 @@ def validate(val_loader, model, criterion,criterion2,modality):
     return top1.avg, top3.avg, lossesClassification.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -27,6 +27,12 @@ from tensorboardX import SummaryWriter
 from torch.optim import lr_scheduler
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
+from utils import distributed
+from models.activation_checkpointing import set_activation_checkpointing
+from models.temporal_sampling import architecture_stride, strided_length, set_pre_strided
+from models.BERT.bert import set_attention_backend, attention_backends
 import datasets
 import swats
 from opt.AdamW import AdamW
@@ -88,6 +94,32 @@ parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
 
 parser.add_argument('-c', '--continue', dest='contine', action='store_true',
                     help='evaluate model on validation set')
+parser.add_argument('--device-augment', dest='device_augment', action='store_true',
+                    help='crop, flip and normalize on the GPU instead of in the loader workers')
+parser.add_argument('--storage', default='frames', choices=["frames", "packed", "video"],
+                    help='frame storage: frames (jpeg files) | packed (datasets/pack_frames.py store) | '
+                         'video (decoded from the video files, rgb only)')
+parser.add_argument('--storage-path', default='', type=str, metavar='DIR',
+                    help='path to the packed store or video directory (default: ./datasets/<dataset>_<storage>)')
+parser.add_argument('--attention', default='dense', choices=attention_backends,
+                    help='BERT attention: dense (score matrix) | sdpa (fused kernel, key padding mask)')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--activation-checkpointing', default=0, type=int, metavar='N',
+                    help='recompute the 3D backbone stages in N checkpointed segments to fit larger batches (default: 0, off)')
+parser.add_argument('--nproc', default=1, type=int, metavar='N',
+                    help='training processes on this machine, one per GPU, with DistributedDataParallel (default: 1)')
+parser.add_argument('--num-shards', default=1, type=int, metavar='N',
+                    help='machines of the distributed run (default: 1)')
+parser.add_argument('--shard-id', default=0, type=int, metavar='N',
+                    help='index of this machine in the distributed run (default: 0)')
+parser.add_argument('--init-method', default='tcp://localhost:9999', type=str,
+                    help='rendezvous of the distributed run (default: tcp://localhost:9999)')
+parser.add_argument('--dist-backend', default='nccl' if torch.cuda.is_available() else 'gloo',
+                    choices=['nccl', 'gloo'],
+                    help='distributed backend: nccl | gloo, which also runs on CPU (default: nccl with GPUs)')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 best_prec1 = 0
 best_loss = 30
@@ -95,12 +127,24 @@ warmUpEpoch=5
 
 smt_pretrained = False
 
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+device_augmentation = None
 
 training_continue = False
 def main():
+    distributed.launch(main_worker, parser.parse_args())
+
+def main_worker(parsed_args):
     global args, best_prec1,model,writer,best_loss, length, width, height, input_size, scheduler
-    args = parser.parse_args()
+    global device_augmentation
+    global mixed_precision
+    global device
+    args = parsed_args
+    device = distributed.process_device()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     training_continue = args.contine
     if '3D' in args.arch:
         if 'I3D' in args.arch or 'MFNET3D' in args.arch:
@@ -125,9 +169,12 @@ def main():
     height = int(256 * scale)
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
-    if not os.path.exists(saveLocation):
-        os.makedirs(saveLocation)
-    writer = SummaryWriter(saveLocation)
+    if distributed.is_main_process():
+        if not os.path.exists(saveLocation):
+            os.makedirs(saveLocation)
+        writer = SummaryWriter(saveLocation)
+    else:
+        writer = distributed.NullWriter()
    
     # create model
 
@@ -147,7 +194,7 @@ def main():
         model = build_model()
         if smt_pretrained:
             smtV2_pretrained_weights = './weights/smtV2_' + args.arch + '.pth'
-            weights = torch.load(smtV2_pretrained_weights)         
+            weights = torch.load(smtV2_pretrained_weights, map_location=device)         
             weights['fc_action.weight'] = model.state_dict()['fc_action.weight']
             weights['fc_action.bias'] = model.state_dict()['fc_action.bias']
             model.load_state_dict(weights)
@@ -155,17 +202,14 @@ def main():
         optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
         startEpoch = 0
     
-    if HALF:
-        model.half()  # convert to half precision
-        for layer in model.modules():
-            if isinstance(layer, nn.BatchNorm2d):
-                layer.float()
     
+    set_attention_backend(model, args.attention)
+    set_activation_checkpointing(model, args.activation_checkpointing)
     print("Model %s is loaded. " % (args.arch))
 
     # define loss function (criterion) and optimizer
-    criterion = nn.CrossEntropyLoss().cuda()
-    criterion2 = nn.MSELoss().cuda()
+    criterion = nn.CrossEntropyLoss().to(device)
+    criterion2 = nn.MSELoss().to(device)
     
     
     scheduler = lr_scheduler.ReduceLROnPlateau(
@@ -196,6 +240,13 @@ def main():
             length=16
     else:
         length=1
+    # the loader reads only the frames the model consumes, every
+    # temporal_stride-th frame of a clip spanning span frames
+    temporal_stride = architecture_stride(args.arch)
+    span = length
+    length = strided_length(span, temporal_stride)
+    if temporal_stride > 1:
+        set_pre_strided(model)
     # Data transforming
     if modality == "rgb" or modality == "pose":
         is_color = True
@@ -282,6 +333,18 @@ def main():
                 normalize,
             ])
 
+    if args.device_augment:
+        # workers only pick the crop and flip, the rest runs batched on the GPU
+        if "3D" in args.arch and not ('I3D' in args.arch):
+            value_range = 1.0
+        else:
+            value_range = 255.0
+        train_transform = video_transforms.MultiScaleCropParameters((input_size, input_size), scale_ratios)
+        val_transform = video_transforms.CenterCropParameters((input_size))
+        device_augmentation = video_transforms.DeviceClipAugmentation((input_size, input_size),
+                                                                      clip_mean, clip_std, value_range)
+        device_augmentation = device_augmentation.to(device)
+
     # data loading
     train_setting_file = "train_%s_split%d.txt" % (modality, args.split)
     train_split_file = os.path.join(args.settings, args.dataset, train_setting_file)
@@ -290,39 +353,52 @@ def main():
     if not os.path.exists(train_split_file) or not os.path.exists(val_split_file):
         print("No split file exists in %s directory. Preprocess the dataset first" % (args.settings))
 
+    storage_kwargs = {}
+    if args.storage != 'frames':
+        storage_kwargs['storage'] = args.storage
+        storage_kwargs['storage_path'] = args.storage_path or './datasets/%s_%s' % (args.dataset, args.storage)
+    if args.storage == 'video':
+        # the split files list the videos relative to the video directory
+        dataset = storage_kwargs['storage_path']
+
     train_dataset = datasets.__dict__[args.dataset](root=dataset,
                                                     source=train_split_file,
                                                     phase="train",
                                                     modality=modality,
                                                     is_color=is_color,
-                                                    new_length=length,
+                                                    new_length=span,
+                                                    temporal_stride=temporal_stride,
                                                     new_width=width,
                                                     new_height=height,
                                                     video_transform=train_transform,
-                                                    num_segments=args.num_seg)
+                                                    num_segments=args.num_seg,
+                                                    **storage_kwargs)
     
     val_dataset = datasets.__dict__[args.dataset](root=dataset,
                                                   source=val_split_file,
                                                   phase="val",
                                                   modality=modality,
                                                   is_color=is_color,
-                                                  new_length=length,
+                                                  new_length=span,
+                                                  temporal_stride=temporal_stride,
                                                   new_width=width,
                                                   new_height=height,
                                                   video_transform=val_transform,
-                                                  num_segments=args.num_seg)
+                                                  num_segments=args.num_seg,
+                                                  **storage_kwargs)
 
     print('{} samples found, {} train samples and {} test samples.'.format(len(val_dataset)+len(train_dataset),
                                                                            len(train_dataset),
                                                                            len(val_dataset)))
 
+    train_sampler = distributed.data_sampler(train_dataset, shuffle=True)
     train_loader = torch.utils.data.DataLoader(
         train_dataset,
-        batch_size=args.batch_size, shuffle=True,
+        batch_size=args.batch_size, shuffle=(train_sampler is None), sampler=train_sampler,
         num_workers=args.workers, pin_memory=True)
     val_loader = torch.utils.data.DataLoader(
         val_dataset,
-        batch_size=args.batch_size, shuffle=False,
+        batch_size=args.batch_size, shuffle=False, sampler=distributed.data_sampler(val_dataset, shuffle=False),
         num_workers=args.workers, pin_memory=True)
 
     if args.evaluate:
@@ -330,6 +406,7 @@ def main():
         return
 
     for epoch in range(startEpoch, args.epochs):
+        distributed.set_epoch(train_loader, epoch)
 #        if learning_rate_index > max_learning_rate_decay_count:
 #            break
 #        adjust_learning_rate(optimizer, epoch)
@@ -365,6 +442,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -375,6 +453,7 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
@@ -409,47 +488,41 @@ def build_model():
         print('model path is: %s' %(model_path))
         model = models.__dict__[args.arch](modelPath=model_path, num_classes=3, length=args.num_seg)
     
-    if torch.cuda.device_count() > 1:
-        model=torch.nn.DataParallel(model)
-    model = model.cuda()
+    model = distributed.parallel_model(model, device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
-    if torch.cuda.device_count() > 1:
-        model=torch.nn.DataParallel(model) 
-
-    model.load_state_dict(params['state_dict'])
-    model.cuda()
+    distributed.load_state_dict(model, params['state_dict'])
+    model = distributed.parallel_model(model, device)
     model.eval() 
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
-    if torch.cuda.device_count() > 1:
-        model=torch.nn.DataParallel(model) 
-        
-    model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    distributed.load_state_dict(model, params['state_dict'])
+    model = distributed.parallel_model(model, device)
     optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     
     startEpoch = params['epoch']
     best_prec = params['best_prec1']
@@ -474,6 +547,8 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,modality)
     acc_mini_batch_top3 = 0.0
     totalSamplePerIter=0
     for i, (inputs, targets) in enumerate(train_loader):
+        if device_augmentation is not None:
+            inputs = device_augmentation(*inputs)
         if modality == "rgb" or modality == "pose":
             if "3D" in args.arch or "r2plus1d" in args.arch or 'slowfast' in args.arch:
                 inputs=inputs.view(-1,length,3,input_size,input_size).transpose(1,2)
@@ -485,21 +560,19 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,modality)
         elif modality == "both":
             inputs=inputs.view(-1,5*length,input_size,input_size)
             
-        if HALF:
-            inputs = inputs.cuda().half()
-        else:
-            inputs = inputs.cuda()
-        targets = targets.cuda()
-        output, input_vectors, sequenceOut, maskSample = model(inputs)
+        inputs = inputs.to(device)
+        targets = targets.to(device)
+        distributed.set_gradient_sync(model, (i+1) % args.iter_size == 0)
+        output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
         
-#        maskSample=maskSample.cuda()
+#        maskSample=maskSample.to(device)
 #        input_vectors=(1-maskSample[:,1:]).unsqueeze(2)*input_vectors
 #        sequenceOut=(1-maskSample[:,1:]).unsqueeze(2)*sequenceOut
         # measure accuracy and record loss
         
 #        input_vectors_rank=input_vectors.view(-1,input_vectors.shape[-1])
-#        targetRank=torch.tensor(range(args.num_seg)).repeat(input_vectors.shape[0]).cuda()
-#        rankingFC = nn.Linear(input_vectors.shape[-1], args.num_seg).cuda()
+#        targetRank=torch.tensor(range(args.num_seg)).repeat(input_vectors.shape[0]).to(device)
+#        rankingFC = nn.Linear(input_vectors.shape[-1], args.num_seg).to(device)
 #        out_rank = rankingFC(input_vectors_rank)
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
         acc_mini_batch += prec1.item()
@@ -513,11 +586,11 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,modality)
         totalLoss=lossClassification 
         #totalLoss = lossMSE + lossClassification 
         loss_mini_batch_classification += lossClassification.data.item()
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             top1.update(acc_mini_batch/args.iter_size, totalSamplePerIter)
@@ -533,6 +606,7 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,modality)
         if (i+1) % args.print_freq == 0:
             print('[%d] time: %.3f loss: %.4f' %(i,batch_time.avg,lossesClassification.avg))
           
+    distributed.all_reduce_meters(lossesClassification, top1, top3)
     print(' * Epoch: {epoch} Prec@1 {top1.avg:.3f} Prec@3 {top3.avg:.3f} Classification Loss {lossClassification.avg:.4f}\n'
           .format(epoch = epoch, top1=top1, top3=top3, lossClassification=lossesClassification))
           
@@ -550,6 +624,8 @@ def validate(val_loader, model, criterion,criterion2,modality):
     end = time.time()
     with torch.no_grad():
         for i, (inputs, targets) in enumerate(val_loader):
+            if device_augmentation is not None:
+                inputs = device_augmentation(*inputs)
             if modality == "rgb" or modality == "pose":
                 if "3D" in args.arch or "r2plus1d" in args.arch or 'slowfast' in args.arch:
                     inputs=inputs.view(-1,length,3,input_size,input_size).transpose(1,2)
@@ -561,14 +637,11 @@ def validate(val_loader, model, criterion,criterion2,modality):
             elif modality == "both":
                 inputs=inputs.view(-1,5*length,input_size,input_size)
                 
-            if HALF:
-                inputs = inputs.cuda().half()
-            else:
-                inputs = inputs.cuda()
-            targets = targets.cuda()
+            inputs = inputs.to(device)
+            targets = targets.to(device)
     
             # compute output
-            output, input_vectors, sequenceOut, _ = model(inputs)
+            output, input_vectors, sequenceOut, _ = mixed_precision.forward(model, inputs)
             
             
             lossClassification = criterion(output, targets)
@@ -586,17 +659,16 @@ def validate(val_loader, model, criterion,criterion2,modality):
             end = time.time()
     
     
+        distributed.all_reduce_meters(lossesClassification, top1, top3)
         print(' * * Prec@1 {top1.avg:.3f} Prec@3 {top3.avg:.3f} Classification Loss {lossClassification.avg:.4f}\n' 
               .format(top1=top1, top3=top3, lossClassification=lossesClassification))
 
     return top1.avg, top3.avg, lossesClassification.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    if not distributed.is_main_process():
+        return
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
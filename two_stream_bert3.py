@@ -28,6 +28,8 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
 import datasets
 import swats
 
@@ -94,6 +96,10 @@ parser.add_argument('-c', '--continue', dest='contine', action='store_true',
 
 parser.add_argument('-r', '--ranking', dest='ranking', action='store_true',
                     help='enable ranking mode')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
@@ -103,7 +109,8 @@ warmUpEpoch=5
 
 
 
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
 logSoftFunc=torch.nn.LogSoftmax(dim=-1)
 def BatchSimilarityLossFunction(outs,inputs):
     batchSize=outs.shape[0]
@@ -141,7 +148,10 @@ def SequenceSimilarityLossFunction(outs,inputs):
 
 def main():
     global args, best_prec1,writer,best_loss,mseCoeffStart, length, warmUpEpoch
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     if not os.path.exists(saveLocation):
@@ -170,11 +180,6 @@ def main():
         #model = build_model_validate()
         startEpoch = 0
     
-    if HALF:
-        model.half()  # convert to half precision
-        for layer in model.modules():
-            if isinstance(layer, nn.BatchNorm2d):
-                layer.float()
     
     print("Model %s is loaded. " % (args.arch))
 
@@ -327,6 +332,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -337,6 +343,7 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
@@ -378,14 +385,14 @@ def build_model():
     if torch.cuda.device_count() > 1:
         print('Multi-GPU test enabled...')
         model=torch.nn.DataParallel(model)
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         print('model path is: %s' %(model_path))
@@ -398,14 +405,14 @@ def build_model_validate():
         model = models.__dict__[args.arch](modelPath=model_path, num_classes=174, length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model.cuda()
+    model.to(device)
     model.eval() 
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -413,9 +420,11 @@ def build_model_continue():
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     startEpoch = params['epoch']
     best_prec = params['best_prec1']
     return model, startEpoch, optimizer, best_prec
@@ -459,12 +468,9 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         elif modality == "both":
             inputs=inputs.view(-1,5*length,224,224)
             
-        if HALF:
-            inputs = inputs.to(device).half()
-        else:
-            inputs = inputs.to(device)
+        inputs = inputs.to(device)
         targets = targets.to(device)
-        output, input_vectors, sequenceOut, maskSample = model(inputs)
+        output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
 
         
 #        maskSample=maskSample.cuda()
@@ -502,11 +508,11 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         loss_mini_batch_batchSimilarity += lossBatchSimilarity.data.item()
         loss_mini_batch_sequenceSimilarity += lossSequenceSimilarity.data.item()
         loss_mini_batch_ranking += lossRanking.data.item()
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -586,14 +592,11 @@ def validate(val_loader, model, criterion,criterion2,modality):
             elif modality == "both":
                 inputs=inputs.view(-1,5*length,224,224)
                 
-            if HALF:
-                inputs = inputs.to(device).half()
-            else:
-                inputs = inputs.to(device)
+            inputs = inputs.to(device)
             targets = targets.to(device)
     
             # compute output
-            output, input_vectors, sequenceOut, maskSample = model(inputs)
+            output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
 
             
 #            input_vectors_rank=input_vectors.view(-1,input_vectors.shape[-1])
@@ -647,11 +650,7 @@ def validate(val_loader, model, criterion,criterion2,modality):
     return top1.avg, top3.avg, lossesClassification.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
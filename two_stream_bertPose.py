@@ -28,6 +28,8 @@ from models.poseNet import openPoseL2Part
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
 import datasets
 import swats
 
@@ -91,6 +93,10 @@ parser.add_argument('--num-seg', default=16, type=int,
 #                    help='path to latest checkpoint (default: none)')
 parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                     help='evaluate model on validation set')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
@@ -98,12 +104,16 @@ best_loss = 30
 
 warmUpEpoch=5
 
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
 
 
 def main():
     global args, best_prec1,model,writer,best_loss,mseLossScaleParam, warmUpEpoch
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     if not os.path.exists(saveLocation):
@@ -119,11 +129,6 @@ def main():
         print("Building model ... ")
         model = build_model()
     
-    if HALF:
-        model.half()  # convert to half precision
-        for layer in model.modules():
-            if isinstance(layer, nn.BatchNorm2d):
-                layer.float()
     
     print("Model %s is loaded. " % (args.arch))
 
@@ -262,6 +267,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     writer.export_scalars_to_json("./all_scalars.json")
@@ -272,14 +278,14 @@ def build_model():
         model = models.__dict__[args.arch](num_classes=101,length=args.num_seg)
     elif args.dataset=='hmdb51':
         model = models.__dict__[args.arch](num_classes=51, length=args.num_seg)  
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](num_classes=101,length=args.num_seg)
@@ -287,7 +293,7 @@ def build_model_validate():
         model=models.__dict__[args.arch](num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     return model
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -311,12 +317,9 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch):
     totalIterSize=0
     for i, (inputs, targets) in enumerate(train_loader):
         inputs=inputs.view(-1,3,224,224)
-        if HALF:
-            inputs = inputs.to(device).half()
-        else:
-            inputs = inputs.to(device)
+        inputs = inputs.to(device)
         targets = targets.to(device)
-        output, input_vectors, sequenceOut, maskSample = model(inputs)
+        output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
         maskSample=maskSample.cuda()
         input_vectors=(1-maskSample[:,1:]).unsqueeze(2)*input_vectors
         sequenceOut=(1-maskSample[:,1:]).unsqueeze(2)*sequenceOut
@@ -334,13 +337,13 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch):
         totalLoss=loss1+loss2
         loss_mini_batch1 += loss1.data.item()
         loss_mini_batch2 += loss2.data.item()
-        loss1.backward()
+        mixed_precision.backward(loss1)
         
         totalIterSize+=output.size(0)
 
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
 
             # losses.update(loss_mini_batch/args.iter_size, input.size(0))
@@ -389,14 +392,11 @@ def validate(val_loader, model, criterion,criterion2):
     with torch.no_grad():
         for i, (inputs, targets) in enumerate(val_loader):
             inputs=inputs.view(-1,3,224,224)
-            if HALF:
-                inputs = inputs.to(device).half()
-            else:
-                inputs = inputs.to(device)
+            inputs = inputs.to(device)
             targets = targets.to(device)
     
             # compute output
-            output, input_vectors, sequenceOut, _ = model(inputs)
+            output, input_vectors, sequenceOut, _ = mixed_precision.forward(model, inputs)
             loss1 = criterion(output, targets)
             loss2 = criterion2(input_vectors, sequenceOut)
     
@@ -427,11 +427,7 @@ def validate(val_loader, model, criterion,criterion2):
     return top1.avg, top3.avg, losses1.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
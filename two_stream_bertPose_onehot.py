@@ -28,6 +28,8 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
 import datasets
 import swats
 
@@ -92,6 +94,12 @@ parser.add_argument('-c', '--continue', dest='contine', action='store_true',
 
 parser.add_argument('-r', '--ranking', dest='ranking', action='store_true',
                     help='enable ranking mode')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--sparse-pose', dest='sparse_pose', action='store_true',
+                    help='feed the pose grids as bin ids to an embedding lookup instead of one-hot grids')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 
@@ -101,9 +109,15 @@ mseCoeffStart=10
 
 
 
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
+
 def main():
     global args, best_prec1,writer,best_loss,mseCoeffStart, length
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     if not os.path.exists(saveLocation):
@@ -172,14 +186,14 @@ def main():
 
     train_transform = video_transforms.Compose([
             video_transforms.rawPoseAugmentation(scale_ratios),
-            video_transforms.pose_one_hot_decoding2(args.num_seg),
+            video_transforms.pose_one_hot_decoding2(args.num_seg, sparse=args.sparse_pose),
         ])
 
 
 
     val_transform = video_transforms.Compose([
             video_transforms.rawPoseAugmentation([1.0]),
-            video_transforms.pose_one_hot_decoding2(args.num_seg),
+            video_transforms.pose_one_hot_decoding2(args.num_seg, sparse=args.sparse_pose),
         ])
     validation_batch_size = int(args.batch_size)
     # data loading
@@ -272,6 +286,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -282,6 +297,7 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
@@ -308,14 +324,14 @@ def build_model():
         print('Multi-GPU test enabled...')
         model=torch.nn.DataParallel(model)
     #model.load_state_dict(torch.load('./weights/pose_pretrain.pth')['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         print('model path is: %s' %(model_path))
@@ -331,14 +347,14 @@ def build_model_validate():
         model = models.__dict__[args.arch](modelPath=model_path, num_classes=3, length=args.num_seg)  
    
     model.load_state_dict(params['state_dict'])
-    model.cuda()
+    model.to(device)
     model.eval() 
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -346,9 +362,11 @@ def build_model_continue():
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     for param_group in optimizer.param_groups:
         lr = param_group['lr'] 
     
@@ -386,7 +404,7 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
 
         inputs = inputs.to(device)
         targets = targets.to(device)
-        output, sequenceOut = model(inputs)
+        output, sequenceOut = mixed_precision.forward(model, inputs)
 
                
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
@@ -398,7 +416,7 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         lossRanking=torch.tensor([0]).cuda()
 
         lossClassification = criterion(output, targets)
-        lossMSE = criterion2(inputs, sequenceOut)
+        lossMSE = criterion2(one_hot_grids(inputs), sequenceOut)
         #lossMSE = torch.mean(1 - criterion3(input_vectors,sequenceOut))
         
         lossRanking = lossRanking / args.iter_size
@@ -412,11 +430,11 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         loss_mini_batch_classification += lossClassification.data.item()
         loss_mini_batch_MSE += lossMSE.data.item()
         loss_mini_batch_ranking += lossRanking.data.item()
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -468,6 +486,14 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
     writer.add_scalar('data/total_loss_training', lossesMSE.avg+lossesClassification.avg+lossesBatchSimilarity.avg+lossesSequenceSimilarity.avg, epoch)
     writer.add_scalar('data/top1_training', top1.avg, epoch)
     writer.add_scalar('data/top3_training', top3.avg, epoch)
+def one_hot_grids(inputs):
+    """The one-hot pose grids the model reconstructs, from the bin ids with
+    --sparse-pose.
+    """
+    if args.sparse_pose:
+        return video_transforms.pose_one_hot_from_bins(inputs)
+    return inputs
+
 def validate(val_loader, model, criterion,criterion2,modality):
     batch_time = AverageMeter()
     lossesClassification = AverageMeter()
@@ -489,9 +515,9 @@ def validate(val_loader, model, criterion,criterion2,modality):
     
             # compute output
             if modality == 'both':
-                output_rgb, output_flow, input_vectors, sequenceOut, maskSample = model(inputs)
+                output_rgb, output_flow, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
             else:
-                output, sequenceOut = model(inputs)
+                output, sequenceOut = mixed_precision.forward(model, inputs)
                 
 #            input_vectors_rank=input_vectors.view(-1,input_vectors.shape[-1])
 #            targetRank=torch.tensor(range(args.num_seg)).repeat(input_vectors.shape[0]).cuda()
@@ -503,7 +529,7 @@ def validate(val_loader, model, criterion,criterion2,modality):
             lossRanking=torch.tensor([0]).cuda()
 
             lossClassification = criterion(output, targets)
-            lossMSE = criterion2(inputs, sequenceOut)
+            lossMSE = criterion2(one_hot_grids(inputs), sequenceOut)
             #lossMSE = torch.mean(1 - criterion3(input_vectors,sequenceOut))
 
             # measure accuracy and record loss
@@ -541,11 +567,7 @@ def validate(val_loader, model, criterion,criterion2,modality):
     return top1.avg, top3.avg, lossesClassification.avg, lossesMSE.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -23,6 +23,8 @@ from torch.optim import lr_scheduler
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
 import datasets
 import swats
 
@@ -87,6 +89,10 @@ parser.add_argument('-c', '--continue', dest='contine', action='store_true',
 
 parser.add_argument('-r', '--ranking', dest='ranking', action='store_true',
                     help='enable ranking mode')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 
@@ -96,9 +102,15 @@ mseCoeffStart=10
 
 
 
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
+
 def main():
     global args, best_prec1,writer,best_loss,mseCoeffStart, length
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     if not os.path.exists(saveLocation):
@@ -267,6 +279,7 @@ def main():
                     'best_prec1': best_prec1,
                     'best_loss': best_loss,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     checkpoint_name = "%03d_%s" % (epoch + 1, "checkpoint.pth.tar")
@@ -277,6 +290,7 @@ def main():
         'best_prec1': best_prec1,
         'best_loss': best_loss,
         'optimizer' : optimizer.state_dict(),
+        'scaler' : mixed_precision.state_dict(),
     }, is_best, checkpoint_name, saveLocation)
     writer.export_scalars_to_json("./all_scalars.json")
     writer.close()
@@ -303,14 +317,14 @@ def build_model():
         print('Multi-GPU test enabled...')
         model=torch.nn.DataParallel(model)
     #model.load_state_dict(torch.load('./weights/pose_pretrain.pth')['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         print('model path is: %s' %(model_path))
@@ -326,14 +340,14 @@ def build_model_validate():
         model = models.__dict__[args.arch](modelPath=model_path, num_classes=3, length=args.num_seg)  
    
     model.load_state_dict(params['state_dict'])
-    model.cuda()
+    model.to(device)
     model.eval() 
     return model
 
 def build_model_continue():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -341,9 +355,11 @@ def build_model_continue():
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     optimizer = AdamW(model.parameters(), lr= args.lr, weight_decay=args.weight_decay)
     optimizer.load_state_dict(params['optimizer'])
+    if 'scaler' in params:
+        mixed_precision.load_state_dict(params['scaler'])
     for param_group in optimizer.param_groups:
         lr = param_group['lr'] 
     
@@ -381,7 +397,7 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
 
         inputs = inputs.to(device)
         targets = targets.to(device)
-        output, input_vectors, sequenceOut, maskSample = model(inputs)
+        output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
 
         
 #        maskSample=maskSample.cuda()
@@ -416,11 +432,11 @@ def train(train_loader, model, criterion, criterion2, optimizer, epoch,setMseCoe
         loss_mini_batch_classification += lossClassification.data.item()
         loss_mini_batch_MSE += lossMSE.data.item()
         loss_mini_batch_ranking += lossRanking.data.item()
-        totalLoss.backward()
+        mixed_precision.backward(totalLoss)
         totalSamplePerIter +=  output.size(0)
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
             lossesClassification.update(loss_mini_batch_classification, totalSamplePerIter)
             lossesMSE.update(loss_mini_batch_MSE, totalSamplePerIter)
@@ -493,9 +509,9 @@ def validate(val_loader, model, criterion,criterion2,modality):
     
             # compute output
             if modality == 'both':
-                output_rgb, output_flow, input_vectors, sequenceOut, maskSample = model(inputs)
+                output_rgb, output_flow, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
             else:
-                output, input_vectors, sequenceOut, maskSample = model(inputs)
+                output, input_vectors, sequenceOut, maskSample = mixed_precision.forward(model, inputs)
                 
 #            input_vectors_rank=input_vectors.view(-1,input_vectors.shape[-1])
 #            targetRank=torch.tensor(range(args.num_seg)).repeat(input_vectors.shape[0]).cuda()
@@ -545,11 +561,7 @@ def validate(val_loader, model, criterion,criterion2,modality):
     return top1.avg, top3.avg, lossesClassification.avg, lossesMSE.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -35,6 +35,8 @@ import swats
 
 import video_transforms
 import models
+from utils.mixed_precision import MixedPrecision
+from utils.checkpoint_writer import CheckpointWriter
 import datasets
 
 
@@ -97,16 +99,24 @@ parser.add_argument('--num-seg', default=16, type=int,
 #                    help='path to latest checkpoint (default: none)')
 parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                     help='evaluate model on validation set')
+parser.add_argument('--amp', dest='amp', action='store_true',
+                    help='mixed precision: autocast forward passes and dynamic loss scaling')
+parser.add_argument('--keep-checkpoints', default=0, type=int, metavar='N',
+                    help='keep only the N most recent checkpoints and the best one (default: 0, all)')
 
 
 best_prec1 = 0
 
-HALF = False
+mixed_precision = MixedPrecision(False)
+checkpoint_writer = CheckpointWriter()
 
 
 def main():
     global args, best_prec1,model,writer
+    global mixed_precision
     args = parser.parse_args()
+    mixed_precision = MixedPrecision(args.amp)
+    checkpoint_writer.keep = args.keep_checkpoints
     
     saveLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     if not os.path.exists(saveLocation):
@@ -122,11 +132,6 @@ def main():
         print("Building model ... ")
         model = build_model()
     
-    if HALF:
-        model.half()  # convert to half precision
-        for layer in model.modules():
-            if isinstance(layer, nn.BatchNorm2d):
-                layer.float()
     
     print("Model %s is loaded. " % (args.arch))
 
@@ -256,6 +261,7 @@ def main():
                     'state_dict': model.state_dict(),
                     'best_prec1': best_prec1,
                     'optimizer' : optimizer.state_dict(),
+                    'scaler' : mixed_precision.state_dict(),
                 }, is_best, checkpoint_name, saveLocation)
     
     writer.export_scalars_to_json("./all_scalars.json")
@@ -270,14 +276,14 @@ def build_model():
     elif args.dataset=='hmdb51':
         model = models.__dict__[args.arch](modelPath=model_path, num_classes=51, length=args.num_seg)
     
-    model = model.cuda()
+    model = model.to(device)
     
     return model
 
 def build_model_validate():
     modelLocation="./checkpoint/"+args.dataset+"_"+args.arch+"_split"+str(args.split)
     model_path = os.path.join(modelLocation,'model_best.pth.tar') 
-    params = torch.load(model_path)
+    params = torch.load(model_path, map_location=device)
     print(modelLocation)
     if args.dataset=='ucf101':
         model=models.__dict__[args.arch](modelPath='', num_classes=101,length=args.num_seg)
@@ -285,7 +291,7 @@ def build_model_validate():
         model=models.__dict__[args.arch](modelPath='', num_classes=51,length=args.num_seg)
    
     model.load_state_dict(params['state_dict'])
-    model = model.cuda()
+    model = model.to(device)
     return model
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -307,12 +313,9 @@ def train(train_loader, model, criterion, optimizer, epoch):
     acc_mini_batch_top3 = 0.0
     for i, (inputs, targets) in enumerate(train_loader):
         inputs=inputs.view(-1,3,224,224)
-        if HALF:
-            inputs = inputs.to(device).half()
-        else:
-            inputs = inputs.to(device)
+        inputs = inputs.to(device)
         targets = targets.to(device)
-        output, difference = model(inputs)
+        output, difference = mixed_precision.forward(model, inputs)
         
         # measure accuracy and record loss
         prec1, prec3 = accuracy(output.data, targets, topk=(1, 3))
@@ -323,11 +326,11 @@ def train(train_loader, model, criterion, optimizer, epoch):
         loss = criterion(output, targets)
         loss = loss / args.iter_size
         loss_mini_batch += loss.data.item()
-        loss.backward()
+        mixed_precision.backward(loss)
 
         if (i+1) % args.iter_size == 0:
             # compute gradient and do SGD step
-            optimizer.step()
+            mixed_precision.step(optimizer)
             optimizer.zero_grad()
 
             # losses.update(loss_mini_batch/args.iter_size, input.size(0))
@@ -364,14 +367,11 @@ def validate(val_loader, model, criterion):
     with torch.no_grad():
         for i, (inputs, targets) in enumerate(val_loader):
             inputs=inputs.view(-1,3,224,224)
-            if HALF:
-                inputs = inputs.to(device).half()
-            else:
-                inputs = inputs.to(device)
+            inputs = inputs.to(device)
             targets = targets.to(device)
     
             # compute output
-            output = model(inputs)
+            output = mixed_precision.forward(model, inputs)
             loss = criterion(output, targets)
     
             # measure accuracy and record loss
@@ -399,11 +399,7 @@ def validate(val_loader, model, criterion):
     return top1.avg,top3.avg
 
 def save_checkpoint(state, is_best, filename, resume_path):
-    cur_path = os.path.join(resume_path, filename)
-    torch.save(state, cur_path)
-    best_path = os.path.join(resume_path, 'model_best.pth.tar')
-    if is_best:
-        shutil.copyfile(cur_path, best_path)
+    checkpoint_writer.save(state, is_best, filename, resume_path)
 
 class AverageMeter(object):
     """Computes and stores the average and current value"""
@@ -0,0 +1,131 @@
+"""
+Background checkpoint writer of the two_stream_* trainers.
+
+save_checkpoint used to torch.save the whole state (the model and the
+optimizer moments) on the training thread, then copy the file to
+model_best.pth.tar whenever the model improved, which duplicated the
+multi-GB ResNeXt101 checkpoints. With CheckpointWriter:
+
+- the training thread only copies the state to CPU memory, and a
+  background thread serializes it;
+- a checkpoint is written to a .tmp file, synced and renamed, so a crash
+  never leaves a truncated checkpoint behind;
+- model_best.pth.tar is a relative symlink to the best checkpoint (a hard
+  link where symlinks are not allowed, a copy as the last resort), so the
+  eval scripts and --continue load it as before;
+- with keep > 0, only the keep most recent checkpoints written by this run
+  are kept, and the best one is never deleted.
+
+At most one snapshot waits while another is written, so save blocks when
+checkpoints come faster than the disk takes them. The writer thread finishes
+the pending checkpoints before the process exits.
+"""
+
+import os
+import queue
+import shutil
+import threading
+
+import torch
+
+BEST_NAME = 'model_best.pth.tar'
+
+
+def cpu_snapshot(state):
+    """Copy of a (nested) checkpoint state with every tensor copied to CPU
+    memory, so that training can go on while it is written.
+    """
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return type(state)((key, cpu_snapshot(value)) for key, value in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(cpu_snapshot(value) for value in state)
+    return state
+
+
+def atomic_save(state, path):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def point_best(resume_path, filename):
+    """Points model_best.pth.tar of resume_path at its checkpoint filename."""
+    best_path = os.path.join(resume_path, BEST_NAME)
+    temporary = best_path + '.tmp'
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+    try:
+        os.symlink(filename, temporary)
+    except (OSError, NotImplementedError):
+        try:
+            os.link(os.path.join(resume_path, filename), temporary)
+        except OSError:
+            shutil.copyfile(os.path.join(resume_path, filename), temporary)
+    os.replace(temporary, best_path)
+
+
+class CheckpointWriter(object):
+    """Writes the checkpoints of a trainer on a background thread, keeping
+    the keep most recent ones of each directory (all of them with keep=0).
+    """
+
+    def __init__(self, keep=0):
+        self.keep = keep
+        self.jobs = queue.Queue(maxsize=1)
+        self.thread = None
+        self.error = None
+        self.written = {}
+        self.best = {}
+
+    def save(self, state, is_best, filename, resume_path):
+        self.check()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='checkpoint-writer')
+            self.thread.start()
+        self.jobs.put((cpu_snapshot(state), is_best, filename, resume_path))
+
+    def wait(self):
+        """Blocks until the queued checkpoints are written."""
+        self.jobs.join()
+        self.check()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def run(self):
+        while True:
+            try:
+                job = self.jobs.get(timeout=1.0)
+            except queue.Empty:
+                if not threading.main_thread().is_alive():
+                    return
+                continue
+            try:
+                self.write(*job)
+            except Exception as error:
+                print("Checkpoint %s could not be written: %s" % (job[2], error))
+                self.error = error
+            finally:
+                self.jobs.task_done()
+
+    def write(self, state, is_best, filename, resume_path):
+        atomic_save(state, os.path.join(resume_path, filename))
+        written = self.written.setdefault(resume_path, [])
+        if filename in written:
+            written.remove(filename)
+        written.append(filename)
+        if is_best:
+            point_best(resume_path, filename)
+            self.best[resume_path] = filename
+        if self.keep > 0:
+            for old in written[:-self.keep]:
+                if old != self.best.get(resume_path):
+                    os.remove(os.path.join(resume_path, old))
+                    written.remove(old)
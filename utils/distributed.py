@@ -0,0 +1,199 @@
+"""
+Multi-process DistributedDataParallel training for the two_stream_* trainers.
+
+torch.nn.DataParallel drives every GPU from one process, so the replicas
+share the GIL and the weights are broadcast to them at every step. With
+--nproc N a trainer starts N processes on this machine instead (--num-shards
+and --shard-id spread them over several machines), one per GPU, each with
+its own loader workers and a DistributedSampler shard of the data. The
+trained model is a DistributedDataParallel, which all-reduces the gradients
+during the backward pass; with --iter-size only the last mini-batch of an
+optimizer step synchronises. A trainer started by torchrun is initialised
+from its environment instead.
+
+Only rank 0 prints, writes the tensorboard logs and saves the checkpoints.
+The epoch metrics are all-reduced first, so every process takes the same
+best model and learning rate decisions. The validation sampler pads the last
+shard with repeated videos, so with N processes up to N - 1 videos are
+counted twice. BatchNorm statistics stay per process, as they were per
+replica with DataParallel.
+
+The gloo backend runs on CPU, so the trainers also run distributed on a
+machine without GPUs (--nproc 2 --dist-backend gloo).
+
+The helpers mirror models/SlowFast/slowfast/utils/{distributed,multiprocessing}.py,
+which are not imported here: importing the SlowFast package builds its model
+registry, and its launcher selects a GPU unconditionally.
+"""
+
+import os
+import builtins
+import functools
+
+import torch
+import torch.nn as nn
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data.distributed import DistributedSampler
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def process_device():
+    """The device of this process: its GPU, or the CPU without CUDA."""
+    if torch.cuda.is_available():
+        return torch.device('cuda', torch.cuda.current_device())
+    return torch.device('cpu')
+
+
+def _silent_print(*args, **kwargs):
+    pass
+
+
+def _run(local_rank, rank, world_size, init_method, backend, func, args):
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+    dist.init_process_group(backend=backend, init_method=init_method,
+                            world_size=world_size, rank=rank)
+    if rank != 0:
+        builtins.print = _silent_print
+    try:
+        func(args)
+    finally:
+        dist.destroy_process_group()
+
+
+def _spawned(local_rank, func, args):
+    _run(local_rank, args.shard_id * args.nproc + local_rank, args.nproc * args.num_shards,
+         args.init_method, args.dist_backend, func, args)
+
+
+def launch(func, args):
+    """Calls func(args) in every process of the run: the processes of this
+    machine when args.nproc * args.num_shards > 1, the process torchrun
+    started, or this process alone.
+    """
+    if 'LOCAL_RANK' in os.environ and 'WORLD_SIZE' in os.environ:
+        _run(int(os.environ['LOCAL_RANK']), int(os.environ['RANK']), int(os.environ['WORLD_SIZE']),
+             'env://', args.dist_backend, func, args)
+    elif args.nproc * args.num_shards > 1:
+        mp.spawn(_spawned, args=(func, args), nprocs=args.nproc)
+    else:
+        func(args)
+
+
+class DistributedDataParallel(nn.parallel.DistributedDataParallel):
+    """DistributedDataParallel that also runs the other forward methods of
+    the model (student_forward, mars_forward, ensemble_forward) with
+    gradient synchronisation, called as model.ensemble_forward(inputs).
+    """
+
+    def __getattr__(self, name):
+        try:
+            return super(DistributedDataParallel, self).__getattr__(name)
+        except AttributeError:
+            if name.startswith('_') or 'module' not in self._modules:
+                raise
+            attribute = getattr(self.module, name)
+            if not callable(attribute):
+                return attribute
+            return functools.partial(self.forward_method, name)
+
+    def forward_method(self, name, *inputs):
+        module = self.module
+        module.forward = getattr(module, name)
+        try:
+            return self(*inputs)
+        finally:
+            del module.forward
+
+
+def parallel_model(model, device, trainable=True):
+    """model on device, as a DistributedDataParallel in a distributed run and
+    as a DataParallel over all the GPUs otherwise. A frozen teacher
+    (trainable=False) has no gradients to synchronise and is not wrapped in
+    a distributed run.
+
+    The unused parameters of a step are looked up, since many architectures
+    keep layers that their forward pass skips.
+    """
+    model = model.to(device)
+    if is_distributed():
+        if not trainable:
+            return model
+        device_ids = [device.index] if device.type == 'cuda' else None
+        return DistributedDataParallel(model, device_ids=device_ids, find_unused_parameters=True)
+    if torch.cuda.device_count() > 1:
+        return nn.DataParallel(model)
+    return model
+
+
+def load_state_dict(model, state_dict):
+    """Loads a checkpoint into model, adding or removing the 'module.'
+    prefix of the (Distributed)DataParallel checkpoints to match model.
+    """
+    state_dict = {k[7:] if k.startswith('module.') else k: v for k, v in state_dict.items()}
+    if isinstance(model, (nn.DataParallel, nn.parallel.DistributedDataParallel)):
+        state_dict = {'module.' + k: v for k, v in state_dict.items()}
+    model.load_state_dict(state_dict)
+
+
+def set_gradient_sync(model, sync):
+    """Whether the next forward and backward pass of a DistributedDataParallel
+    model all-reduce the gradients, which is what model.no_sync() switches
+    off. The mini-batches of --iter-size that only accumulate gradients run
+    with sync=False, and their gradients are all-reduced with the next
+    synchronised one.
+    """
+    if isinstance(model, nn.parallel.DistributedDataParallel):
+        model.require_backward_grad_sync = sync
+
+
+def data_sampler(dataset, shuffle):
+    """The DistributedSampler shard of dataset of this process, or None (the
+    DataLoader default) outside a distributed run.
+    """
+    if not is_distributed():
+        return None
+    return DistributedSampler(dataset, shuffle=shuffle)
+
+
+def set_epoch(loader, epoch):
+    """Reshuffles the DistributedSampler shards of loader for epoch."""
+    if isinstance(loader.sampler, DistributedSampler):
+        loader.sampler.set_epoch(epoch)
+
+
+def all_reduce_meters(*meters):
+    """Sums the sum and count of the AverageMeters over the processes and
+    recomputes their averages.
+    """
+    if not is_distributed():
+        return
+    totals = torch.tensor([[meter.sum, meter.count] for meter in meters],
+                          dtype=torch.float64, device=process_device())
+    dist.all_reduce(totals)
+    for meter, (total, count) in zip(meters, totals.tolist()):
+        meter.sum, meter.count = total, count
+        meter.avg = total / count if count else 0
+
+
+class NullWriter(object):
+    """Stands in for the SummaryWriter of the processes other than rank 0."""
+
+    def __getattr__(self, name):
+        return _silent_print
@@ -0,0 +1,73 @@
+"""
+Memory-mapped feature bank.
+
+Stores one feature array per key in a preallocated features.npy memory map
+(rows of a fixed shape and dtype) and the keys, one per row, in keys.json.
+Keys are tuples of ints, e.g. (clip index, segment offsets..., crop
+parameters...) for the MARS teacher bank.
+"""
+
+import os
+import json
+import numpy as np
+
+
+class FeatureBank(object):
+
+    def __init__(self, path, capacity=0, dtype='float32'):
+        """Opens the bank at path, or prepares an empty one with room for
+        capacity rows. The feature shape is taken from the first add().
+        """
+        self.path = path
+        self.keys_path = os.path.join(path, 'keys.json')
+        self.features_path = os.path.join(path, 'features.npy')
+        self.features = None
+        self.rows = {}
+        self.keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path) as keys_file:
+                self.keys = [tuple(key) for key in json.load(keys_file)]
+            self.rows = {key: row for row, key in enumerate(self.keys)}
+            self.features = np.load(self.features_path, mmap_mode='r+')
+            self.capacity = self.features.shape[0]
+            self.dtype = self.features.dtype
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.capacity = capacity
+            self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return tuple(key) in self.rows
+
+    def lookup(self, keys):
+        """Returns the row of every key, -1 for keys that are not in the bank."""
+        return np.array([self.rows.get(tuple(key), -1) for key in keys], dtype=np.int64)
+
+    def get(self, rows):
+        return np.asarray(self.features[rows])
+
+    def add(self, key, feature):
+        """Stores feature under key. Returns False when the bank is full."""
+        key = tuple(int(k) for k in key)
+        if key in self.rows:
+            self.features[self.rows[key]] = feature
+            return True
+        if len(self.keys) >= self.capacity:
+            return False
+        if self.features is None:
+            self.features = np.lib.format.open_memmap(self.features_path, mode='w+', dtype=self.dtype,
+                                                      shape=(self.capacity,) + tuple(feature.shape))
+        self.features[len(self.keys)] = feature
+        self.rows[key] = len(self.keys)
+        self.keys.append(key)
+        return True
+
+    def flush(self):
+        if self.features is not None:
+            self.features.flush()
+        with open(self.keys_path, 'w') as keys_file:
+            json.dump(self.keys, keys_file)
@@ -0,0 +1,43 @@
+"""
+Training 2D heads from precomputed backbone features.
+
+Models such as rgb_resnet18_bert10 and rgb_resnet18_lstmType2 keep their
+first ResNet stages in a frozen features1. precompute_features.py runs
+features1 once per stored clip and crop, and skip_frozen_features() makes
+the model take those activations as its input instead of the frames.
+"""
+
+import torch.nn as nn
+
+
+class PrecomputedFeatures(nn.Sequential):
+    """Stands in for a frozen features1. It keeps the original modules, so
+    state_dict keys and checkpoints do not change, but passes its input
+    (the precomputed features1 activations) through unchanged.
+    """
+
+    def forward(self, x):
+        return x
+
+
+def _unwrap(model):
+    if isinstance(model, nn.DataParallel):
+        return model.module
+    return model
+
+
+def frozen_features(model):
+    """Returns the features1 of a model if all its parameters are frozen, else None."""
+    features1 = getattr(_unwrap(model), 'features1', None)
+    if features1 is None or any(param.requires_grad for param in features1.parameters()):
+        return None
+    return features1
+
+
+def skip_frozen_features(model):
+    """Replaces the frozen features1 of model by PrecomputedFeatures."""
+    features1 = frozen_features(model)
+    if features1 is None:
+        raise RuntimeError("%s has no frozen features1 to precompute" % (type(_unwrap(model)).__name__))
+    _unwrap(model).features1 = PrecomputedFeatures(*features1.children())
+    return model
@@ -0,0 +1,94 @@
+"""
+Mixed precision (AMP) training and inference for the two_stream_* trainers
+and the eval scripts.
+
+This replaces the old HALF flag of the trainers. HALF cast the whole model
+with model.half() and put only the BatchNorm2d layers back to float32, so the
+BatchNorm3d layers of the 3D models ran in fp16. With --amp instead:
+
+- the model, the BatchNorm statistics and the optimizer state stay in
+  float32, and only the forward pass runs under autocast;
+- floating point outputs come back as float32, so the losses and metrics are
+  computed as before;
+- the loss is scaled by a dynamic GradScaler. With --iter-size, the scaled
+  gradients of the iter_size mini-batches accumulate with the same scale,
+  because the scale only changes in update(). They are unscaled and checked
+  for inf/nan once per optimizer step, and a step with overflowed gradients
+  is skipped.
+
+Without --amp every call falls through to plain float32 training.
+"""
+
+import torch
+import torch.nn as nn
+
+
+def float_outputs(output):
+    """Casts the floating point tensors of a model output (a tensor or a
+    tuple that may hold None) to float32.
+    """
+    if isinstance(output, tuple):
+        return tuple(float_outputs(item) for item in output)
+    if torch.is_tensor(output) and output.is_floating_point() and output.dtype != torch.float32:
+        return output.float()
+    return output
+
+
+class MixedPrecision(object):
+    """Autocast and dynamic loss scaling of one training run, a no-op when
+    enabled is False or there is no GPU.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled and torch.cuda.is_available()
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.enabled)
+
+    def autocast(self):
+        return torch.cuda.amp.autocast(enabled=self.enabled)
+
+    def forward(self, model, *inputs):
+        """model(*inputs) under autocast, with float32 outputs."""
+        if not self.enabled:
+            return model(*inputs)
+        with self.autocast():
+            output = model(*inputs)
+        return float_outputs(output)
+
+    def backward(self, loss):
+        self.scaler.scale(loss).backward()
+
+    def step(self, optimizer):
+        """Unscales the accumulated gradients and steps the optimizer, unless
+        they overflowed, then updates the loss scale.
+        """
+        self.scaler.step(optimizer)
+        self.scaler.update()
+
+    def state_dict(self):
+        """The loss scale state the trainers save in their checkpoints under
+        'scaler', empty without --amp.
+        """
+        return self.scaler.state_dict()
+
+    def load_state_dict(self, state_dict):
+        """Continues with the loss scale of a checkpoint instead of starting
+        over at 65536. A checkpoint saved without --amp has none to load.
+        """
+        if len(state_dict) > 0:
+            self.scaler.load_state_dict(state_dict)
+
+
+class AutocastModel(nn.Module):
+    """Runs a trained model under autocast for the eval scripts. The model
+    is a submodule, so the Video*Prediction functions still find its device
+    from its parameters.
+    """
+
+    def __init__(self, model):
+        super(AutocastModel, self).__init__()
+        self.model = model
+
+    def forward(self, *inputs):
+        with torch.cuda.amp.autocast():
+            output = self.model(*inputs)
+        return float_outputs(output)
@@ -1,5 +1,7 @@
 from __future__ import division
 import torch
+import torch.nn as nn
+import torch.nn.functional as F
 import random
 import numpy as np
 import numbers
@@ -93,14 +95,11 @@ class Normalize(object):
     def __init__(self, mean, std):
         self.mean = mean
         self.std = std
+        self.torch_mean = torch.tensor([[self.mean]]).view(-1,1,1).float()
+        self.torch_std = torch.tensor([[self.std]]).view(-1,1,1).float()
 
     def __call__(self, tensor):
-        # TODO: make efficient
-        torch_mean = torch.tensor([[self.mean]]).view(-1,1,1).float()
-        torch_std = torch.tensor([[self.std]]).view(-1,1,1).float()
-        tensor2 = (tensor - torch_mean) / torch_std
-        # for t, m, s in zip(tensor, self.mean, self.std):
-        #     t.sub_(m).div_(s)
+        tensor2 = (tensor - self.torch_mean) / self.torch_std
         return tensor2
 class DeNormalize(object):
     """Given mean: (R, G, B) and std: (R, G, B),
@@ -114,14 +113,11 @@ class DeNormalize(object):
     def __init__(self, mean, std):
         self.mean = mean
         self.std = std
+        self.torch_mean = torch.tensor([[self.mean]]).view(-1,1,1).float()
+        self.torch_std = torch.tensor([[self.std]]).view(-1,1,1).float()
 
     def __call__(self, tensor):
-        # TODO: make efficient
-        torch_mean = torch.tensor([[self.mean]]).view(-1,1,1).float()
-        torch_std = torch.tensor([[self.std]]).view(-1,1,1).float()
-        tensor2 = (tensor * torch_std) + torch_mean
-        # for t, m, s in zip(tensor, self.mean, self.std):
-        #     t.sub_(m).div_(s)
+        tensor2 = (tensor * self.torch_std) + self.torch_mean
         return tensor2
     
 class Normalize3(object):
@@ -158,6 +154,27 @@ class Normalize2(object):
             t.sub_(m).div_(s)
         return tensor
     
+# cv2.resize handles at most this many channels in one call (CV_CN_MAX is 128
+# in OpenCV 5 and 512 in OpenCV 4)
+MAX_RESIZE_CHANNELS = 128
+
+def resize_clip(clips, size, interpolation=cv2.INTER_LINEAR):
+    """Resizes all frames of a (H x W x C) clip to size = (width, height).
+    The whole clip goes through cv2.resize as one multi-channel image, which
+    gives the same pixels as resizing frame by frame. The dtype is kept, so
+    uint8 clips stay uint8 until ToTensor.
+    """
+    h, w, c = clips.shape
+    new_w, new_h = size
+    if c <= MAX_RESIZE_CHANNELS:
+        return cv2.resize(clips, (new_w, new_h), interpolation=interpolation).reshape(new_h, new_w, c)
+    scaled_clips = np.empty((new_h, new_w, c), dtype=clips.dtype)
+    for start in range(0, c, MAX_RESIZE_CHANNELS):
+        stop = min(start + MAX_RESIZE_CHANNELS, c)
+        scaled_clips[:,:,start:stop] = cv2.resize(clips[:,:,start:stop], (new_w, new_h),
+                                                  interpolation=interpolation).reshape(new_h, new_w, stop - start)
+    return scaled_clips
+
 class Scale(object):
     """ Rescales the input numpy array to the given 'size'.
     'size' will be the size of the smaller edge.
@@ -188,23 +205,7 @@ class Scale(object):
             new_w = self.size[0]
             new_h = self.size[1]
 
-        is_color = False
-        if c % 3 == 0:
-            is_color = True
-
-        if is_color:
-            num_imgs = int(c / 3)
-            scaled_clips = np.zeros((new_h,new_w,c))
-            for frame_id in range(num_imgs):
-                cur_img = clips[:,:,frame_id*3:frame_id*3+3]
-                scaled_clips[:,:,frame_id*3:frame_id*3+3] = cv2.resize(cur_img, (new_w, new_h), self.interpolation)
-        else:
-            num_imgs = int(c / 1)
-            scaled_clips = np.zeros((new_h,new_w,c))
-            for frame_id in range(num_imgs):
-                cur_img = clips[:,:,frame_id:frame_id+1]
-                scaled_clips[:,:,frame_id:frame_id+1] = cv2.resize(cur_img, (new_w, new_h), self.interpolation)
-        return scaled_clips
+        return resize_clip(clips, (new_w, new_h), self.interpolation)
 
 
 class CenterCrop(object):
@@ -225,28 +226,9 @@ class CenterCrop(object):
         x1 = int(round((w - tw) / 2.))
         y1 = int(round((h - th) / 2.))
 
-        is_color = False
-        if c % 3 == 0:
-            is_color = True
-
-        if is_color:
-            num_imgs = int(c / 3)
-            scaled_clips = np.zeros((th,tw,c))
-            for frame_id in range(num_imgs):
-                cur_img = clips[:,:,frame_id*3:frame_id*3+3]
-                crop_img = cur_img[y1:y1+th, x1:x1+tw, :]
-                assert(crop_img.shape == (th, tw, 3))
-                scaled_clips[:,:,frame_id*3:frame_id*3+3] = crop_img
-            return scaled_clips
-        else:
-            num_imgs = int(c / 1)
-            scaled_clips = np.zeros((th,tw,c))
-            for frame_id in range(num_imgs):
-                cur_img = clips[:,:,frame_id:frame_id+1]
-                crop_img = cur_img[y1:y1+th, x1:x1+tw, :]
-                assert(crop_img.shape == (th, tw, 1))
-                scaled_clips[:,:,frame_id:frame_id+1] = crop_img
-            return scaled_clips
+        crop_clips = clips[y1:y1+th, x1:x1+tw, :]
+        assert(crop_clips.shape == (th, tw, c))
+        return crop_clips
 
 class RandomHorizontalFlip(object):
     """Randomly horizontally flips the given numpy array with a probability of 0.5
@@ -386,17 +368,13 @@ class MultiScaleCrop(object):
 
         return crop_sizes
 
-    def __call__(self, clips, selectedRegionOutput=False):
-        h, w, c = clips.shape
-        is_color = False
-        if c % 3 == 0:
-            is_color = True
-
+    def selectRegion(self, h, w):
         crop_size_pairs = self.fillCropSize(h, w)
         size_sel = random.randint(0, len(crop_size_pairs)-1)
         crop_height = crop_size_pairs[size_sel][0]
         crop_width = crop_size_pairs[size_sel][1]
 
+        off_sel = None
         if self.fix_crop:
             offsets = self.fillFixOffset(h, w)
             off_sel = random.randint(0, len(offsets)-1)
@@ -405,30 +383,103 @@ class MultiScaleCrop(object):
         else:
             h_off = random.randint(0, h - self.height)
             w_off = random.randint(0, w - self.width)
+        return h_off, w_off, crop_height, crop_width, off_sel
 
-        scaled_clips = np.zeros((self.height,self.width,c))
-        if is_color:
-            num_imgs = int(c / 3)
-            for frame_id in range(num_imgs):
-                cur_img = clips[:,:,frame_id*3:frame_id*3+3]
-                crop_img = cur_img[h_off:h_off+crop_height, w_off:w_off+crop_width, :]
-                scaled_clips[:,:,frame_id*3:frame_id*3+3] = cv2.resize(crop_img, (self.width, self.height), self.interpolation)
-            if not selectedRegionOutput:
-                return scaled_clips
-            else:
-                return scaled_clips, off_sel
+    def __call__(self, clips, selectedRegionOutput=False):
+        h, w, c = clips.shape
+        h_off, w_off, crop_height, crop_width, off_sel = self.selectRegion(h, w)
+
+        crop_clips = clips[h_off:h_off+crop_height, w_off:w_off+crop_width, :]
+        scaled_clips = resize_clip(crop_clips, (self.width, self.height), self.interpolation)
+        if not selectedRegionOutput:
+            return scaled_clips
         else:
-            num_imgs = int(c / 1)
-            for frame_id in range(num_imgs):
-                cur_img = clips[:,:,frame_id:frame_id+1]
-                crop_img = cur_img[h_off:h_off+crop_height, w_off:w_off+crop_width, :]
-                scaled_clips[:,:,frame_id:frame_id+1] = np.expand_dims(cv2.resize(crop_img, (self.width, self.height), self.interpolation), axis=2)
-            if not selectedRegionOutput:
-                return scaled_clips
-            else:
-                return scaled_clips, off_sel
+            return scaled_clips, off_sel
 
 
+class MultiScaleCropParameters(MultiScaleCrop):
+    """MultiScaleCrop followed by RandomHorizontalFlip, but only the random
+    choices are made here. Returns the uncropped uint8 clip as a (C x H x W)
+    tensor and the crop parameters [y1, x1, crop_height, crop_width, flip];
+    the crop, flip and normalization run batched in DeviceClipAugmentation.
+    """
+
+    def __call__(self, clips):
+        h, w, c = clips.shape
+        h_off, w_off, crop_height, crop_width, _ = self.selectRegion(h, w)
+        # the fixed offsets are computed for the output size, so a larger
+        # crop can run past the border; MultiScaleCrop's slice truncates it
+        crop_height = min(crop_height, h - h_off)
+        crop_width = min(crop_width, w - w_off)
+        flip = int(random.random() < 0.5)
+        crop_parameters = torch.tensor([h_off, w_off, crop_height, crop_width, flip])
+        return torch.from_numpy(clips.transpose((2, 0, 1))), crop_parameters
+
+class CenterCropParameters(CenterCrop):
+    """CenterCrop counterpart of MultiScaleCropParameters."""
+
+    def __call__(self, clips):
+        h, w, c = clips.shape
+        th, tw = self.size
+        x1 = int(round((w - tw) / 2.))
+        y1 = int(round((h - th) / 2.))
+        crop_parameters = torch.tensor([y1, x1, th, tw, 0])
+        return torch.from_numpy(clips.transpose((2, 0, 1))), crop_parameters
+
+class DeviceClipAugmentation(nn.Module):
+    """Crops, flips, converts to float and normalizes a batch of uint8 clips
+    on the device of the module (GPU, or CPU when there is none), using the
+    crop parameters of MultiScaleCropParameters/CenterCropParameters.
+
+    Crops of the output size are gathered directly; crops of other sizes
+    are resized with one batched bilinear grid_sample. value_range is 255
+    for the ToTensor models and 1 for the ToTensor2 models.
+    Input:  (B x C x H x W) uint8 clips, (B x 5) crop parameters
+    Output: (B x C x size[0] x size[1]) float clips
+    """
+
+    def __init__(self, size, mean, std, value_range=255.0):
+        super(DeviceClipAugmentation, self).__init__()
+        self.height = size[0]
+        self.width = size[1]
+        self.value_range = value_range
+        self.register_buffer('mean', torch.tensor(mean).view(1,-1,1,1).float())
+        self.register_buffer('std', torch.tensor(std).view(1,-1,1,1).float())
+
+    def forward(self, clips, crop_parameters):
+        device = self.mean.device
+        clips = clips.to(device, non_blocking=True)
+        crop_parameters = crop_parameters.to(device, non_blocking=True)
+        batch_size, c, h, w = clips.shape
+        h_off, w_off, crop_height, crop_width, flip = crop_parameters.unbind(1)
+        flip = flip.bool()
+
+        if bool(((crop_height == self.height) & (crop_width == self.width)).all()):
+            rows = h_off.view(-1,1) + torch.arange(self.height, device=device)
+            cols = w_off.view(-1,1) + torch.arange(self.width, device=device)
+            cols = torch.where(flip.view(-1,1), cols.flip(1), cols)
+            batch_index = torch.arange(batch_size, device=device).view(-1,1,1)
+            # (B x height x width x C) after advanced indexing
+            clips = clips[batch_index, :, rows.view(batch_size,-1,1), cols.view(batch_size,1,-1)]
+            clips = clips.permute(0,3,1,2).contiguous().float()
+        else:
+            theta = torch.zeros(batch_size, 2, 3, device=device)
+            x_scale = crop_width.float() / w
+            theta[:,0,0] = torch.where(flip, -x_scale, x_scale)
+            theta[:,0,2] = (2 * w_off + crop_width).float() / w - 1
+            theta[:,1,1] = crop_height.float() / h
+            theta[:,1,2] = (2 * h_off + crop_height).float() / h - 1
+            grid = F.affine_grid(theta, (batch_size, c, self.height, self.width), align_corners=False)
+            # clamp to the centers of the border pixels of each crop, which is
+            # how cv2.resize treats the border of the cropped image
+            low = torch.stack([(2 * w_off + 1).float() / w - 1, (2 * h_off + 1).float() / h - 1], 1)
+            high = torch.stack([(2 * (w_off + crop_width) - 1).float() / w - 1,
+                                (2 * (h_off + crop_height) - 1).float() / h - 1], 1)
+            grid = torch.max(torch.min(grid, high.view(-1,1,1,2)), low.view(-1,1,1,2))
+            clips = F.grid_sample(clips.float(), grid, mode='bilinear', padding_mode='border',
+                                  align_corners=False)
+        return (clips / self.value_range - self.mean) / self.std
+
 class MultiScaleFixedCrop(object):
 
     def __init__(self, size, interpolation=cv2.INTER_LINEAR):
@@ -543,35 +594,58 @@ class pose_one_hot_decoding(object):
         return poses
     
 class pose_one_hot_decoding2(object):
-    def __init__(self,length):
+    """Encodes the raw poses of a clip (people x 25 x 2 x length, x and y in
+    [0, 1], NaN for a missing joint) as a grid of 32 x 32 position bins per
+    frame: a length x 1024 float tensor with a 1 in the bins of the joints
+    of the frame. Joints outside the grid are left out.
+
+    With sparse=True the grid is given by its bins instead, a length x
+    joints long tensor with the distinct bin ids of every frame, padded with
+    1024. poseRaw2_bert7 looks them up in its embedding, and
+    pose_one_hot_from_bins turns them back into the grid.
+    """
+    def __init__(self,length, sparse=False):
         self.space = 1/32
         self.bin_number = int((1/self.space))
         self.number_of_people = 1
         self.total_bins = self.number_of_people * 25
         self.one_hot_vector_length = self.bin_number ** 2
-        self.one_hot = np.zeros(self.one_hot_vector_length)
         self.length = length
-        self.position_matrix = np.zeros([self.bin_number + 1, self.bin_number + 1, self.length])
-    def __call__(self, poses):
+        self.sparse = sparse
+
+    def bins(self, poses):
+        """length x joints bin ids of the joints, one_hot_vector_length for
+        the joints outside the grid, and whether each joint is inside.
+        """
         poses = poses.reshape(-1,2,self.length)
         dim1 = np.floor(poses[:,0,:] / self.space)
         dim2 = np.floor(poses[:,1,:] / self.space)
-        dim1[np.isnan(dim1)] = self.bin_number
-        dim2[np.isnan(dim2)] = self.bin_number
-        dim1 = dim1.astype(np.int)
-        dim2 = dim2.astype(np.int)
-        for i in range(self.length):
-            try:
-                self.position_matrix[dim1[:,i], dim2[:,i], i] = 1
-            except:
-                print('hasdasd')
-        one_hot_encoding = self.position_matrix[:self.bin_number, :self.bin_number, :]
-        one_hot_encoding = one_hot_encoding.reshape(-1,self.length)
-        one_hot_encoding_torch = torch.from_numpy(one_hot_encoding.transpose((1,0))).float()
-        
-        
-        return one_hot_encoding_torch
-        
+        # NaN compares False, so missing joints are outside
+        inside = (dim1 >= 0) & (dim1 < self.bin_number) & (dim2 >= 0) & (dim2 < self.bin_number)
+        bin_ids = np.where(inside, dim1 * self.bin_number + dim2, self.one_hot_vector_length)
+        return bin_ids.astype(np.int64).T, inside.T
+
+    def __call__(self, poses):
+        bin_ids, inside = self.bins(poses)
+        if self.sparse:
+            bin_ids.sort(axis=1)
+            duplicate = bin_ids[:, 1:] == bin_ids[:, :-1]
+            bin_ids[:, 1:][duplicate] = self.one_hot_vector_length
+            return torch.from_numpy(bin_ids)
+        frames, joints = np.nonzero(inside)
+        one_hot_encoding = np.zeros((self.length, self.one_hot_vector_length), dtype=np.float32)
+        one_hot_encoding[frames, bin_ids[frames, joints]] = 1
+        return torch.from_numpy(one_hot_encoding)
+
+
+def pose_one_hot_from_bins(bin_ids, one_hot_vector_length=1024):
+    """The one-hot grids (... x one_hot_vector_length float tensor) of the
+    sparse output of pose_one_hot_decoding2 (... x joints), on its device.
+    """
+    one_hot = bin_ids.new_zeros(bin_ids.shape[:-1] + (one_hot_vector_length + 1,), dtype=torch.float)
+    one_hot.scatter_(-1, bin_ids, 1)
+    return one_hot[..., :one_hot_vector_length]
+
 class ToTensorPose(object):
 
     def __call__(self, clips):